@@ -1,42 +1,213 @@
+"""
+Incremental enrolment builder.
+
+Builds the gallery (see gallery_file.py) from the photos in images/faces.
+A manifest keeps the size, mtime, sha1 and encoding of every photo, so a
+run only encodes photos that were added or changed. Photos that were
+deleted are dropped. The work is spread over a process pool, and every
+finished photo is appended to the manifest right away, so an interrupted
+run resumes where it stopped.
+
+Photos without a face are reported and skipped. Photos with several faces
+are reported, and the largest face is enrolled. The kiosk's thumbnail atlas
+(see render_assets.py) is brought up to date at the end.
+
+    python EncodeGenerator.py            # incremental
+    python EncodeGenerator.py --full     # re-encode everything
+    python EncodeGenerator.py --workers 2
+"""
 import os
+import sys
+import json
+import time
+import base64
+import hashlib
+import argparse
+import multiprocessing
 
 import cv2
 import face_recognition
-import pickle
+import numpy as np
+
+from gallery_file import save_enrolment, Gallery, GALLERY_PATH, GALLERY_DB
+from render_assets import build_atlas, ATLAS_PATH
 
-# Importing the Student images
 folderPath = r'images/faces'
-PathList = os.listdir(folderPath)
-imgList = []
-studentIds = []
-print(PathList)
+MANIFEST_PATH = os.environ.get('FACE_MANIFEST', 'images/faces.manifest.jsonl')
+ENROL_WORKERS = int(os.environ.get('FACE_ENROL_WORKERS', '0')) or (os.cpu_count() or 1)
+# Photos are shrunk to this longest side for detection (phone photos are often 4000px+)
+DETECT_MAX_SIDE = 1024
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
 
-for path in PathList:
-    imgList.append(cv2.imread(os.path.join(folderPath, path)))
-    studentIds.append(path.split('.')[0])
 
-    filename = f'{folderPath}/{path}'
+def file_sha1(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
 
-print(studentIds)
 
+def _pack(encoding) -> str:
+    return base64.b64encode(np.asarray(encoding, dtype=np.float32).tobytes()).decode('ascii')
 
-def find_encodings(images_list):
-    encode_list = []
-    for img in images_list:
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        encode = face_recognition.face_encodings(img)[0]
-        encode_list.append(encode)
 
-    return encode_list
+def _unpack(text: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(text), dtype=np.float32)
 
 
-if __name__ == '__main__':
-    print("Encoding Started...")
-    encode_list_known = find_encodings(imgList)
-    encode_list_known_with_ids = [encode_list_known, studentIds]
-    print(f"Encoding complete.")
+def load_manifest(path: str = MANIFEST_PATH) -> dict:
+    """file name -> entry; later lines win, so the journal can be appended to while encoding."""
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A line cut short by an interruption; that photo is simply encoded again
+                continue
+            if entry.get('deleted'):
+                entries.pop(entry['file'], None)
+            else:
+                entries[entry['file']] = entry
+    return entries
+
+
+def write_manifest(entries: dict, path: str = MANIFEST_PATH):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        for name in sorted(entries):
+            f.write(json.dumps(entries[name]) + '\n')
+    os.replace(tmp, path)
+
+
+def encode_photo(job):
+    """Worker: (file, full_path, size, mtime, sha1) -> manifest entry."""
+    name, full_path, size, mtime, sha1 = job
+    entry = {'file': name, 'size': size, 'mtime': mtime, 'sha1': sha1, 'faces': 0}
+    start = time.perf_counter()
+    img = cv2.imread(full_path)
+    if img is None:
+        entry['status'] = 'unreadable'
+        return entry
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    scale = min(1.0, DETECT_MAX_SIDE / float(max(img.shape[:2])))
+    small = img if scale == 1.0 else cv2.resize(img, (0, 0), None, scale, scale, interpolation=cv2.INTER_AREA)
+    boxes = face_recognition.face_locations(small)
+    entry['faces'] = len(boxes)
+    if not boxes:
+        entry['status'] = 'no_face'
+        return entry
+    # Several faces: enrol the largest one (the subject), but report it
+    t, r, b, l = max(boxes, key=lambda f: (f[2] - f[0]) * (f[1] - f[3]))
+    box = tuple(int(round(v / scale)) for v in (t, r, b, l))
+    encodings = face_recognition.face_encodings(img, [box])
+    if not encodings:
+        entry['status'] = 'no_face'
+        return entry
+    entry['status'] = 'ok' if len(boxes) == 1 else 'multiple_faces'
+    entry['encoding'] = _pack(encodings[0])
+    entry['seconds'] = round(time.perf_counter() - start, 3)
+    return entry
 
-    with open('images/encoded_file.p', 'wb') as f:
-        pickle.dump(encode_list_known_with_ids, f)
 
-    print('Encoding file saved')
+def scan_photos(folder: str = folderPath) -> dict:
+    """file name -> (full path, size, mtime) for every image in `folder`."""
+    photos = {}
+    for name in sorted(os.listdir(folder)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        full_path = os.path.join(folder, name)
+        st = os.stat(full_path)
+        photos[name] = (full_path, st.st_size, st.st_mtime)
+    return photos
+
+
+def build_gallery(folder: str = folderPath, manifest_path: str = MANIFEST_PATH, gallery_path: str = GALLERY_PATH,
+                  workers: int = ENROL_WORKERS, full: bool = False):
+    photos = scan_photos(folder)
+    manifest = {} if full else load_manifest(manifest_path)
+
+    # Unchanged size+mtime: reuse. Otherwise hash, and only re-encode if the content changed.
+    jobs = []
+    for name, (full_path, size, mtime) in photos.items():
+        entry = manifest.get(name)
+        if entry is not None and entry['size'] == size and entry['mtime'] == mtime:
+            continue
+        sha1 = file_sha1(full_path)
+        if entry is not None and entry['sha1'] == sha1:
+            entry.update(size=size, mtime=mtime)
+            continue
+        jobs.append((name, full_path, size, mtime, sha1))
+    removed = [name for name in manifest if name not in photos]
+    for name in removed:
+        del manifest[name]
+    print(f"{len(photos)} photos: {len(jobs)} to encode, {len(photos) - len(jobs)} unchanged, {len(removed)} removed")
+
+    if jobs:
+        start = time.perf_counter()
+        # Finished photos go to the manifest journal immediately, so an interrupted run can resume
+        with open(manifest_path, 'a') as journal:
+            pool = multiprocessing.Pool(max(1, min(workers, len(jobs)))) if workers > 1 and len(jobs) > 1 else None
+            try:
+                results = pool.imap_unordered(encode_photo, jobs) if pool is not None else map(encode_photo, jobs)
+                for done, entry in enumerate(results, 1):
+                    manifest[entry['file']] = entry
+                    journal.write(json.dumps(entry) + '\n')
+                    journal.flush()
+                    rate = done / (time.perf_counter() - start)
+                    eta = (len(jobs) - done) / rate if rate else 0.0
+                    print(f"[{done}/{len(jobs)}] {entry['file']}: {entry['status']} ({rate:.1f}/s, eta {eta:.0f}s)")
+            except BaseException:
+                if pool is not None:
+                    pool.terminate()
+                raise
+            if pool is not None:
+                pool.close()
+                pool.join()
+    # Compact the journal: one line per current photo
+    write_manifest(manifest, manifest_path)
+
+    problems = [e for e in manifest.values() if e['status'] != 'ok']
+    if problems:
+        print("Photos that need attention:")
+        for e in sorted(problems, key=lambda e: e['file']):
+            detail = {'no_face': 'no face found, not enrolled',
+                      'multiple_faces': f"{e['faces']} faces, enrolled the largest",
+                      'unreadable': 'could not be read, not enrolled'}.get(e['status'], e['status'])
+            print(f"  {e['file']}: {detail}")
+
+    enrolled = [manifest[name] for name in sorted(manifest) if 'encoding' in manifest[name]]
+    encodings = np.vstack([_unpack(e['encoding']) for e in enrolled]) if enrolled else np.zeros((0, 128), np.float32)
+    studentIds = [os.path.splitext(e['file'])[0] for e in enrolled]
+    meta = [{'source': os.path.join(folder, e['file']), 'sha1': e['sha1']} for e in enrolled]
+    # Registrations already compacted into the matrix are kept; the journal lock keeps out a compaction
+    gallery = save_enrolment(encodings, studentIds, gallery_path, meta)
+    print(f"Encoding file saved to {gallery_path}.json: {gallery.describe()}")
+    if GALLERY_DB:
+        from gallery_db import GalleryDB
+        with GalleryDB(GALLERY_DB) as db:
+            # Only this run's rows: registrations reach the database through register_face.py
+            count = db.replace_source(Gallery(encodings, studentIds, meta))
+        print(f"Replaced the enrolment templates in {GALLERY_DB}: {count}")
+    if ATLAS_PATH:
+        # Display thumbnails for the kiosk, so it never decodes a JPEG per frame
+        try:
+            build_atlas(folder, ATLAS_PATH, full=full)
+        except OSError as e:
+            print(f"Could not update the thumbnail atlas {ATLAS_PATH}: {e}")
+    return gallery
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--full', action='store_true', help='ignore the manifest and re-encode every photo')
+    parser.add_argument('--workers', type=int, default=ENROL_WORKERS)
+    parser.add_argument('--folder', default=folderPath)
+    args = parser.parse_args()
+    if not os.path.isdir(args.folder):
+        sys.exit(f"ERROR: Folder '{args.folder}' does not exist!")
+    print("Encoding Started...")
+    build_gallery(args.folder, workers=args.workers, full=args.full)
@@ -9,6 +9,12 @@ import numpy as np
 from PyQt5.QtCore import pyqtSignal, QObject, QThread
 from PyQt5.QtGui import QImage
 
+from frame_capture import LatestFrameCapture
+from face_matcher import FaceMatcher
+from render_assets import RenderAssetCache
+from face_detector import make_detector
+from gallery_file import load_gallery
+
 
 def encode_pickle(payload: str, file: str):
     data = []
@@ -24,26 +30,30 @@ class FaceRecognitionThread(QThread):
     name_signal = pyqtSignal(str)
     image_signal = pyqtSignal(QImage)
 
-    def __init__(self, camera_url=0):
+    def __init__(self, camera_url=0, detector=None):
         super(FaceRecognitionThread, self).__init__()
         self.stop_event = threading.Event()
         self.url = camera_url
+        # Any callable frame -> [(top, right, bottom, left)]; defaults to FACE_DETECTOR
+        self.detector = detector if detector is not None else make_detector()
 
     def run(self) -> None:
         print("Loading Encoder File")
-        with open('images/encoded_file.p', 'rb') as f:
-            encode_list_known_with_ids = pickle.load(f)
-
-        encode_list_known, faceIds = encode_list_known_with_ids
+        gallery = load_gallery()
+        encode_list_known, faceIds = gallery.encodings, gallery.names
         print("Loaded Encoder File.")
 
-        known_faces = faceIds
-        known_encodings = encode_list_known
+        # compare_faces' default tolerance
+        matcher = FaceMatcher(encode_list_known, faceIds, tolerance=0.6)
+
+        # Avatar and student photos are read once, not on every frame
+        avatar = cv2.imread(r'Resources/avatar.png')
+        assets = RenderAssetCache(photo_dir='images', photo_size=None, atlas_path='')
 
-        cap = cv2.VideoCapture(self.url)
+        cap = LatestFrameCapture(self.url).start()
 
         while not self.stop_event.is_set():
-            # Read Frames
+            # Newest frame from the capture thread (stale frames are dropped)
             _, frame = cap.read()
 
             if frame is None:
@@ -52,35 +62,31 @@ class FaceRecognitionThread(QThread):
             print(frame.shape)
             frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
 
-            face_locations = face_recognition.face_locations(frame)
+            face_locations = self.detector(frame)
             face_current_encodings = face_recognition.face_encodings(frame, face_locations)
 
             student_name = "Unknown"
             # Default avatar if no face or unknown
-            image_student = cv2.imread(r'Resources/avatar.png') 
+            image_student = avatar
             
             if not face_locations:
                  # If no face detected, we still might want to show the camera feed
                  pass
 
-            for face_location, face_encoding in zip(face_locations, face_current_encodings):
-                # Compare face encodings with known encodings
-                matches = face_recognition.compare_faces(known_encodings, face_encoding)
-                face_distance = face_recognition.face_distance(known_encodings, face_encoding)
-
-                match_index = np.argmin(face_distance)
-
-                if matches[match_index]:
-                    print(f"Known face detected: {known_faces[match_index]}")
-                    # Check if file exists before reading
-                    img_path = f'images/{known_faces[match_index]}.jpg'
-                    if os.path.exists(img_path):
-                        image_student = cv2.imread(img_path)
+            # Compare all face encodings with known encodings in one pass
+            # identify() returns names: with FACE_MATCH_AGGREGATE=centroid the matcher has one row per person
+            for face_location, (person, _) in zip(face_locations, matcher.identify(face_current_encodings)):
+                if person is not None:
+                    print(f"Known face detected: {person}")
+                    # Cached photo (None if the file does not exist)
+                    photo = assets.photo(person)
+                    if photo is not None:
+                        image_student = photo
                     
-                    student_name = known_faces[match_index]
+                    student_name = person
                     y1, x2, y2, x1 = face_location
                     cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2, cv2.LINE_AA)
-                    cv2.putText(frame, known_faces[match_index], (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX,
+                    cv2.putText(frame, person, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX,
                                 0.9, (0, 255, 0), 2)
                     cv2.putText(frame, "Listening...", (0, 0), cv2.FONT_HERSHEY_SIMPLEX,
                                 0.5, (0, 255, 0), 1)
@@ -111,6 +117,8 @@ class FaceRecognitionThread(QThread):
             self.frame_signal.emit(q_image)
             self.name_signal.emit(student_name)
 
+        cap.release()
+
     def stop(self):
         self.stop_event.set()
 
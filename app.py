@@ -1,5 +1,4 @@
 import os
-import pickle
 from datetime import datetime
 import sys
 import threading
@@ -11,22 +10,22 @@ import numpy as np
 import cvzone
 import face_recognition
 
+from frame_capture import LatestFrameCapture
+from face_matcher import FaceMatcher
+from render_assets import RenderAssetCache
+from gallery_file import load_gallery
+
 from speech_api import speech_to_text_task, listen_tag
 from speaker import speak, is_speaking
 
 imgBackground = cv2.imread('Resources/background.png')
+# Mode images and resized student photos, loaded once instead of every frame
+# The enrolment atlas is built from images/faces, not from these photos
+assets = RenderAssetCache(photo_dir='images', atlas_path='')
 
 def import_modes() -> list:
-    # Importing the mode images to a list
-    folderModePath = 'Resources/Modes'
-    modePathList = os.listdir(folderModePath)
-    imgModeList = []
-
-    # print(modePathList)
-    for path in sorted(modePathList):
-        imgModeList.append(cv2.imread(os.path.join(folderModePath, path)))
-
-    return imgModeList
+    # Mode images are read from disk on first use only
+    return assets.modes
 
 
 def import_listen_image(id: str):
@@ -35,9 +34,8 @@ def import_listen_image(id: str):
 
 def import_encodings():
     print('Reading Encoding Files..')
-    with open(r'encoded_file.p', 'rb') as fp:
-        encode_list_known_with_ids = pickle.load(fp)
-    encode_list_known, studentNames = encode_list_known_with_ids
+    gallery = load_gallery()
+    encode_list_known, studentNames = gallery.encodings, gallery.names
     print("Loaded Encoding File.")
     return encode_list_known, studentNames
 
@@ -56,7 +54,7 @@ def mark_faces(face_location, backgroundImage, success: bool):
 
 
 def update_mode(backgroundImage, modeType):
-    modeImage = import_modes()[modeType]
+    modeImage = assets.mode(modeType)
     backgroundImage[44:44 + 633, 808:808 + 414] = modeImage
     return backgroundImage
 
@@ -72,7 +70,7 @@ def update_student_details(studentImage, studentName, backgroundImage):
 
 
 def load_face_image(id: str):
-    return cv2.imread(f'images/{id}.jpg')
+    return assets.photo(id)
 
 
 def main_task():
@@ -84,11 +82,12 @@ def main_task():
     previous_id = None
     listener_task_flag = 0
     speaker_task_timer = time.time() - 20
-    cap = cv2.VideoCapture(0)
+    cap = LatestFrameCapture(0).start()
 
     imgModeList = import_modes()
     mode_type = 0
     encode_list_known, studentNames = import_encodings()
+    matcher = FaceMatcher(encode_list_known, studentNames, tolerance=0.5)
 
     listen_tag_image = import_listen_image(1)
     listen_off_image = import_listen_image(0)
@@ -104,17 +103,14 @@ def main_task():
             except Exception as e:
                 print(f'Cant Start Listening Task -> {e}')
         
-        if not cap.isOpened():
-            cap.release()
-            sleep(1)
-            cap = cv2.VideoCapture(0)
-            continue
-
+        # The capture thread reconnects on camera errors; we only stop when a file source ends
         _, img = cap.read()
 
         if not _:
-            print('[OpenCV] Error: Cap object error')
-            break
+            if cap.finished:
+                break
+            print('[OpenCV] Error: no frame from camera, waiting...')
+            continue
 
         imgS = cv2.resize(img, (0, 0), None, 0.25, 0.25)
         imgS = cv2.cvtColor(imgS, cv2.COLOR_BGR2RGB)
@@ -132,18 +128,13 @@ def main_task():
             imgBackground[1:1+51, 900:900+229] = 255
 
         if face_current_frame:
-            for encodeFace, faceLoc in zip(encode_current_frame, face_current_frame):
-                matches = face_recognition.compare_faces(encode_list_known, encodeFace, tolerance=0.5)
-                face_distance = face_recognition.face_distance(encode_list_known, encodeFace)
-                # print(f'Matches: {matches}')
+            # One distance pass for every face in the frame
+            # identify() returns names: with FACE_MATCH_AGGREGATE=centroid the matcher has one row per person
+            for faceLoc, (name, face_distance) in zip(face_current_frame, matcher.identify(encode_current_frame)):
                 # print(f'Face Distance: {face_distance}')
-
-                match_index = np.argmin(face_distance)
-                # print("Match Index: ", match_index)
-                if matches[match_index]:
-                    # print(f"Known Face Detected: {studentNames[match_index]}")
+                if name is not None:
+                    # print(f"Known Face Detected: {name}")
                     mode_type = 1
-                    name = studentNames[match_index]
                     # Update Student details 
                     studentImage = load_face_image(name)
                     imgBackground = mark_faces(faceLoc, imgBackground, 1)
@@ -0,0 +1,123 @@
+"""
+Recall-versus-latency benchmark for the face detector backends.
+
+Runs every backend on the same frames (a recorded video or a synthetic clip
+of enrolled photos, see bench_pipeline.py), at the detection scale used by
+main.py:
+
+    python bench_detectors.py --video hallway.mp4 --labels hallway.csv
+    python bench_detectors.py --synthetic 300 --backends hog cascade cascade:noconfirm --cascade lbp
+
+"hog recall" is the fraction of pure-HOG boxes the backend also found
+(IoU >= 0.3). "extra" counts boxes HOG did not find. On synthetic clips,
+"label recall" is the fraction of pasted photos that got a box of their own
+(box centre inside the photo, one box per photo). A labels file only gives
+the names per frame, so for videos "label count" is min(boxes, labelled
+faces) summed over frames and divided by the labelled faces: an upper bound
+on recall that does not check where the boxes are.
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from bench_pipeline import load_labels, labels_at, video_frames, synthetic_frames
+from face_detector import make_detector, _iou, FACE_CASCADE
+from gallery_file import load_gallery, GALLERY_PATH
+
+
+def build_backend(spec: str, cascade: str):
+    kind, _, option = spec.partition(':')
+    kwargs = {'confirm': False} if option == 'noconfirm' else {}
+    detector = make_detector(kind, cascade, **kwargs)
+    if detector.name != kind:
+        print(f"{spec}: not available, skipped")
+        return None
+    return detector
+
+
+def _matched_rects(rects, boxes) -> int:
+    """Labelled rectangles that get a box of their own, the box centre lying inside the rectangle."""
+    used = set()
+    hits = 0
+    for top, right, bottom, left in rects:
+        for j, (b_top, b_right, b_bottom, b_left) in enumerate(boxes):
+            cy, cx = (b_top + b_bottom) / 2.0, (b_left + b_right) / 2.0
+            if j not in used and top <= cy <= bottom and left <= cx <= right:
+                used.add(j)
+                hits += 1
+                break
+    return hits
+
+
+def run(frames, backends, scale, segments=None, max_frames=0):
+    reference = make_detector('hog')
+    results = {name: {'ms': [], 'found': 0, 'hog_hits': 0, 'extra': 0, 'label_hits': 0, 'label_count': 0}
+               for name in backends}
+    hog_total = label_total = boxed_total = n = 0
+    for i, (frame, expected, *rest) in enumerate(frames):
+        if max_frames and i >= max_frames:
+            break
+        n += 1
+        small = cv2.cvtColor(cv2.resize(frame, (0, 0), None, scale, scale), cv2.COLOR_BGR2RGB)
+        ref_boxes = reference(small)
+        hog_total += len(ref_boxes)
+        if expected is None and segments:
+            expected = labels_at(segments, i)
+        # Pasted photo rectangles at the detection scale (synthetic clips only)
+        rects = [tuple(int(v * scale) for v in rect) for rect in rest[0]] if rest else None
+        if expected is not None:
+            label_total += len(expected)
+        if rects is not None:
+            boxed_total += len(rects)
+        for name, detector in backends.items():
+            start = time.perf_counter()
+            boxes = detector(small)
+            r = results[name]
+            r['ms'].append((time.perf_counter() - start) * 1000.0)
+            r['found'] += len(boxes)
+            hits = sum(1 for ref in ref_boxes if any(_iou(ref, b) >= 0.3 for b in boxes))
+            r['hog_hits'] += hits
+            r['extra'] += sum(1 for b in boxes if not any(_iou(ref, b) >= 0.3 for ref in ref_boxes))
+            if expected is not None:
+                r['label_count'] += min(len(boxes), len(expected))
+            if rects is not None:
+                r['label_hits'] += _matched_rects(rects, boxes)
+
+    print(f"frames={n} scale={scale} hog boxes={hog_total} labelled faces={label_total}")
+    print(f"{'backend':>20} {'p50 ms':>8} {'p95 ms':>8} {'found':>6} {'hog recall':>10} {'extra':>6} "
+          f"{'label recall':>12} {'label count':>11}")
+    for name, r in results.items():
+        ms = np.asarray(r['ms'] or [0.0])
+        hog_recall = r['hog_hits'] / hog_total if hog_total else float('nan')
+        label_recall = r['label_hits'] / boxed_total if boxed_total else float('nan')
+        label_count = r['label_count'] / label_total if label_total else float('nan')
+        print(f"{name:>20} {np.percentile(ms, 50):>8.1f} {np.percentile(ms, 95):>8.1f} {r['found']:>6} "
+              f"{hog_recall:>10.3f} {r['extra']:>6} {label_recall:>12.3f} {label_count:>11.3f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--video', help='recorded video file to replay')
+    source.add_argument('--synthetic', type=int, metavar='FRAMES', help='generate a clip of this many frames')
+    parser.add_argument('--labels', help='labels CSV for --video (frame,name,name,...)')
+    parser.add_argument('--gallery', default=GALLERY_PATH, help='gallery with the enrolled names for --synthetic')
+    parser.add_argument('--photos', default='images/faces', help='enrolled photos for --synthetic')
+    parser.add_argument('--backends', nargs='+', default=['hog', 'cascade', 'cascade:noconfirm'])
+    parser.add_argument('--cascade', default=FACE_CASCADE, help="'haar', 'lbp' or a cascade XML path")
+    parser.add_argument('--scale', type=float, default=0.25)
+    parser.add_argument('--max-frames', type=int, default=0)
+    args = parser.parse_args()
+
+    backends = {}
+    for spec in args.backends:
+        detector = build_backend(spec, args.cascade)
+        if detector is not None:
+            backends[spec] = detector
+    if args.video:
+        frames = video_frames(args.video)
+    else:
+        frames = synthetic_frames(args.photos, load_gallery(args.gallery).names, args.synthetic, boxes=True)
+    run(frames, backends, args.scale, load_labels(args.labels) if args.labels else None, args.max_frames)
@@ -0,0 +1,307 @@
+"""
+Headless benchmark for the face pipeline.
+
+Replays a recorded video, or a synthetic clip made from the enrolled photos,
+through the same detect/encode/match/greet steps as main.py (face_pipeline.py,
+with the same FACE_* flags; the switches below override them). Nothing is
+shown on screen. It reports FPS, per-frame latency percentiles, encodings per
+second, peak RSS and (if labels are available) identity accuracy:
+
+    python bench_pipeline.py --video hallway.mp4 --labels hallway.csv
+    python bench_pipeline.py --synthetic 300 --tracking
+    python bench_pipeline.py --synthetic 300 --gallery-sizes 0 1000 10000 --jsonl bench.jsonl
+
+Frames are read in order with cv2.VideoCapture, not through the dropping
+capture thread, so every run sees the same frames. The greeting cooldown runs
+on video time (frame index / FPS).
+
+Labels file: CSV lines `frame,name,name,...` giving the enrolled people in
+view from that frame on, until the next line. Use a line with only the frame
+number for "nobody". Lines starting with # are ignored.
+
+`--gallery-sizes` pads the enrolled gallery with that many synthetic
+encodings (see bench_gallery_index.py) and repeats the run for each size.
+`--jsonl` appends one result per run, tagged with the git commit, so
+regressions can be tracked across commits.
+"""
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from bench_gallery_index import synthetic_gallery
+from gallery_file import load_gallery, Gallery, GALLERY_PATH
+from face_matcher import RecencyMatcher, FACE_MATCH_TOLERANCE, RECENT_CACHE_SIZE, RECENT_MARGIN
+from face_detector import make_detector
+from face_pipeline import FacePipeline, build_matcher, frame_people, MAX_FACES
+from gallery_partitions import FACE_KIOSK
+from greeter import Greeter
+from pipeline_timing import PipelineTimer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+STAGES = ('resize', 'detect', 'quality', 'encode', 'match', 'greeting')
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    # ru_maxrss is KB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024.0 * 1024.0) if sys.platform == 'darwin' else rss / 1024.0
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def load_labels(path):
+    """Read a labels CSV into a sorted list of (start_frame, set_of_names)."""
+    segments = []
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            if not row or not row[0].strip() or row[0].lstrip().startswith('#'):
+                continue
+            segments.append((int(row[0]), {name.strip() for name in row[1:] if name.strip()}))
+    segments.sort(key=lambda s: s[0])
+    return segments
+
+
+def labels_at(segments, frame_index):
+    current = None
+    for start, names in segments:
+        if start > frame_index:
+            break
+        current = names
+    return current
+
+
+def video_frames(path):
+    """Yield (frame, expected_names_or_None) for every frame of a video file."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise SystemExit(f"Could not open video: {path}")
+    try:
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            yield frame, None
+    finally:
+        cap.release()
+
+
+def synthetic_frames(photo_dir, people, n_frames, max_faces=3, segment=30, size=(640, 480), seed=0, boxes=False):
+    """Yield (frame, expected_names) for a clip of enrolled photos pasted on a plain background.
+
+    The set of people changes every `segment` frames and cycles through 0..max_faces faces,
+    so the clip covers empty frames, single visitors and small groups. Faces drift slowly sideways.
+    With boxes=True, also yields the pasted photo rectangles as (top, right, bottom, left).
+    """
+    rng = np.random.default_rng(seed)
+    photos = {}
+    for person in people:
+        image = cv2.imread(os.path.join(photo_dir, f'{person}.jpg'))
+        if image is not None:
+            photos[person] = image
+    if not photos:
+        raise SystemExit(f"No enrolled photos found in {photo_dir}")
+    names = sorted(photos)
+    w, h = size
+    background = np.full((h, w, 3), 90, dtype=np.uint8)
+    background += rng.integers(0, 20, background.shape, dtype=np.uint8)
+    slot_w = w // max(1, max_faces)
+    for i in range(n_frames):
+        segment_index = i // segment
+        count = min(segment_index % (max_faces + 1), len(names))
+        seg_rng = np.random.default_rng(seed + segment_index)
+        chosen = [names[j] for j in seg_rng.choice(len(names), count, replace=False)]
+        frame = background.copy()
+        rects = []
+        for slot, person in enumerate(chosen):
+            face = photos[person]
+            face_h = min(h // 2, slot_w - 20)
+            face_w = min(slot_w - 10, int(face.shape[1] * face_h / face.shape[0]))
+            face = cv2.resize(face, (face_w, face_h))
+            # Drift within the slot so faces never overlap
+            x = slot * slot_w + 5 + (i % segment) * max(0, slot_w - face_w - 10) // segment
+            y = (h - face_h) // 2
+            frame[y:y + face_h, x:x + face_w] = face
+            rects.append((y, x + face_w, y + face_h, x))
+        yield (frame, set(chosen), rects) if boxes else (frame, set(chosen))
+
+
+def bench_matcher(encodings, names, pad, tolerance, kiosk=FACE_KIOSK, recent_cache=RECENT_CACHE_SIZE,
+                  recent_margin=RECENT_MARGIN):
+    """main.py's matcher stack (build_matcher) over the gallery padded with `pad` synthetic encodings."""
+    if pad:
+        padding = synthetic_gallery(pad, seed=7)
+        encodings = np.vstack([np.asarray(encodings, dtype=np.float32).reshape(-1, 128), padding])
+        names = list(names) + [f'_pad{i:06d}' for i in range(pad)]
+    return build_matcher(Gallery(encodings, names), tolerance, kiosk, recent_cache, recent_margin)
+
+
+def run_once(frames, matcher, args, fps, segments=None):
+    timer = PipelineTimer(enabled=True, interval=float('inf'), name='Bench')
+    # Nothing is written to the attendance file; the greeter only counts what it would say
+    pipeline = FacePipeline(lambda: matcher, detector=make_detector(args.detector) if args.detector else None,
+                            scale=args.scale, max_faces=args.max_faces, tracking=args.tracking,
+                            scheduler=args.scheduler, crowd=args.crowd, encoder_workers=args.encoder_workers,
+                            motion=args.motion_gate, roi=args.roi, quality=args.quality, governor=args.governor,
+                            timer=timer, attendance_file=None)
+    greeter = Greeter(speak=None)
+    tp = fp = fn = exact = labelled = 0
+    n = 0
+    start = time.perf_counter()
+    try:
+        for i, (frame, expected) in enumerate(frames):
+            if args.max_frames and i >= args.max_frames:
+                break
+            frame_start = time.perf_counter()
+            timer.begin_frame()
+            now = i / fps
+            faces = pipeline.process(frame, now=now)
+            shown, known, primary = frame_people(faces)
+            if shown:
+                pipeline.greet(greeter, None, shown[0], known, primary, now=now)
+            timer.lap('greeting')
+            pipeline.end_frame((time.perf_counter() - frame_start) * 1000.0)
+            timer.end_frame()
+            n += 1
+            if expected is None and segments:
+                expected = labels_at(segments, i)
+            if expected is not None:
+                predicted = {person for _, person, _ in faces if person is not None}
+                tp += len(predicted & expected)
+                fp += len(predicted - expected)
+                fn += len(expected - predicted)
+                exact += predicted == expected
+                labelled += 1
+    finally:
+        components = dict(pipeline.summaries())
+        switches = {'tracking': pipeline.tracker is not None, 'scheduler': pipeline.scheduler is not None,
+                    'crowd': pipeline.crowd is not None, 'encoder_pool': pipeline.encoder_pool is not None,
+                    'roi': pipeline.roi_detector is not None, 'motion_gate': pipeline.motion_gate is not None,
+                    'quality_gate': pipeline.quality_gate is not None, 'governor': pipeline.governor is not None,
+                    'detector': pipeline.detector.name}
+        pipeline.close()
+    elapsed = time.perf_counter() - start
+
+    snapshot = timer.snapshot()['stages']
+    frame_stats = snapshot.get('frame', {})
+    result = {
+        'frames': n,
+        'fps': n / elapsed if elapsed else 0.0,
+        'frame_ms': {k: frame_stats.get(k, 0.0) for k in ('p50', 'p95', 'p99')},
+        'stage_p50_ms': {s: snapshot[s]['p50'] for s in STAGES if s in snapshot},
+        'encodings': pipeline.encodings,
+        'enc_per_s': pipeline.encodings / elapsed if elapsed else 0.0,
+        'greetings': greeter.greetings,
+        'peak_rss_mb': peak_rss_mb(),
+        'switches': switches,
+        'components': components,
+    }
+    if labelled:
+        result['accuracy'] = {
+            'precision': tp / (tp + fp) if tp + fp else 1.0,
+            'recall': tp / (tp + fn) if tp + fn else 1.0,
+            'exact_frames': exact / labelled,
+        }
+    if pipeline.tracker is not None:
+        result['tracker'] = pipeline.tracker.summary()
+    if pipeline.quality_gate is not None:
+        result['quality'] = dict(pipeline.quality_gate.stats, rejected_by=dict(pipeline.quality_gate.rejected_by))
+    if isinstance(matcher, RecencyMatcher):
+        result['recent_cache'] = matcher.summary()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--video', help='recorded video file to replay')
+    source.add_argument('--synthetic', type=int, metavar='FRAMES', help='generate a clip of this many frames')
+    parser.add_argument('--labels', help='labels CSV for --video (frame,name,name,...)')
+    parser.add_argument('--gallery', default=GALLERY_PATH, help='gallery path without extension')
+    parser.add_argument('--photos', default='images/faces', help='enrolled photos for --synthetic')
+    parser.add_argument('--gallery-sizes', type=int, nargs='+', default=[0],
+                        help='synthetic encodings added to the gallery, one run per value')
+    parser.add_argument('--fps', type=float, default=None, help='video time base (default: from the file, or 10)')
+    parser.add_argument('--scale', type=float, default=0.25)
+    parser.add_argument('--max-faces', type=int, default=MAX_FACES)
+    parser.add_argument('--max-frames', type=int, default=0)
+    parser.add_argument('--tolerance', type=float, default=FACE_MATCH_TOLERANCE)
+    # Unset switches follow their FACE_* flag, as in main.py
+    parser.add_argument('--tracking', action='store_true', default=None, help='detect-then-track (FACE_TRACKING=1)')
+    parser.add_argument('--scheduler', action='store_true', default=None, help='encode scheduler (FACE_SCHEDULER=1)')
+    parser.add_argument('--crowd', action='store_true', default=None, help='crowd mode (FACE_CROWD_MODE=1)')
+    parser.add_argument('--encoder-workers', type=int, default=None, help='encoder processes (FACE_ENCODER_WORKERS)')
+    parser.add_argument('--roi', action='store_true', default=None, help='two-tier ROI detection (FACE_ROI_DETECT=1)')
+    parser.add_argument('--motion-gate', action='store_true', default=None, help='motion gate (FACE_MOTION_GATE=1)')
+    parser.add_argument('--quality', action='store_true', default=None, help='face quality gate (FACE_QUALITY_GATE=1)')
+    parser.add_argument('--governor', action='store_true', default=None, help='frame governor (FACE_GOVERNOR=1)')
+    parser.add_argument('--detector', default=None, help='face detector backend: hog or cascade (FACE_DETECTOR)')
+    parser.add_argument('--kiosk', default=FACE_KIOSK, help='search this kiosk\'s partitions first (FACE_KIOSK)')
+    parser.add_argument('--recent-cache', type=int, default=RECENT_CACHE_SIZE,
+                        help='recently matched people checked first (FACE_RECENT_CACHE)')
+    parser.add_argument('--recent-margin', type=float, default=RECENT_MARGIN)
+    parser.add_argument('--jsonl', help='append one JSON result per run to this file')
+    args = parser.parse_args()
+
+    gallery = load_gallery(args.gallery)
+    encodings, names = gallery.encodings, gallery.names
+    segments = load_labels(args.labels) if args.labels else None
+
+    fps = args.fps
+    if fps is None:
+        fps = 10.0
+        if args.video:
+            cap = cv2.VideoCapture(args.video)
+            fps = cap.get(cv2.CAP_PROP_FPS) or fps
+            cap.release()
+
+    commit = git_commit()
+    print(f"source={args.video or f'synthetic:{args.synthetic}'} enrolled={len(names)} "
+          f"tolerance={args.tolerance} scale={args.scale} commit={commit}")
+    print(f"{'gallery':>8} {'frames':>7} {'fps':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'enc/s':>7} {'rss MB':>7} {'precision':>9} {'recall':>7}")
+    for pad in args.gallery_sizes:
+        matcher = bench_matcher(encodings, names, pad, args.tolerance, args.kiosk, args.recent_cache, args.recent_margin)
+        if args.video:
+            frames = video_frames(args.video)
+        else:
+            frames = synthetic_frames(args.photos, names, args.synthetic, max_faces=min(3, args.max_faces))
+        result = run_once(frames, matcher, args, fps, segments)
+        acc = result.get('accuracy', {})
+        rss = result['peak_rss_mb']
+        print(f"{len(matcher):>8} {result['frames']:>7} {result['fps']:>7.2f} "
+              f"{result['frame_ms']['p50']:>8.1f} {result['frame_ms']['p95']:>8.1f} {result['frame_ms']['p99']:>8.1f} "
+              f"{result['enc_per_s']:>7.1f} {rss if rss is not None else float('nan'):>7.0f} "
+              f"{acc.get('precision', float('nan')):>9.3f} {acc.get('recall', float('nan')):>7.3f}")
+        print("         stage p50 ms: " + ' '.join(f"{s}={v:.1f}" for s, v in result['stage_p50_ms'].items()))
+        print("         switches: " + ' '.join(f"{k}={v}" for k, v in result['switches'].items()))
+        for component, summary in result['components'].items():
+            print(f"         {component}: {summary}")
+        if args.jsonl:
+            record = dict(result, gallery=len(matcher), padding=pad, commit=commit, time=time.time(),
+                          source=args.video or f'synthetic:{args.synthetic}', scale=args.scale)
+            with open(args.jsonl, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Accuracy and speed report for the quantized gallery (FACE_INDEX_DTYPE).
+
+Every storage type is compared against a float64 brute-force baseline at
+FACE_MATCH_TOLERANCE. The baseline uses the same gallery, so only the
+quantization differs:
+
+    python bench_quantized.py
+    python bench_quantized.py --sizes 1000 10000 50000 --queries 1000
+    python bench_quantized.py --gallery images/gallery     # the enrolled gallery
+
+"changed" counts queries whose decision differs from float64 (a different
+identity, or matched versus unmatched). "max |dd|" is the largest distance
+error. "near tol" counts baseline distances within 0.01 of the tolerance,
+where a flip is most likely. "MB" is the memory of the stored gallery and
+"ms/frame" the search time for a 4-face frame.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from bench_gallery_index import synthetic_gallery, synthetic_queries
+from face_matcher import FACE_MATCH_TOLERANCE
+from gallery_index import BruteForceIndex, QuantizedIndex
+
+
+def float64_search(gallery: np.ndarray, queries: np.ndarray, chunk: int = 64):
+    g = np.asarray(gallery, dtype=np.float64)
+    g_sq = np.einsum('ij,ij->i', g, g)
+    best, best_dist = [], []
+    for start in range(0, len(queries), chunk):
+        q = np.asarray(queries[start:start + chunk], dtype=np.float64)
+        d = np.sqrt(np.maximum(np.einsum('ij,ij->i', q, q)[:, None] + g_sq[None, :] - 2.0 * (q @ g.T), 0.0))
+        i = np.argmin(d, axis=1)
+        best.append(i)
+        best_dist.append(d[np.arange(len(q)), i])
+    return np.concatenate(best), np.concatenate(best_dist)
+
+
+def _timed_search(index, queries, tolerance, batch: int = 4):
+    start = time.perf_counter()
+    idx, dist = [], []
+    for i in range(0, len(queries), batch):
+        b_idx, b_dist = index.search(queries[i:i + batch], tolerance)
+        idx.append(b_idx)
+        dist.append(b_dist)
+    ms = (time.perf_counter() - start) * 1000.0 / max(1, len(queries) / batch)
+    return np.concatenate(idx), np.concatenate(dist), ms
+
+
+def _decisions(idx, dist, names, tolerance):
+    return [names[i] if d <= tolerance else None for i, d in zip(idx, dist)]
+
+
+def run(gallery: np.ndarray, names, queries: np.ndarray, tolerance: float, label: str):
+    ref_idx, ref_dist = float64_search(gallery, queries)
+    reference = _decisions(ref_idx, ref_dist, names, tolerance)
+    near = int(np.sum(np.abs(ref_dist - tolerance) < 0.01))
+    matched = sum(r is not None for r in reference)
+    print(f"{label}: {len(gallery)} templates, {len(queries)} queries, {matched} matched by float64, "
+          f"{near} near tolerance {tolerance}")
+    print(f"{'dtype':>8} {'MB':>8} {'ms/frame':>9} {'changed':>8} {'max |dd|':>9}")
+    for dtype in ('float32', 'float16', 'int8'):
+        if dtype == 'float32':
+            index = BruteForceIndex(gallery)
+            nbytes = index.gallery.nbytes + index._sq_norms.nbytes
+        else:
+            index = QuantizedIndex(gallery, dtype)
+            nbytes = index.nbytes
+        idx, dist, ms = _timed_search(index, queries, tolerance)
+        decisions = _decisions(idx, dist, names, tolerance)
+        changed = sum(a != b for a, b in zip(decisions, reference))
+        # Error of the distance to the baseline's nearest row, not to whatever row won
+        err = np.abs(index.distances(queries)[np.arange(len(queries)), ref_idx] - ref_dist).max()
+        print(f"{dtype:>8} {nbytes / 1e6:>8.2f} {ms:>9.2f} {changed:>8} {err:>9.5f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--tolerance', type=float, default=FACE_MATCH_TOLERANCE)
+    parser.add_argument('--gallery', help='validate on this gallery (path without extension) instead')
+    args = parser.parse_args()
+
+    if args.gallery:
+        from gallery_file import load_gallery
+        loaded = load_gallery(args.gallery, verify=False)
+        matrix = np.asarray(loaded.encodings, dtype=np.float32)
+        queries, _ = synthetic_queries(matrix, args.queries)
+        run(matrix, loaded.names, queries, args.tolerance, loaded.source)
+    else:
+        for size in args.sizes:
+            matrix = synthetic_gallery(size)
+            queries, _ = synthetic_queries(matrix, args.queries)
+            run(matrix, [str(i) for i in range(size)], queries, args.tolerance, 'synthetic')
+            print()
@@ -0,0 +1,83 @@
+"""
+Hit-rate and latency report for the recency candidate cache (RecencyMatcher).
+
+Simulates a day at one kiosk: a synthetic school gallery, of which a few
+hundred "regulars" pass again and again (Zipf-distributed), plus a share of
+never-enrolled visitors. Each face is a noisy re-capture. For every margin
+the two-stage matcher is compared with the plain full-gallery matcher on
+the same stream:
+
+    python bench_recency.py
+    python bench_recency.py --gallery 3000 --regulars 300 --faces 5000 --margins 0 0.05 0.1 0.15
+
+"hit rate" is the share of faces accepted from the cache. "differs" counts
+faces whose decision differs from the full search. "false acc" counts
+never-enrolled faces that were matched to someone. Pick the smallest margin
+with no extra differences and the same false-accept count as "full".
+"""
+import argparse
+import time
+
+import numpy as np
+
+from bench_gallery_index import synthetic_gallery
+from face_matcher import FaceMatcher, RecencyMatcher, FACE_MATCH_TOLERANCE, RECENT_CACHE_SIZE
+
+
+def traffic(gallery: np.ndarray, regulars: int, n_faces: int, noise: float = 0.35, impostors: float = 0.05,
+            seed: int = 3):
+    """(queries, true_index) for a day of passers-by; true_index is -1 for visitors."""
+    rng = np.random.default_rng(seed)
+    people = rng.choice(len(gallery), size=min(regulars, len(gallery)), replace=False)
+    weights = 1.0 / np.arange(1, len(people) + 1)
+    truth = people[rng.choice(len(people), size=n_faces, p=weights / weights.sum())]
+    queries = gallery[truth] + rng.normal(0.0, noise / np.sqrt(128), (n_faces, 128))
+    fake = rng.random(n_faces) < impostors
+    queries[fake] = synthetic_gallery(int(fake.sum()), seed=seed + 1000)
+    truth[fake] = -1
+    return queries.astype(np.float32), truth
+
+
+def _run(matcher, queries, batch: int = 2):
+    decisions = []
+    start = time.perf_counter()
+    for i in range(0, len(queries), batch):
+        decisions.extend(name for name, _ in matcher.identify(queries[i:i + batch]))
+    return decisions, (time.perf_counter() - start) * 1000.0 / len(queries)
+
+
+def run(n_gallery, regulars, n_faces, size, margins, tolerance):
+    gallery = synthetic_gallery(n_gallery)
+    names = [f"S{i:05d}" for i in range(n_gallery)]
+    queries, truth = traffic(gallery, regulars, n_faces)
+    full = FaceMatcher(gallery, names, tolerance=tolerance)
+    reference, full_ms = _run(full, queries)
+    visitors = truth < 0
+
+    def false_accepts(decisions):
+        return sum(1 for d, v in zip(decisions, visitors) if v and d is not None)
+
+    print(f"gallery={n_gallery} regulars={regulars} faces={n_faces} cache={size} tolerance={tolerance}")
+    print(f"{'margin':>8} {'hit rate':>9} {'ms/face':>8} {'speedup':>8} {'differs':>8} {'false acc':>9}")
+    print(f"{'full':>8} {'':>9} {full_ms:>8.3f} {1.0:>8.2f} {0:>8} {false_accepts(reference):>9}")
+    for margin in margins:
+        matcher = RecencyMatcher(FaceMatcher(gallery, names, tolerance=tolerance), size=size, margin=margin)
+        decisions, ms = _run(matcher, queries)
+        differs = sum(a != b for a, b in zip(decisions, reference))
+        hit_rate = matcher.stats['hits'] / max(1, matcher.stats['faces'])
+        print(f"{margin:>8.3f} {hit_rate:>9.2f} {ms:>8.3f} {full_ms / ms:>8.2f} {differs:>8} "
+              f"{false_accepts(decisions):>9}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--gallery', type=int, nargs='+', default=[3000, 20000])
+    parser.add_argument('--regulars', type=int, default=300)
+    parser.add_argument('--faces', type=int, default=3000)
+    parser.add_argument('--cache', type=int, default=RECENT_CACHE_SIZE or 256)
+    parser.add_argument('--margins', type=float, nargs='+', default=[0.0, 0.05, 0.1, 0.15])
+    parser.add_argument('--tolerance', type=float, default=FACE_MATCH_TOLERANCE)
+    args = parser.parse_args()
+    for n in args.gallery:
+        run(n, args.regulars, args.faces, args.cache, args.margins, args.tolerance)
+        print()
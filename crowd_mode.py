@@ -0,0 +1,128 @@
+"""
+Crowd mode for assemblies and the corridor rush.
+
+When dozens of faces pass the kiosk, greeting each person floods the TTS
+queue. `CrowdMode` turns on when at least FACE_CROWD_ENTER faces are in view.
+It turns off again once no more than FACE_CROWD_EXIT faces have been in view
+for FACE_CROWD_HOLD seconds. While it is on:
+
+- recognitions are written silently to an attendance CSV (one row per
+  person per day)
+- greetings are coalesced into a single "Hello everyone!" per cooldown
+- the loop favours throughput: more faces are encoded per frame and
+  re-verification of already confirmed tracks is paused (see main.py)
+
+Identification throughput (distinct faces identified per minute) is tracked
+in both modes and printed on every switch and at exit.
+"""
+import os
+import csv
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+
+CROWD_ENTER_FACES = int(os.environ.get('FACE_CROWD_ENTER', '5'))
+CROWD_EXIT_FACES = int(os.environ.get('FACE_CROWD_EXIT', '2'))
+CROWD_HOLD_SECONDS = float(os.environ.get('FACE_CROWD_HOLD', '10'))
+# Faces encoded per frame, and the encode-budget multiplier, while the crowd lasts
+CROWD_MAX_FACES = int(os.environ.get('FACE_CROWD_MAX_FACES', '8'))
+CROWD_BUDGET_FACTOR = float(os.environ.get('FACE_CROWD_BUDGET_FACTOR', '2'))
+CROWD_GREETING_COOLDOWN = float(os.environ.get('FACE_CROWD_GREETING_COOLDOWN', '60'))
+ATTENDANCE_FILE = os.environ.get('FACE_ATTENDANCE_FILE', 'attendance.csv')
+# A person seen again after this long counts as a new identification for the throughput metric
+REIDENTIFY_SECONDS = 60.0
+
+
+class CrowdMode:
+    def __init__(self, enter_faces: int = CROWD_ENTER_FACES, exit_faces: int = CROWD_EXIT_FACES,
+                 hold_seconds: float = CROWD_HOLD_SECONDS, max_faces: int = CROWD_MAX_FACES,
+                 budget_factor: float = CROWD_BUDGET_FACTOR, greeting_cooldown: float = CROWD_GREETING_COOLDOWN,
+                 attendance_file: Optional[str] = ATTENDANCE_FILE):
+        self.enter_faces = enter_faces
+        self.exit_faces = min(exit_faces, enter_faces - 1)
+        self.hold_seconds = hold_seconds
+        self.max_faces = max_faces
+        self.budget_factor = budget_factor
+        self.greeting_cooldown = greeting_cooldown
+        self.attendance_file = attendance_file
+        self.active = False
+        self._calm_since = None
+        self._last_greeting = float('-inf')
+        self._attended = set()  # (date, person) already written to the attendance file
+        self._last_identified = {}  # person -> last time seen
+        self._identifications = deque()  # timestamps of identifications in the last minute
+        self.stats = {'crowds': 0, 'identified': 0, 'attendance_rows': 0, 'greetings': 0, 'peak_per_minute': 0}
+
+    def update(self, face_count: int, now: Optional[float] = None) -> bool:
+        """Feed the number of faces in view; returns True when the mode switched."""
+        now = time.time() if now is None else now
+        if not self.active:
+            if face_count >= self.enter_faces:
+                self.active = True
+                self._calm_since = None
+                self.stats['crowds'] += 1
+                print(f"[Crowd] on: {face_count} faces in view ({self.faces_per_minute(now)} identified/min)")
+                return True
+            return False
+        if face_count > self.exit_faces:
+            self._calm_since = None
+        elif self._calm_since is None:
+            self._calm_since = now
+        elif now - self._calm_since >= self.hold_seconds:
+            self.active = False
+            print(f"[Crowd] off: {face_count} faces in view ({self.faces_per_minute(now)} identified/min)")
+            return True
+        return False
+
+    def observe(self, people: Iterable[str], now: Optional[float] = None):
+        """Count recognised people for the throughput metric; in crowd mode also take attendance."""
+        now = time.time() if now is None else now
+        for person in people:
+            last = self._last_identified.get(person)
+            self._last_identified[person] = now
+            if last is None or now - last > REIDENTIFY_SECONDS:
+                self._identifications.append(now)
+                self.stats['identified'] += 1
+            if self.active:
+                self._attend(person, now)
+        rate = self.faces_per_minute(now)
+        if rate > self.stats['peak_per_minute']:
+            self.stats['peak_per_minute'] = rate
+
+    def faces_per_minute(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        while self._identifications and now - self._identifications[0] > 60.0:
+            self._identifications.popleft()
+        return len(self._identifications)
+
+    def greet(self, speak: Optional[Callable[[str], None]] = None, now: Optional[float] = None) -> Optional[str]:
+        """One greeting for the whole crowd, at most once per cooldown."""
+        now = time.time() if now is None else now
+        if now - self._last_greeting < self.greeting_cooldown:
+            return None
+        self._last_greeting = now
+        self.stats['greetings'] += 1
+        text = "Hello everyone! Welcome to MGM Model School."
+        if speak is not None:
+            speak(text)
+        return text
+
+    def _attend(self, person: str, now: float):
+        stamp = datetime.fromtimestamp(now)
+        key = (stamp.date(), person)
+        if key in self._attended or not self.attendance_file:
+            return
+        self._attended.add(key)
+        try:
+            with open(self.attendance_file, 'a', newline='') as f:
+                csv.writer(f).writerow([stamp.isoformat(timespec='seconds'), person])
+            self.stats['attendance_rows'] += 1
+        except OSError as e:
+            print(f"[Crowd] Could not write {self.attendance_file}: {e}")
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"active={self.active} crowds={s['crowds']} identified={s['identified']} "
+                f"per_minute={self.faces_per_minute()} peak_per_minute={s['peak_per_minute']} "
+                f"attendance_rows={s['attendance_rows']} greetings={s['greetings']}")
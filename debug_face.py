@@ -1,18 +1,19 @@
 import cv2
 import face_recognition
-import pickle
 import numpy as np
 
+from frame_capture import LatestFrameCapture
+from gallery_file import load_gallery
+
 print("="*50)
 print("🧐 FACE RECOGNITION DIAGNOSTIC")
 print("="*50)
 
 # 1. Try to load encodings
 try:
-    print("Loading encoded_file.p...", end="")
-    with open(r'encoded_file.p', 'rb') as f:
-        encode_list_known_with_ids = pickle.load(f)
-    known_encodings, known_names = encode_list_known_with_ids
+    print("Loading gallery...", end="")
+    gallery = load_gallery()
+    known_encodings, known_names = gallery.encodings, gallery.names
     print(f" ✅ Success!")
     print(f"Known People: {known_names}")
 except Exception as e:
@@ -21,7 +22,7 @@ except Exception as e:
     exit()
 
 # 2. Open Camera
-cap = cv2.VideoCapture(0)
+cap = LatestFrameCapture(0).start()
 if not cap.isOpened():
     print("❌ Critical: Could not open camera (Index 0)")
     exit()
@@ -0,0 +1,88 @@
+"""
+Per-frame compute budget for face encodings.
+
+With more faces in view than FACE_MAX_FACES, the loop used to encode the
+first N in detection order. The same faces could starve forever while
+identified faces were re-encoded. `EncodeScheduler` picks which pending
+tracks to encode on each frame:
+
+1. tracks that have never been identified
+2. unknown faces being checked again
+3. known faces due for re-verification
+
+Within a class, larger (nearer) faces go first. A track that has waited
+FACE_MAX_WAIT_FRAMES frames jumps the queue (longest wait first), so every
+face is identified within a bounded time. Tracks that do not fit simply
+stay pending and carry over to the next frame.
+
+The budget is FACE_ENCODE_BUDGET_MS of encoding time per frame. It is
+converted to a face count using a running estimate of the cost of one
+encoding, and at least one face is encoded per frame so the queue always
+moves.
+"""
+import os
+from typing import List
+
+# Encoding time allowed per frame, and the longest a track may wait for an encoding
+ENCODE_BUDGET_MS = float(os.environ.get('FACE_ENCODE_BUDGET_MS', '150'))
+MAX_WAIT_FRAMES = int(os.environ.get('FACE_MAX_WAIT_FRAMES', '10'))
+# Faces tracked at once when scheduling (encodings are budgeted separately)
+MAX_TRACKS = int(os.environ.get('FACE_MAX_TRACKS', '12'))
+
+
+def track_class(track) -> int:
+    """0 = never identified, 1 = unknown being re-checked, 2 = known, re-verifying."""
+    if track.distance is None:
+        return 0
+    return 1 if track.person is None else 2
+
+
+class EncodeScheduler:
+    def __init__(self, budget_ms: float = ENCODE_BUDGET_MS, max_faces: int = 4,
+                 max_wait_frames: int = MAX_WAIT_FRAMES, initial_cost_ms: float = 50.0, smoothing: float = 0.2):
+        self.budget_ms = budget_ms
+        self.max_faces = max_faces
+        self.max_wait_frames = max_wait_frames
+        self.cost_ms = initial_cost_ms  # smoothed cost of one encoding
+        self.smoothing = smoothing
+        self._waiting = {}  # track id -> frames spent pending without being picked
+        self.stats = {'frames': 0, 'scheduled': 0, 'deferred': 0, 'starved': 0, 'max_wait': 0}
+
+    def select(self, pending) -> List:
+        """Choose which of the pending tracks to encode on this frame."""
+        self.stats['frames'] += 1
+        if not pending:
+            self._waiting = {}
+            return []
+        waiting = {t.id: self._waiting.get(t.id, 0) for t in pending}
+
+        def priority(track):
+            if waiting[track.id] >= self.max_wait_frames:
+                # Starving tracks first, longest wait first
+                return (0, -waiting[track.id], 0, 0)
+            return (1, track_class(track), -track.area(), -waiting[track.id])
+
+        ordered = sorted(pending, key=priority)
+        fits = int(self.budget_ms // self.cost_ms) if self.cost_ms > 0 else len(ordered)
+        chosen = ordered[:max(1, min(self.max_faces, fits))]
+
+        chosen_ids = {t.id for t in chosen}
+        self.stats['starved'] += sum(1 for t in chosen if waiting[t.id] >= self.max_wait_frames)
+        self.stats['scheduled'] += len(chosen)
+        self.stats['deferred'] += len(pending) - len(chosen)
+        # Deferred tracks carry their wait over; scheduled ones start again from zero
+        self._waiting = {tid: w + 1 for tid, w in waiting.items() if tid not in chosen_ids}
+        if self._waiting:
+            self.stats['max_wait'] = max(self.stats['max_wait'], max(self._waiting.values()))
+        return chosen
+
+    def record(self, faces: int, ms: float):
+        """Feed back the measured time of encoding `faces` faces."""
+        if faces > 0:
+            per_face = ms / faces
+            self.cost_ms += self.smoothing * (per_face - self.cost_ms)
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"scheduled={s['scheduled']} deferred={s['deferred']} starved={s['starved']} "
+                f"max_wait={s['max_wait']} cost={self.cost_ms:.0f}ms/face budget={self.budget_ms:.0f}ms")
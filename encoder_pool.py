@@ -0,0 +1,148 @@
+"""
+Optional multiprocessing backend for face encodings.
+
+dlib's `face_encodings` is single-threaded, so on a Pi 4 three of the four cores
+sit idle while the display loop waits for it. `EncoderPool` runs a few encoder
+processes; the loop submits a (downscaled, RGB) frame plus face locations and
+picks up the 128-d encodings later with `poll()`, so rendering never blocks.
+
+Frames go through one shared-memory slot per worker instead of being pickled,
+and `submit()` refuses new work while every slot is busy (backpressure), so
+there are never more frames in flight than workers. A frame larger than its
+slot (the ROI encode path submits full-resolution frames) replaces the slot
+with a bigger one; the worker attaches to it by name on its next task.
+
+The workers are forked so they inherit the already-mapped slots (and so a
+script like `main.py` is not re-imported by the children). On platforms
+without fork the pool is unavailable and callers should encode in-process.
+"""
+import os
+import queue
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Number of encoder processes for main.py; 0 keeps encoding in the main process
+ENCODER_WORKERS = int(os.environ.get('FACE_ENCODER_WORKERS', '0'))
+# Initial slot size (a 640x480 RGB frame); slots grow to the largest frame submitted
+SLOT_BYTES = int(os.environ.get('FACE_ENCODER_SLOT_BYTES', str(480 * 640 * 3)))
+
+
+def fork_available() -> bool:
+    return 'fork' in mp.get_all_start_methods()
+
+
+def _encoder_worker(slots, tasks, results):
+    import face_recognition
+
+    slots = list(slots)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        slot, name, shape, dtype, locations, tag = task
+        if slots[slot].name != name:
+            # The pool replaced this slot with a larger one
+            slots[slot].close()
+            slots[slot] = shared_memory.SharedMemory(name=name)
+        frame = np.ndarray(shape, dtype=dtype, buffer=slots[slot].buf)
+        try:
+            encodings = face_recognition.face_encodings(frame, locations)
+            error = None
+        except Exception as e:
+            encodings = []
+            error = str(e)
+        del frame
+        results.put((slot, tag, locations, [np.asarray(e) for e in encodings], error))
+
+
+class EncoderPool:
+    """A fixed pool of encoder processes fed through shared-memory frame slots."""
+
+    def __init__(self, workers: int = ENCODER_WORKERS, slot_bytes: int = SLOT_BYTES):
+        if not fork_available():
+            raise RuntimeError("EncoderPool needs the 'fork' start method")
+        ctx = mp.get_context('fork')
+        self.workers = max(1, workers)
+        self.slot_bytes = slot_bytes
+        self._slots = [shared_memory.SharedMemory(create=True, size=slot_bytes) for _ in range(self.workers)]
+        self._free = list(range(self.workers))
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._procs = []
+        for _ in range(self.workers):
+            p = ctx.Process(target=_encoder_worker, args=(self._slots, self._tasks, self._results), daemon=True)
+            p.start()
+            self._procs.append(p)
+        self.stats = {'submitted': 0, 'completed': 0, 'rejected': 0, 'errors': 0, 'resized': 0}
+        print(f"[EncoderPool] Started {self.workers} encoder processes")
+
+    @property
+    def in_flight(self) -> int:
+        return self.workers - len(self._free)
+
+    def submit(self, frame, locations, tag=None) -> bool:
+        """Queue `frame` (RGB uint8) for encoding at `locations`.
+
+        Returns False without queuing anything if every slot is busy.
+        """
+        if not self._free:
+            self.stats['rejected'] += 1
+            return False
+        slot = self._free.pop()
+        if frame.nbytes > self._slots[slot].size:
+            self._grow(slot, frame.nbytes)
+        view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=self._slots[slot].buf)
+        view[...] = frame
+        del view
+        self._tasks.put((slot, self._slots[slot].name, frame.shape, frame.dtype.str, list(locations), tag))
+        self.stats['submitted'] += 1
+        return True
+
+    def _grow(self, slot: int, nbytes: int):
+        # The slot is free, so no worker is reading it; a worker that still maps the old
+        # segment keeps it alive until it attaches to the new name
+        old = self._slots[slot]
+        self._slots[slot] = shared_memory.SharedMemory(create=True, size=nbytes)
+        old.close()
+        old.unlink()
+        self.slot_bytes = max(self.slot_bytes, nbytes)
+        self.stats['resized'] += 1
+        print(f"[EncoderPool] Slot {slot} resized from {old.size} to {nbytes} bytes for a larger frame")
+
+    def poll(self, timeout: float = 0.0) -> list:
+        """Collect finished jobs as (tag, locations, encodings) tuples without blocking the loop."""
+        done = []
+        block = timeout > 0
+        while True:
+            try:
+                slot, tag, locations, encodings, error = self._results.get(block=block, timeout=timeout or None)
+            except queue.Empty:
+                break
+            block = False
+            self._free.append(slot)
+            if error is not None:
+                self.stats['errors'] += 1
+                if os.environ.get('OMNIS_DEBUG') == '1':
+                    print(f"[DEBUG] Encoder worker error: {error}")
+            self.stats['completed'] += 1
+            done.append((tag, locations, encodings))
+        return done
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"workers={self.workers} submitted={s['submitted']} completed={s['completed']} "
+                f"rejected={s['rejected']} resized={s['resized']} errors={s['errors']}")
+
+    def close(self):
+        for _ in self._procs:
+            self._tasks.put(None)
+        for p in self._procs:
+            p.join(timeout=2.0)
+            if p.is_alive():
+                p.terminate()
+        for shm in self._slots:
+            shm.close()
+            shm.unlink()
+        self._slots = []
@@ -0,0 +1,157 @@
+"""
+Pluggable face detectors.
+
+A detector is a callable that takes an RGB frame and returns face boxes as
+(top, right, bottom, left). That is the same contract as
+`face_recognition.face_locations`, so a detector can be handed straight to
+`FaceTracker.update`. Backends:
+
+- hog (default): dlib HOG over the whole frame, as before.
+- cascade: an OpenCV Haar/LBP cascade proposes candidate regions quickly.
+  dlib HOG then confirms each candidate on a small padded crop, so the
+  expensive scan only covers the parts of the frame that look like faces.
+
+Select with FACE_DETECTOR=hog|cascade. FACE_CASCADE picks the cascade:
+'haar' (haarcascade_frontalface_default.xml, shipped with opencv-python),
+'lbp' (lbpcascade_frontalface_improved.xml from a system OpenCV install),
+or a path to any cascade XML. If the cascade cannot be loaded, the HOG
+backend is used instead.
+"""
+import os
+from typing import List
+
+import cv2
+import face_recognition
+
+FACE_DETECTOR = os.environ.get('FACE_DETECTOR', 'hog').lower()
+FACE_CASCADE = os.environ.get('FACE_CASCADE', 'haar')
+# Cascade proposals are deliberately permissive: HOG rejects the false positives
+CASCADE_MIN_NEIGHBORS = int(os.environ.get('FACE_CASCADE_MIN_NEIGHBORS', '3'))
+# Padding around a candidate, as a fraction of its size on each side
+CASCADE_PADDING = float(os.environ.get('FACE_CASCADE_PADDING', '0.3'))
+# 0 = trust the cascade boxes without HOG confirmation (fastest, more false positives)
+CASCADE_CONFIRM = os.environ.get('FACE_CASCADE_CONFIRM', '1') == '1'
+
+_CASCADE_FILES = {
+    'haar': 'haarcascade_frontalface_default.xml',
+    'lbp': 'lbpcascade_frontalface_improved.xml',
+}
+_CASCADE_DIRS = (
+    '/usr/share/opencv4/haarcascades', '/usr/share/opencv4/lbpcascades',
+    '/usr/share/opencv/haarcascades', '/usr/share/opencv/lbpcascades',
+)
+
+
+def _iou(a, b) -> float:
+    inter = max(0, min(a[2], b[2]) - max(a[0], b[0])) * max(0, min(a[1], b[1]) - max(a[3], b[3]))
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    return inter / float(area_a + area_b - inter)
+
+
+def find_cascade(name: str):
+    """Resolve 'haar', 'lbp' or a path to an existing cascade XML file (None if not found)."""
+    if os.path.isfile(name):
+        return name
+    filename = _CASCADE_FILES.get(name, name)
+    dirs = list(_CASCADE_DIRS)
+    data = getattr(cv2, 'data', None)
+    if data is not None and hasattr(data, 'haarcascades'):
+        dirs.insert(0, data.haarcascades)
+    for directory in dirs:
+        path = os.path.join(directory, filename)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+class HogDetector:
+    name = 'hog'
+
+    def __init__(self, upsample: int = 1, model: str = 'hog'):
+        self.upsample = upsample
+        self.model = model
+        self.stats = {'frames': 0, 'faces': 0}
+
+    def __call__(self, frame_rgb) -> List[tuple]:
+        boxes = face_recognition.face_locations(frame_rgb, self.upsample, model=self.model)
+        self.stats['frames'] += 1
+        self.stats['faces'] += len(boxes)
+        return boxes
+
+    detect = __call__
+
+    def summary(self) -> str:
+        return f"detector=hog frames={self.stats['frames']} faces={self.stats['faces']}"
+
+
+class CascadeDetector:
+    name = 'cascade'
+
+    def __init__(self, cascade_path: str, min_neighbors: int = CASCADE_MIN_NEIGHBORS,
+                 padding: float = CASCADE_PADDING, confirm: bool = CASCADE_CONFIRM,
+                 scale_factor: float = 1.1, min_size: int = 20, upsample: int = 1):
+        self.classifier = cv2.CascadeClassifier(cascade_path)
+        if self.classifier.empty():
+            raise ValueError(f"could not load cascade {cascade_path}")
+        self.cascade_path = cascade_path
+        self.min_neighbors = min_neighbors
+        self.padding = padding
+        self.confirm = confirm
+        self.scale_factor = scale_factor
+        self.min_size = min_size
+        self.upsample = upsample
+        self.stats = {'frames': 0, 'candidates': 0, 'faces': 0}
+
+    def __call__(self, frame_rgb) -> List[tuple]:
+        self.stats['frames'] += 1
+        gray = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2GRAY)
+        rects = self.classifier.detectMultiScale(gray, scaleFactor=self.scale_factor,
+                                                 minNeighbors=self.min_neighbors,
+                                                 minSize=(self.min_size, self.min_size))
+        self.stats['candidates'] += len(rects)
+        candidates = [(int(y), int(x + w), int(y + h), int(x)) for x, y, w, h in rects]
+        if not self.confirm:
+            self.stats['faces'] += len(candidates)
+            return candidates
+
+        h, w = frame_rgb.shape[:2]
+        boxes = []
+        for top, right, bottom, left in candidates:
+            pad_y = int((bottom - top) * self.padding)
+            pad_x = int((right - left) * self.padding)
+            y0, y1 = max(0, top - pad_y), min(h, bottom + pad_y)
+            x0, x1 = max(0, left - pad_x), min(w, right + pad_x)
+            crop = frame_rgb[y0:y1, x0:x1]
+            for t, r, b, l in face_recognition.face_locations(crop, self.upsample):
+                box = (y0 + t, x0 + r, y0 + b, x0 + l)
+                # Overlapping candidates can confirm the same face twice
+                if not any(_iou(box, other) > 0.3 for other in boxes):
+                    boxes.append(box)
+        self.stats['faces'] += len(boxes)
+        return boxes
+
+    detect = __call__
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"detector=cascade({os.path.basename(self.cascade_path)}, confirm={self.confirm}) "
+                f"frames={s['frames']} candidates={s['candidates']} faces={s['faces']}")
+
+
+def make_detector(kind: str = FACE_DETECTOR, cascade: str = FACE_CASCADE, **kwargs):
+    """Build the configured detector, falling back to HOG if the cascade is unavailable."""
+    if kind == 'cascade':
+        path = find_cascade(cascade)
+        if path is None or not hasattr(cv2, 'CascadeClassifier'):
+            print(f"[Detector] Cascade '{cascade}' not available in this OpenCV build; using HOG")
+        else:
+            try:
+                return CascadeDetector(path, **kwargs)
+            except ValueError as e:
+                print(f"[Detector] {e}; using HOG")
+    elif kind != 'hog':
+        print(f"[Detector] Unknown detector '{kind}'; using HOG")
+    return HogDetector()
@@ -0,0 +1,255 @@
+"""
+Vectorized gallery matcher.
+
+`face_recognition.compare_faces` followed by `face_distance` computes the same
+distances twice, one face at a time, and converts the gallery list to an array
+on every call. `FaceMatcher` keeps the gallery as one contiguous float32 matrix
+(with precomputed squared norms) and computes a single (faces x gallery)
+distance matrix per frame.
+
+The nearest-neighbour search itself is delegated to a gallery index (see
+gallery_index.py), so large galleries can use `FACE_INDEX=cluster`.
+
+A person may have several templates (rows with the same name).
+FACE_MATCH_AGGREGATE chooses how their distances are combined: 'min' (the
+default) takes the closest template, and 'centroid' matches against the
+mean of each person's templates, which gives one row per person.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from gallery_index import build_index, FACE_INDEX
+
+FACE_MATCH_TOLERANCE = float(os.environ.get('FACE_MATCH_TOLERANCE', '0.55'))
+FACE_MATCH_AGGREGATE = os.environ.get('FACE_MATCH_AGGREGATE', 'min')
+# Recently matched people checked before the full gallery (RecencyMatcher); 0 disables
+RECENT_CACHE_SIZE = int(os.environ.get('FACE_RECENT_CACHE', '0'))
+# A recent match is accepted only this far below the tolerance
+RECENT_MARGIN = float(os.environ.get('FACE_RECENT_MARGIN', '0.1'))
+
+
+def person_rows(names: Sequence[str]):
+    """(people in first-seen order, row -> index into people)."""
+    people, lookup = [], {}
+    rows = np.empty(len(names), dtype=np.int64)
+    for i, name in enumerate(names):
+        if name not in lookup:
+            lookup[name] = len(people)
+            people.append(name)
+        rows[i] = lookup[name]
+    return people, rows
+
+
+class FaceMatcher:
+    def __init__(self, encodings: Sequence, names: Sequence[str], tolerance: float = FACE_MATCH_TOLERANCE,
+                 index: str = FACE_INDEX, cache_path: Optional[str] = None, aggregate: str = FACE_MATCH_AGGREGATE):
+        self.names = list(names)
+        self.tolerance = tolerance
+        self.aggregate = aggregate
+        self.gallery = np.ascontiguousarray(np.asarray(encodings, dtype=np.float32).reshape(-1, 128))
+        self.people, self.row_person = person_rows(self.names)
+        if aggregate == 'centroid' and len(self.people) < len(self.names):
+            # One row per person; 'min' needs nothing extra, the nearest row already belongs to the nearest person
+            sums = np.zeros((len(self.people), 128), dtype=np.float64)
+            np.add.at(sums, self.row_person, self.gallery)
+            counts = np.bincount(self.row_person, minlength=len(self.people))
+            self.gallery = (sums / counts[:, None]).astype(np.float32)
+            self.names = list(self.people)
+            self.row_person = np.arange(len(self.people), dtype=np.int64)
+        elif aggregate not in ('min', 'centroid'):
+            print(f"[FaceMatcher] Unknown FACE_MATCH_AGGREGATE '{aggregate}', using 'min'")
+            self.aggregate = 'min'
+        self._sq_norms = np.einsum('ij,ij->i', self.gallery, self.gallery)
+        self.index = build_index(self.gallery, index, cache_path)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def distances(self, encodings) -> np.ndarray:
+        """Euclidean distance matrix of shape (len(encodings), len(gallery))."""
+        q = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+        # |q - g|^2 = |q|^2 + |g|^2 - 2 q.g  -- one matrix product for all faces
+        d2 = np.einsum('ij,ij->i', q, q)[:, None] + self._sq_norms[None, :] - 2.0 * (q @ self.gallery.T)
+        np.maximum(d2, 0.0, out=d2)
+        return np.sqrt(d2)
+
+    def match(self, encodings):
+        """Match every face in one pass.
+
+        Returns (best_index, best_distance, matched) arrays, one entry per face.
+        With an empty gallery every face is unmatched with index -1.
+        """
+        n = len(encodings)
+        if n == 0 or len(self.names) == 0:
+            return (np.full(n, -1, dtype=np.int64), np.full(n, np.inf, dtype=np.float32),
+                    np.zeros(n, dtype=bool))
+        q = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+        best, best_dist = self.index.search(q, self.tolerance)
+        return best, best_dist, best_dist <= self.tolerance
+
+    def identify(self, encodings) -> List[tuple]:
+        """Convenience wrapper: [(name or None, distance), ...] for each face."""
+        best, best_dist, matched = self.match(encodings)
+        return [(self.names[i] if ok else None, float(d)) for i, d, ok in zip(best, best_dist, matched)]
+
+    def name_of(self, index: int) -> Optional[str]:
+        return self.names[index] if 0 <= index < len(self.names) else None
+
+
+class CandidateMatcher:
+    """Two-stage matching: a small candidate set first, `matcher` (the full gallery) only if needed.
+
+    Subclasses choose the candidate rows. A face whose best candidate
+    distance is at most `tolerance - margin` is accepted without the full
+    search, and every other face falls back to `matcher`. A stage-1 accept is
+    also a match for the full search, so no unknown face is accepted that
+    would have been rejected. The margin guards against the other case: a
+    closer person outside the candidate set.
+
+    Wrappers stack (they expose the same attributes as FaceMatcher), e.g.
+    RecencyMatcher(PartitionMatcher(FaceMatcher(...))).
+    """
+
+    def __init__(self, matcher, margin: float):
+        self.matcher = matcher
+        self.margin = margin
+        self._cached_key = None
+        self._cached = None  # (rows, matrix, squared norms) for _cached_key
+        order = np.argsort(matcher.row_person, kind='stable')
+        bounds = np.searchsorted(matcher.row_person[order], np.arange(len(matcher.people) + 1))
+        self._person_rows = [order[bounds[i]:bounds[i + 1]] for i in range(len(matcher.people))]
+        self.stats = {'faces': 0, 'hits': 0, 'fallbacks': 0, 'candidate_rows': 0, 'first_ms': 0.0, 'full_ms': 0.0}
+
+    @property
+    def names(self):
+        return self.matcher.names
+
+    @property
+    def tolerance(self):
+        return self.matcher.tolerance
+
+    @property
+    def gallery(self):
+        return self.matcher.gallery
+
+    @property
+    def people(self):
+        return self.matcher.people
+
+    @property
+    def row_person(self):
+        return self.matcher.row_person
+
+    def __len__(self) -> int:
+        return len(self.matcher)
+
+    def name_of(self, index: int) -> Optional[str]:
+        return self.matcher.name_of(index)
+
+    def candidate_key(self):
+        """Hashable key of the current candidate set, or None for no stage 1 (the base class never has one)."""
+        return None
+
+    def candidate_rows(self, key) -> np.ndarray:
+        """Gallery rows of the candidate set named by `key`."""
+        return np.zeros(0, dtype=np.int64)
+
+    def matched(self, rows: np.ndarray):
+        """Called with the gallery rows of every matched face."""
+
+    def _candidate_set(self):
+        key = self.candidate_key()
+        if key is None:
+            return None
+        if key != self._cached_key:
+            rows = self.candidate_rows(key)
+            matrix = np.ascontiguousarray(self.matcher.gallery[rows])
+            self._cached_key, self._cached = key, (rows, matrix, np.einsum('ij,ij->i', matrix, matrix))
+        return self._cached
+
+    def match(self, encodings):
+        """Same contract as FaceMatcher.match."""
+        n = len(encodings)
+        q = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+        best = np.full(n, -1, dtype=np.int64)
+        best_dist = np.full(n, np.inf, dtype=np.float32)
+        rest = np.ones(n, dtype=bool)
+        candidates = self._candidate_set() if n else None
+        if candidates is not None and len(candidates[0]):
+            start = time.perf_counter()
+            rows, matrix, sq = candidates
+            d2 = np.einsum('ij,ij->i', q, q)[:, None] + sq[None, :] - 2.0 * (q @ matrix.T)
+            np.maximum(d2, 0.0, out=d2)
+            j = np.argmin(d2, axis=1)
+            d = np.sqrt(d2[np.arange(n), j])
+            accept = d <= self.tolerance - self.margin
+            best[accept], best_dist[accept] = rows[j[accept]], d[accept]
+            rest = ~accept
+            self.stats['first_ms'] += (time.perf_counter() - start) * 1000.0
+            self.stats['hits'] += int(accept.sum())
+            self.stats['candidate_rows'] += len(rows) * n
+        if rest.any():
+            start = time.perf_counter()
+            b, bd, _ = self.matcher.match(q[rest])
+            best[rest], best_dist[rest] = b, bd
+            self.stats['full_ms'] += (time.perf_counter() - start) * 1000.0
+            self.stats['fallbacks'] += int(rest.sum())
+        self.stats['faces'] += n
+        matched = best_dist <= self.tolerance
+        self.matched(best[matched])
+        return best, best_dist, matched
+
+    def identify(self, encodings) -> List[tuple]:
+        best, best_dist, matched = self.match(encodings)
+        return [(self.names[i] if ok else None, float(d)) for i, d, ok in zip(best, best_dist, matched)]
+
+    def summary(self) -> str:
+        s = self.stats
+        faces = max(1, s['faces'])
+        full_per_face = s['full_ms'] / s['fallbacks'] if s['fallbacks'] else 0.0
+        # Time the hits would have cost in the full search, minus what stage 1 cost for every face
+        saved = s['hits'] * full_per_face - s['first_ms']
+        return (f"margin={self.margin} faces={s['faces']} hit_rate={s['hits'] / faces:.2f} "
+                f"candidate_rows/face={s['candidate_rows'] / faces:.0f} first_ms/face={s['first_ms'] / faces:.3f} "
+                f"full_ms/face={full_per_face:.3f} saved_ms={saved:.0f}")
+
+
+class RecencyMatcher(CandidateMatcher):
+    """Candidates: the templates of the `size` most recently matched people (an LRU).
+
+    The same few hundred students pass a kiosk every day, so most faces are
+    accepted from this set; bench_recency.py measures the hit rate and what
+    a given margin costs in decisions that differ from the full search.
+    """
+
+    def __init__(self, matcher, size: int = RECENT_CACHE_SIZE, margin: float = RECENT_MARGIN):
+        super().__init__(matcher, margin)
+        self.size = size
+        self._recent = OrderedDict()  # person index -> None, most recent last
+        self._generation = 0  # bumped when membership changes; reordering alone keeps the candidate matrix
+
+    def candidate_key(self):
+        return self._generation if self._recent and self.size > 0 else None
+
+    def candidate_rows(self, key) -> np.ndarray:
+        return np.concatenate([self._person_rows[p] for p in self._recent])
+
+    def matched(self, rows: np.ndarray):
+        if self.size <= 0:
+            return
+        for i in rows:
+            person = int(self.matcher.row_person[i])
+            if person in self._recent:
+                self._recent.move_to_end(person)
+                continue
+            self._recent[person] = None
+            if len(self._recent) > self.size:
+                self._recent.popitem(last=False)
+            self._generation += 1
+
+    def summary(self) -> str:
+        return f"recent={len(self._recent)}/{self.size} " + super().summary()
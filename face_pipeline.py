@@ -0,0 +1,408 @@
+"""
+Per-frame recognition step shared by main.py and bench_pipeline.py.
+
+`FacePipeline.process()` takes one BGR frame through detection (or
+tracking), the quality gate, encoding (in-process or on the encoder pool)
+and matching, and returns the faces to show. The optional components are
+switched on by the same environment flags as always:
+
+    FACE_TRACKING=1       detect-then-track (face_tracker.py)
+    FACE_SCHEDULER=1      per-frame encoding budget (encode_scheduler.py)
+    FACE_CROWD_MODE=1     throughput settings while a crowd is in view (crowd_mode.py)
+    FACE_ENCODER_WORKERS  encoder processes (encoder_pool.py)
+    FACE_MOTION_GATE=1    skip detection on static frames (motion_gate.py)
+    FACE_ROI_DETECT=1     two-tier ROI detection (roi_detector.py)
+    FACE_QUALITY_GATE=1   skip poor faces (face_quality.py)
+    FACE_GOVERNOR=1       adapt scale, interval and face budget (frame_governor.py)
+
+`build_matcher` wraps the gallery in the partition and recency matchers
+(FACE_KIOSK, FACE_RECENT_CACHE). The benchmark passes its command-line
+switches as arguments; left unset they fall back to the same flags.
+"""
+import os
+import time
+from typing import Callable, Optional
+
+import cv2
+import face_recognition
+
+from crowd_mode import CrowdMode, ATTENDANCE_FILE
+from encode_scheduler import EncodeScheduler, MAX_TRACKS, ENCODE_BUDGET_MS
+from encoder_pool import EncoderPool, ENCODER_WORKERS, fork_available
+from face_detector import make_detector
+from face_matcher import (FaceMatcher, CandidateMatcher, RecencyMatcher, FACE_MATCH_TOLERANCE, RECENT_CACHE_SIZE,
+                          RECENT_MARGIN)
+from face_quality import FaceQualityGate
+from face_tracker import FaceTracker, REVERIFY_SECONDS
+from frame_governor import FrameGovernor
+from gallery_partitions import PartitionMatcher, KioskSchedule, FACE_KIOSK
+from motion_gate import MotionGate
+from pipeline_timing import PipelineTimer
+from roi_detector import RoiDetector
+
+# Maximum faces to process per frame to bound CPU usage (helps low-power devices)
+MAX_FACES = int(os.environ.get('FACE_MAX_FACES', '4'))
+
+
+def _flag(name: str) -> bool:
+    return os.environ.get(name) == '1'
+
+
+def _debug() -> bool:
+    return os.environ.get('OMNIS_DEBUG') == '1'
+
+
+def scale_box(box, factor):
+    return tuple(int(round(v * factor)) for v in box)
+
+
+def build_matcher(g, tolerance: float = FACE_MATCH_TOLERANCE, kiosk: str = FACE_KIOSK,
+                  recent_cache: int = RECENT_CACHE_SIZE, recent_margin: float = RECENT_MARGIN):
+    # FACE_INDEX=cluster builds (and caches) a pruned index for large galleries
+    cache_path = g.path + '.index.npz' if g.path else None
+    matcher = FaceMatcher(g.encodings, g.names, tolerance=tolerance, cache_path=cache_path)
+    # FACE_KIOSK=<location> searches the partitions the timetable expects at this kiosk first
+    if kiosk:
+        matcher = PartitionMatcher(matcher, g, KioskSchedule(kiosk))
+    # FACE_RECENT_CACHE=N checks the N most recently matched people before the whole gallery
+    return RecencyMatcher(matcher, recent_cache, recent_margin) if recent_cache > 0 else matcher
+
+
+def frame_people(faces):
+    """(person or "Unknown", location) of the face to show, the known people, and the frontmost known person."""
+    shown = None
+    known = set()
+    matched = []
+    for faceLoc, person, distance in faces:
+        if person is not None:
+            known.add(person)
+            # Compute area (in small-frame coords) to pick the frontmost person
+            y1f, x2f, y2f, x1f = faceLoc
+            matched.append((person, max(0, (y2f - y1f)) * max(0, (x2f - x1f))))
+        if shown is None:
+            # The first face is shown, known or not
+            shown = (person if person is not None else "Unknown", faceLoc)
+    primary = max(matched, key=lambda t: t[1])[0] if matched else None
+    return shown, known, primary
+
+
+class FacePipeline:
+    def __init__(self, current_matcher: Callable[[], object], detector=None, scale: float = 0.25,
+                 max_faces: int = MAX_FACES, tracking: Optional[bool] = None, scheduler: Optional[bool] = None,
+                 crowd: Optional[bool] = None, encoder_workers: Optional[int] = None, motion: Optional[bool] = None,
+                 roi: Optional[bool] = None, quality: Optional[bool] = None, governor: Optional[bool] = None,
+                 timer: Optional[PipelineTimer] = None, attendance_file: Optional[str] = ATTENDANCE_FILE):
+        """`current_matcher` returns the matcher to use for a frame (the gallery may be reloaded meanwhile).
+
+        Unset switches (None) follow their environment flag. The encoder pool is forked here, so create
+        the pipeline before starting any other thread.
+        """
+        self.current_matcher = current_matcher
+        self.scale = scale
+        self.max_faces = max_faces
+        self.face_budget = max_faces
+        self.timer = timer if timer is not None else PipelineTimer()
+        self.encodings = 0
+        self.faces = []
+        self._async_faces = []  # last results from the encoder pool (non-tracking mode)
+
+        # Optional encode scheduler: a per-frame encoding budget with priorities and carry-over,
+        # so crowds are tracked in full and every face gets encoded within a bounded time
+        use = _flag('FACE_SCHEDULER') if scheduler is None else scheduler
+        self.scheduler = EncodeScheduler(max_faces=max_faces) if use else None
+        # Optional crowd mode: above FACE_CROWD_ENTER faces, take attendance silently and greet everyone at once
+        use = _flag('FACE_CROWD_MODE') if crowd is None else crowd
+        self.crowd = CrowdMode(attendance_file=attendance_file) if use else None
+        # Optional detect-then-track mode: HOG detection every FACE_DETECT_INTERVAL frames,
+        # boxes carried between detections by FACE_TRACKER ('flow', 'kcf', 'csrt', 'mil')
+        use = _flag('FACE_TRACKING') if tracking is None else tracking
+        self.tracker = None
+        if use:
+            self.tracker = FaceTracker(max_tracks=MAX_TRACKS if self.scheduler is not None else max_faces)
+            print(f"[Pipeline] Face tracking enabled (interval={self.tracker.detect_interval}, "
+                  f"tracker={self.tracker.tracker_type})")
+
+        # Optional encoder processes so face_encodings uses the other Pi cores
+        workers = ENCODER_WORKERS if encoder_workers is None else encoder_workers
+        self.encoder_pool = None
+        if workers > 0:
+            if fork_available():
+                self.encoder_pool = EncoderPool(workers)
+            else:
+                print("[Pipeline] FACE_ENCODER_WORKERS needs fork(); encoding in the main process")
+
+        # Optional motion gate: skip face detection while the scene is static and nobody is in view
+        use = _flag('FACE_MOTION_GATE') if motion is None else motion
+        self.motion_gate = MotionGate() if use else None
+        if self.motion_gate is not None:
+            print(f"[Pipeline] Motion gate enabled (pixel_threshold={self.motion_gate.pixel_threshold}, "
+                  f"area={self.motion_gate.area})")
+
+        # Face detector backend: FACE_DETECTOR=hog (default) or cascade (OpenCV cascade proposals, HOG confirms)
+        self.detector = detector if detector is not None else make_detector()
+        print(f"[Pipeline] Face detector: {self.detector.name}")
+
+        # Optional two-tier detector: low-res full-frame scan plus full-res crops around recent faces.
+        # Faces are then encoded on the full-resolution frame.
+        use = _flag('FACE_ROI_DETECT') if roi is None else roi
+        self.roi_detector = RoiDetector(base_scale=scale, detector=self.detector) if use else None
+        if self.roi_detector is not None:
+            print(f"[Pipeline] ROI re-detection enabled (padding={self.roi_detector.padding}, "
+                  f"pyramid={self.roi_detector.pyramid})")
+
+        # Optional quality gate: skip encoding blurred, tiny, dark or profile faces
+        use = _flag('FACE_QUALITY_GATE') if quality is None else quality
+        self.quality_gate = FaceQualityGate() if use else None
+        if self.quality_gate is not None:
+            print(f"[Pipeline] Face quality gate enabled (min_score={self.quality_gate.min_score})")
+
+        # Optional governor: adapts detection interval, scale and face budget to hold FACE_TARGET_FRAME_MS
+        use = _flag('FACE_GOVERNOR') if governor is None else governor
+        self.governor = None
+        if use:
+            # Without tracking every frame is a detection frame, so the interval knob is pinned at 1
+            self.governor = FrameGovernor(scale=scale, face_budget=max_faces,
+                                          detect_interval=self.tracker.detect_interval if self.tracker else 1,
+                                          max_interval=15 if self.tracker is not None else 1)
+            print(f"[Pipeline] Frame governor enabled (target={self.governor.target_frame_ms:.0f}ms, "
+                  f"recognition<={self.governor.max_recognition_ms:.0f}ms)")
+            if self.timer.enabled:
+                self.timer.add_metrics(lambda: {'governor': self.governor.metrics()})
+
+    def match_faces(self, encodings):
+        """Match all face encodings of a frame in one pass. Returns [(person or None, distance), ...]."""
+        results = self.current_matcher().identify(encodings)
+        self.encodings += len(results)
+
+        # Debug: log which person was chosen for each face and the numeric distance (smaller is better)
+        if _debug():
+            for person, distance in results:
+                print(f"[DEBUG] face match candidate: chosen={person or 'UNKNOWN'} dist={distance:.3f}")
+        return results
+
+    def current_face_budget(self) -> int:
+        """Faces encoded per frame: the crowd-mode limit while a crowd is in view."""
+        if self.crowd is not None and self.crowd.active:
+            return max(self.face_budget, self.crowd.max_faces)
+        return self.face_budget
+
+    def process(self, img, now: Optional[float] = None):
+        """Detect, encode and match one BGR frame; returns [(location, person or None, distance), ...].
+
+        Locations are in detection-frame coordinates (scale by 1 / self.scale for the full frame).
+        `now` is the clock for crowd mode (time.time() if None).
+        """
+        timer = self.timer
+        tracker, quality_gate, scheduler, encoder_pool = (self.tracker, self.quality_gate, self.scheduler,
+                                                          self.encoder_pool)
+        detect_scale = self.scale
+        # Prepare image for face detection
+        imgS = cv2.resize(img, (0, 0), None, detect_scale, detect_scale)
+        imgS = cv2.cvtColor(imgS, cv2.COLOR_BGR2RGB)
+        if self.roi_detector is not None:
+            # Full-resolution RGB for ROI crops and encodings
+            encode_frame, encode_factor = cv2.cvtColor(img, cv2.COLOR_BGR2RGB), 1.0 / detect_scale
+        else:
+            encode_frame, encode_factor = imgS, 1
+        timer.lap('resize')
+
+        # Detect faces and match them against the gallery (protect against expensive failures)
+        recognition_start = time.perf_counter()
+        faces_in_view = 0
+        try:
+            faces_present = bool(tracker.tracks) if tracker is not None else bool(self.faces)
+            if self.motion_gate is not None and not self.motion_gate.should_detect(img, faces_present):
+                # Idle frame: nothing moved and nobody was in view
+                faces = []
+                timer.lap('detect')
+                if _debug() and self.motion_gate.stats['frames'] % 100 == 0:
+                    print(f"[DEBUG] motion gate: {self.motion_gate.summary()}")
+            elif tracker is not None:
+                if self.roi_detector is not None:
+                    detect = lambda _: [scale_box(b, detect_scale) for b in self.roi_detector.detect(encode_frame)]
+                else:
+                    detect = self.detector
+                tracks = tracker.update(imgS, detect)
+                # Count the detections too: a crowd larger than max_tracks is not all tracked
+                faces_in_view = max(len(tracks), tracker.faces_detected)
+                timer.lap('detect')
+                pending = tracker.pending()
+                if pending and quality_gate is not None:
+                    # Poor faces stay pending and are checked again on the next frame
+                    keep = quality_gate.filter(encode_frame, [scale_box(t.location, encode_factor) for t in pending],
+                                               detect_scale * encode_factor)
+                    pending = [t for t, ok in zip(pending, keep) if ok]
+                    timer.lap('quality')
+                if pending and scheduler is not None:
+                    # Whatever does not fit this frame's budget stays pending for the next one
+                    pending = scheduler.select(pending)
+                encode_boxes = [scale_box(t.location, encode_factor) for t in pending]
+                if pending and encoder_pool is not None:
+                    # Hand the tracks to a worker; identities arrive on a later frame
+                    if encoder_pool.submit(encode_frame, encode_boxes, tag=[t.id for t in pending]):
+                        for track in pending:
+                            track.in_flight = True
+                    timer.lap('encode')
+                elif pending:
+                    encode_start = time.perf_counter()
+                    encode_current_frame = face_recognition.face_encodings(encode_frame, encode_boxes)
+                    if scheduler is not None:
+                        scheduler.record(len(encode_boxes), (time.perf_counter() - encode_start) * 1000.0)
+                    timer.lap('encode')
+                    for track, (person, distance) in zip(pending, self.match_faces(encode_current_frame)):
+                        tracker.assign(track, person, distance)
+                if encoder_pool is not None:
+                    for track_ids, _, encodings in encoder_pool.poll():
+                        for track_id, (person, distance) in zip(track_ids, self.match_faces(encodings)):
+                            track = tracker.get(track_id)
+                            if track is not None:
+                                tracker.assign(track, person, distance)
+                        # Tracks the worker found no encoding for may be submitted again
+                        for track_id in track_ids[len(encodings):]:
+                            track = tracker.get(track_id)
+                            if track is not None:
+                                track.in_flight = False
+                timer.lap('match')
+                # Show every track that has been matched at least once (unknowns keep showing while re-checked)
+                faces = [(t.location, t.person, t.distance) for t in tracks if t.distance is not None]
+                if _debug() and tracker.stats['frames'] % 100 == 0:
+                    print(f"[DEBUG] tracker: {tracker.summary()}")
+            else:
+                if self.roi_detector is not None:
+                    face_current_frame = [scale_box(b, detect_scale) for b in self.roi_detector.detect(encode_frame)]
+                else:
+                    face_current_frame = self.detector(imgS)
+                faces_in_view = len(face_current_frame)
+                timer.lap('detect')
+                if face_current_frame and quality_gate is not None:
+                    keep = quality_gate.filter(encode_frame,
+                                               [scale_box(loc, encode_factor) for loc in face_current_frame],
+                                               detect_scale * encode_factor)
+                    face_current_frame = [loc for loc, ok in zip(face_current_frame, keep) if ok]
+                    timer.lap('quality')
+                # Limit number of faces we encode to bound CPU usage
+                budget = self.current_face_budget()
+                if face_current_frame and len(face_current_frame) > budget:
+                    if scheduler is not None:
+                        # No tracks to carry over without tracking: at least keep the nearest faces
+                        face_current_frame = sorted(face_current_frame,
+                                                    key=lambda f: (f[2] - f[0]) * (f[1] - f[3]), reverse=True)
+                    if _debug():
+                        print(f"[DEBUG] Too many faces detected ({len(face_current_frame)}), limiting to {budget}")
+                    face_current_frame = face_current_frame[:budget]
+                encode_boxes = [scale_box(loc, encode_factor) for loc in face_current_frame]
+                if encoder_pool is not None:
+                    # Show the newest finished encodings while this frame's faces are in flight
+                    if face_current_frame:
+                        encoder_pool.submit(encode_frame, encode_boxes, tag=(face_current_frame, detect_scale))
+                    else:
+                        self._async_faces = []
+                    timer.lap('encode')
+                    for (locations, scale), _, encodings in encoder_pool.poll():
+                        if face_current_frame and scale == detect_scale:
+                            self._async_faces = [(faceLoc,) + result
+                                                 for faceLoc, result in zip(locations, self.match_faces(encodings))]
+                    faces = self._async_faces
+                else:
+                    encode_current_frame = face_recognition.face_encodings(encode_frame, encode_boxes)
+                    timer.lap('encode')
+                    faces = [(faceLoc,) + result
+                             for faceLoc, result in zip(face_current_frame, self.match_faces(encode_current_frame))]
+                timer.lap('match')
+        except Exception as e:
+            # Log and continue to next frame
+            if _debug():
+                print(f"[DEBUG] Face processing error: {e}")
+            faces = []
+        if self.governor is not None:
+            self.governor.record('recognition', (time.perf_counter() - recognition_start) * 1000.0)
+        if self.crowd is not None:
+            if self.crowd.update(faces_in_view, now):
+                self.apply_crowd_mode()
+            # Identification throughput, plus silent attendance while a crowd is in view
+            self.crowd.observe({person for _, person, _ in faces if person is not None}, now)
+        self.faces = faces
+        return faces
+
+    def greet(self, greeter, speak, person: str, known_people, primary_person: Optional[str] = None,
+              now: Optional[float] = None):
+        """Greet the shown `person` ("Unknown" for a visitor); a crowd gets one greeting for everyone."""
+        if self.crowd is not None and self.crowd.active:
+            self.crowd.greet(speak, now)
+            if person != "Unknown":
+                # Arrivals are recorded, not announced
+                greeter.observe(known_people, now)
+        elif person != "Unknown":
+            greeter.greet_known(known_people, primary_person, now=now)
+        else:
+            greeter.greet_unknown(now=now)
+
+    def end_frame(self, frame_ms: float):
+        """Report the whole frame's time to the governor and apply what it decides."""
+        if self.governor is not None:
+            self.governor.record('frame', frame_ms)
+            if self.governor.update(bool(self.faces)):
+                self.apply_governor()
+
+    def apply_governor(self):
+        """Push the governor's current decisions into the components."""
+        governor = self.governor
+        if governor.scale != self.scale:
+            if self.tracker is not None:
+                self.tracker.rescale(governor.scale / self.scale)
+            # In-flight results were computed at the old scale
+            self._async_faces = []
+            self.scale = governor.scale
+            if self.roi_detector is not None:
+                self.roi_detector.base_scale = self.scale
+        self.face_budget = governor.face_budget
+        if self.tracker is not None:
+            self.tracker.detect_interval = governor.detect_interval
+            if self.scheduler is None:
+                self.tracker.max_tracks = self.current_face_budget()
+        if self.scheduler is not None:
+            self.scheduler.max_faces = self.current_face_budget()
+
+    def apply_crowd_mode(self):
+        """Switch between per-person and throughput settings."""
+        crowd = self.crowd
+        budget = self.current_face_budget()
+        if self.scheduler is not None:
+            self.scheduler.max_faces = budget
+            self.scheduler.budget_ms = ENCODE_BUDGET_MS * (crowd.budget_factor if crowd.active else 1.0)
+        elif self.tracker is not None:
+            self.tracker.max_tracks = budget
+        if self.tracker is not None:
+            # Confirmed people are not re-verified while the crowd passes
+            self.tracker.reverify_seconds = 0 if crowd.active else REVERIFY_SECONDS
+
+    def summaries(self) -> list:
+        """(component, summary) for every enabled component, for the exit report."""
+        lines = []
+        if self.tracker is not None:
+            lines.append(('Tracking stats', self.tracker.summary()))
+        if self.governor is not None:
+            lines.append(('Governor state', self.governor.summary()))
+        if self.quality_gate is not None:
+            lines.append(('Quality gate stats', self.quality_gate.summary()))
+        lines.append(('Detector stats', self.detector.summary()))
+        stage = self.current_matcher()
+        while isinstance(stage, CandidateMatcher):
+            lines.append((type(stage).__name__, stage.summary()))
+            stage = stage.matcher
+        if self.crowd is not None:
+            lines.append(('Crowd mode stats', self.crowd.summary()))
+        if self.scheduler is not None:
+            lines.append(('Scheduler stats', self.scheduler.summary()))
+        if self.roi_detector is not None:
+            lines.append(('ROI detector stats', self.roi_detector.summary()))
+        if self.motion_gate is not None:
+            lines.append(('Motion gate stats', self.motion_gate.summary()))
+        if self.encoder_pool is not None:
+            lines.append(('Encoder pool stats', self.encoder_pool.summary()))
+        return lines
+
+    def close(self):
+        if self.encoder_pool is not None:
+            self.encoder_pool.close()
+            self.encoder_pool = None
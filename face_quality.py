@@ -0,0 +1,130 @@
+"""
+Cheap face quality gate, run before face_encodings.
+
+Motion-blurred, tiny, badly lit or profile faces almost never match. They
+still cost a full encoding, and they end up as "Unknown" (and a spurious
+"Hello there!"). `FaceQualityGate` scores each detected box from four cues,
+each mapped to 0..1:
+
+- size: face height in full-resolution pixels
+- sharpness: variance of the Laplacian of the grayscale crop
+- brightness: mean intensity of the crop
+- yaw: nose offset from the eye midpoint, from the 5-point landmarks
+
+The score is the geometric mean of the cues, so any cue near zero sinks it.
+Only faces scoring at least FACE_QUALITY_MIN_SCORE are encoded. Landmarks are
+the only non-trivial cost, so they are skipped when the pixel cues have
+already rejected the face. Rejections are counted by their weakest cue.
+"""
+import os
+from typing import List, Sequence
+
+import cv2
+import face_recognition
+import numpy as np
+
+QUALITY_MIN_SCORE = float(os.environ.get('FACE_QUALITY_MIN_SCORE', '0.4'))
+# Face height (full-resolution pixels) scoring 0 and 1
+QUALITY_MIN_SIZE = float(os.environ.get('FACE_QUALITY_MIN_SIZE', '60'))
+QUALITY_GOOD_SIZE = float(os.environ.get('FACE_QUALITY_GOOD_SIZE', '120'))
+# Laplacian variance (on the 64x64 crop) scoring 0 and 1
+QUALITY_MIN_SHARPNESS = float(os.environ.get('FACE_QUALITY_MIN_SHARPNESS', '25'))
+QUALITY_SHARPNESS = float(os.environ.get('FACE_QUALITY_SHARPNESS', '150'))
+# Nose offset from the eye midpoint, relative to eye distance, scoring 0 (profile)
+QUALITY_MAX_YAW = float(os.environ.get('FACE_QUALITY_MAX_YAW', '0.6'))
+QUALITY_LANDMARKS = os.environ.get('FACE_QUALITY_LANDMARKS', '1') == '1'
+# Crops are resized to this size before the pixel cues: cost is bounded, and blur is
+# measured at a fixed face resolution (like the encoder's aligned chip), whatever the box size
+_CROP_SIZE = 64
+CUES = ('size', 'sharpness', 'brightness', 'yaw')
+
+
+def _ramp(value: float, low: float, high: float) -> float:
+    if high <= low:
+        return 1.0 if value >= high else 0.0
+    return float(min(1.0, max(0.0, (value - low) / (high - low))))
+
+
+class FaceQualityGate:
+    def __init__(self, min_score: float = QUALITY_MIN_SCORE, min_size: float = QUALITY_MIN_SIZE,
+                 good_size: float = QUALITY_GOOD_SIZE, min_sharpness: float = QUALITY_MIN_SHARPNESS,
+                 sharpness: float = QUALITY_SHARPNESS,
+                 max_yaw: float = QUALITY_MAX_YAW, use_landmarks: bool = QUALITY_LANDMARKS):
+        self.min_score = min_score
+        self.min_size = min_size
+        self.good_size = good_size
+        self.min_sharpness = min_sharpness
+        self.sharpness = sharpness
+        self.max_yaw = max_yaw
+        self.use_landmarks = use_landmarks
+        self.stats = {'checked': 0, 'passed': 0, 'rejected': 0}
+        self.rejected_by = {cue: 0 for cue in CUES}
+
+    def assess(self, frame_rgb, box, frame_scale: float = 1.0):
+        """Score one (top, right, bottom, left) box of `frame_rgb`.
+
+        `frame_scale` is the frame's size relative to the full-resolution camera
+        frame (e.g. 0.25 for the detection frame), so size limits mean the same
+        thing at every detection scale. Returns (score, {cue: 0..1}).
+        """
+        h, w = frame_rgb.shape[:2]
+        top, right, bottom, left = box
+        top, bottom = max(0, top), min(h, bottom)
+        left, right = max(0, left), min(w, right)
+        cues = {'size': _ramp((bottom - top) / frame_scale, self.min_size, self.good_size)}
+        if bottom - top < 4 or right - left < 4:
+            cues.update(sharpness=0.0, brightness=0.0, yaw=0.0)
+            return 0.0, cues
+
+        crop = cv2.cvtColor(frame_rgb[top:bottom, left:right], cv2.COLOR_RGB2GRAY)
+        crop = cv2.resize(crop, (_CROP_SIZE, _CROP_SIZE), interpolation=cv2.INTER_AREA)
+        cues['sharpness'] = _ramp(cv2.Laplacian(crop, cv2.CV_32F).var(), self.min_sharpness, self.sharpness)
+        mean = float(crop.mean())
+        # Full score for mid-range exposure, falling off towards black or blown out
+        cues['brightness'] = min(_ramp(mean, 20.0, 60.0), 1.0 - _ramp(mean, 200.0, 245.0))
+
+        cues['yaw'] = 1.0
+        if self.use_landmarks and self._combine(cues) >= self.min_score:
+            cues['yaw'] = self._yaw_score(frame_rgb, box)
+        return self._combine(cues), cues
+
+    def _yaw_score(self, frame_rgb, box) -> float:
+        landmarks = face_recognition.face_landmarks(frame_rgb, [box], model='small')
+        if not landmarks:
+            return 0.0
+        points = landmarks[0]
+        left_eye = np.mean(points['left_eye'], axis=0)
+        right_eye = np.mean(points['right_eye'], axis=0)
+        nose = np.mean(points['nose_tip'], axis=0)
+        eye_distance = float(np.linalg.norm(right_eye - left_eye))
+        if eye_distance < 1.0:
+            return 0.0
+        offset = abs(float(nose[0] - (left_eye[0] + right_eye[0]) / 2.0)) / eye_distance
+        return 1.0 - _ramp(offset, 0.0, self.max_yaw)
+
+    @staticmethod
+    def _combine(cues: dict) -> float:
+        return float(np.prod(list(cues.values())) ** (1.0 / len(cues)))
+
+    def filter(self, frame_rgb, boxes: Sequence[tuple], frame_scale: float = 1.0) -> List[bool]:
+        """Keep-mask for `boxes`: True where the face is worth encoding."""
+        keep = []
+        for box in boxes:
+            score, cues = self.assess(frame_rgb, box, frame_scale)
+            self.stats['checked'] += 1
+            if score >= self.min_score:
+                self.stats['passed'] += 1
+                keep.append(True)
+            else:
+                self.stats['rejected'] += 1
+                self.rejected_by[min(cues, key=cues.get)] += 1
+                keep.append(False)
+                if os.environ.get('OMNIS_DEBUG') == '1':
+                    print(f"[DEBUG] quality reject score={score:.2f} "
+                          + ' '.join(f"{k}={v:.2f}" for k, v in cues.items()))
+        return keep
+
+    def summary(self) -> str:
+        s = self.stats
+        reasons = ' '.join(f"{cue}={n}" for cue, n in self.rejected_by.items())
+        return f"checked={s['checked']} passed={s['passed']} rejected={s['rejected']} ({reasons})"
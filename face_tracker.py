@@ -0,0 +1,329 @@
+"""
+Detect-then-track helper for the face loop in `main.py`.
+
+Full HOG detection only runs every `FACE_DETECT_INTERVAL` frames, or as soon as
+a track is lost. In between, face boxes are carried forward with a cheap OpenCV
+tracker or Lucas-Kanade optical flow. Each track keeps the identity it was
+matched to, so known faces are not re-encoded and re-matched on every frame.
+
+A track's identity is confirmed by voting: each encoding adds a vote, and the
+identity is settled once one name has FACE_CONFIRM_VOTES votes in the last
+FACE_CONFIRM_WINDOW, or at once when a match is closer than
+FACE_CONFIRM_DISTANCE. Confirmed tracks are not encoded again until they are
+lost, or until FACE_REVERIFY_SECONDS have passed and they are re-verified.
+During re-verification the track keeps its old identity.
+
+Boxes use the face_recognition convention: (top, right, bottom, left).
+"""
+import os
+import time
+import itertools
+from collections import Counter
+from typing import Callable, List, Optional
+
+import cv2
+import numpy as np
+
+# Run full detection every N frames (1 = every frame, i.e. no tracking benefit)
+DETECT_INTERVAL = int(os.environ.get('FACE_DETECT_INTERVAL', '5'))
+# 'flow' (optical flow, always available) or an OpenCV tracker: 'kcf', 'csrt', 'mil'
+TRACKER_TYPE = os.environ.get('FACE_TRACKER', 'flow').lower()
+# Minimum overlap for a fresh detection to inherit an existing track's identity
+IOU_MATCH = 0.3
+# Identity voting: votes needed within the last `window` encodings of a track
+CONFIRM_VOTES = int(os.environ.get('FACE_CONFIRM_VOTES', '3'))
+CONFIRM_WINDOW = int(os.environ.get('FACE_CONFIRM_WINDOW', '5'))
+# A match at least this close confirms on the spot (0 disables early confirmation)
+CONFIRM_DISTANCE = float(os.environ.get('FACE_CONFIRM_DISTANCE', '0.4'))
+# Confirmed identities are re-checked after this many seconds (0 = never)
+REVERIFY_SECONDS = float(os.environ.get('FACE_REVERIFY_SECONDS', '10'))
+
+_OPENCV_TRACKERS = {
+    'kcf': 'TrackerKCF_create',
+    'csrt': 'TrackerCSRT_create',
+    'mil': 'TrackerMIL_create',
+}
+
+_track_ids = itertools.count(1)
+
+
+def _iou(a, b) -> float:
+    top = max(a[0], b[0])
+    right = min(a[1], b[1])
+    bottom = min(a[2], b[2])
+    left = max(a[3], b[3])
+    inter = max(0, bottom - top) * max(0, right - left)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    return inter / float(area_a + area_b - inter)
+
+
+def _make_opencv_tracker(kind: str):
+    name = _OPENCV_TRACKERS.get(kind)
+    if name is None:
+        return None
+    factory = getattr(cv2, name, None)
+    if factory is None and hasattr(cv2, 'legacy'):
+        factory = getattr(cv2.legacy, name, None)
+    return factory() if factory is not None else None
+
+
+class Track:
+    """A face box carried between detections, plus the identity it was given."""
+
+    def __init__(self, location):
+        self.id = next(_track_ids)
+        self.location = tuple(int(v) for v in location)
+        # Confirmed person name, None while unconfirmed or unknown
+        self.person: Optional[str] = None
+        # Mean distance of the confirming votes; None until the first confirmation
+        self.distance: Optional[float] = None
+        # False while the track still needs encodings (voting or re-verifying)
+        self.identified = False
+        self.votes: List[tuple] = []  # recent (person or None, distance)
+        self.confirmed_at: Optional[float] = None
+        # True while an encoding for this track is being computed elsewhere (encoder pool)
+        self.in_flight = False
+        self.age = 0
+        self._cv_tracker = None
+        self._points = None
+
+    @property
+    def needs_encoding(self) -> bool:
+        return not self.identified and not self.in_flight
+
+    def area(self) -> int:
+        top, right, bottom, left = self.location
+        return max(0, bottom - top) * max(0, right - left)
+
+
+class FaceTracker:
+    """Carries face boxes between periodic HOG detections.
+
+    Call `update()` once per frame with the (small, RGB) frame and a detector
+    such as `face_recognition.face_locations`; then encode only the tracks in
+    `pending()` and report their identities back through `assign()`.
+    """
+
+    def __init__(self, detect_interval: int = DETECT_INTERVAL, tracker_type: str = TRACKER_TYPE,
+                 max_tracks: int = 4, confirm_votes: int = CONFIRM_VOTES, confirm_window: int = CONFIRM_WINDOW,
+                 confirm_distance: float = CONFIRM_DISTANCE, reverify_seconds: float = REVERIFY_SECONDS):
+        self.detect_interval = max(1, detect_interval)
+        self.tracker_type = tracker_type
+        if tracker_type != 'flow' and _make_opencv_tracker(tracker_type) is None:
+            print(f"[FaceTracker] Tracker '{tracker_type}' not available in this OpenCV build, using optical flow")
+            self.tracker_type = 'flow'
+        self.max_tracks = max_tracks
+        self.confirm_votes = max(1, confirm_votes)
+        self.confirm_window = max(self.confirm_votes, confirm_window)
+        self.confirm_distance = confirm_distance
+        self.reverify_seconds = reverify_seconds
+        self.tracks: List[Track] = []
+        # Faces found by the last detection, including those beyond max_tracks
+        self.faces_detected = 0
+        self._prev_gray = None
+        self._frames_since_detect = None
+        self.force_detect = False
+        self.stats = {
+            'frames': 0,
+            'detections_run': 0,
+            'detections_skipped': 0,
+            'encodings_run': 0,
+            'encodings_skipped': 0,
+            'tracks_lost': 0,
+            'confirmations': 0,
+            'identity_changes': 0,
+            'reverifications': 0,
+        }
+
+    # -- per-frame entry points -------------------------------------------
+
+    def update(self, frame, detect: Callable) -> List[Track]:
+        """Advance all tracks to `frame`, running `detect(frame)` when due."""
+        self.stats['frames'] += 1
+        gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        lost = self._propagate(frame, gray)
+
+        due = (self._frames_since_detect is None
+               or self._frames_since_detect + 1 >= self.detect_interval
+               or lost or self.force_detect)
+        if due:
+            self._detect(frame, gray, detect)
+        else:
+            self._frames_since_detect += 1
+            self.stats['detections_skipped'] += 1
+
+        self._prev_gray = gray
+        return list(self.tracks)
+
+    def pending(self) -> List[Track]:
+        """Tracks that still need an encoding; identified tracks count as skipped encodings."""
+        if self.reverify_seconds > 0:
+            now = time.monotonic()
+            for track in self.tracks:
+                if (track.identified and track.person is not None
+                        and now - track.confirmed_at >= self.reverify_seconds):
+                    # Vote again from scratch; the current identity stays on display meanwhile
+                    track.identified = False
+                    track.votes = []
+                    self.stats['reverifications'] += 1
+        todo = [t for t in self.tracks if t.needs_encoding]
+        self.stats['encodings_skipped'] += sum(1 for t in self.tracks if t.identified)
+        return todo
+
+    def assign(self, track: Track, person: Optional[str], distance: Optional[float]):
+        """Add the match result of a freshly encoded track as a vote; confirms the identity when settled."""
+        self.stats['encodings_run'] += 1
+        track.in_flight = False
+        track.votes = (track.votes + [(person, distance)])[-self.confirm_window:]
+        if person is not None and distance is not None and distance <= self.confirm_distance:
+            self._confirm(track, person)
+            return
+        counts = Counter(p for p, _ in track.votes)
+        # Most votes wins; ties go to the name with the smaller mean distance
+        leader = min(counts, key=lambda p: (-counts[p], self._mean_distance(track, p)))
+        if counts[leader] >= self.confirm_votes or len(track.votes) >= self.confirm_window:
+            self._confirm(track, leader)
+
+    @staticmethod
+    def _mean_distance(track: Track, person: Optional[str]) -> float:
+        distances = [d for p, d in track.votes if p == person and d is not None]
+        return sum(distances) / len(distances) if distances else float('inf')
+
+    def _confirm(self, track: Track, person: Optional[str]):
+        if track.distance is not None and person != track.person:
+            self.stats['identity_changes'] += 1
+        self.stats['confirmations'] += 1
+        track.person = person
+        track.distance = self._mean_distance(track, person)
+        track.identified = True
+        track.confirmed_at = time.monotonic()
+
+    def get(self, track_id: int) -> Optional[Track]:
+        for track in self.tracks:
+            if track.id == track_id:
+                return track
+        return None
+
+    def rescale(self, factor: float):
+        """The detection frame changed size: scale the boxes and re-anchor them with a fresh detection."""
+        for track in self.tracks:
+            track.location = tuple(int(round(v * factor)) for v in track.location)
+        self._prev_gray = None
+        self.force_detect = True
+
+    def reset(self):
+        self.tracks = []
+        self._prev_gray = None
+        self._frames_since_detect = None
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"frames={s['frames']} detections={s['detections_run']} skipped_detections={s['detections_skipped']} "
+                f"encodings={s['encodings_run']} skipped_encodings={s['encodings_skipped']} lost={s['tracks_lost']} "
+                f"confirmations={s['confirmations']} changes={s['identity_changes']} reverified={s['reverifications']}")
+
+    # -- internals --------------------------------------------------------
+
+    def _detect(self, frame, gray, detect: Callable):
+        self.stats['detections_run'] += 1
+        self._frames_since_detect = 0
+        self.force_detect = False
+        boxes = list(detect(frame))
+        self.faces_detected = len(boxes)
+        boxes = boxes[:self.max_tracks]
+
+        # Greedy IoU association: a detection that overlaps a live track keeps its identity
+        pairs = sorted(((_iou(t.location, b), ti, bi)
+                        for ti, t in enumerate(self.tracks) for bi, b in enumerate(boxes)), reverse=True)
+        used_t, used_b = set(), set()
+        tracks = []
+        for score, ti, bi in pairs:
+            if score < IOU_MATCH:
+                break
+            if ti in used_t or bi in used_b:
+                continue
+            used_t.add(ti)
+            used_b.add(bi)
+            track = self.tracks[ti]
+            track.location = tuple(int(v) for v in boxes[bi])
+            # Unknown faces get another chance to match at every detection
+            if track.person is None:
+                track.identified = False
+            tracks.append(track)
+        for bi, box in enumerate(boxes):
+            if bi not in used_b:
+                tracks.append(Track(box))
+
+        self.tracks = tracks
+        for track in self.tracks:
+            self._init_track(track, frame, gray)
+
+    def _init_track(self, track: Track, frame, gray):
+        track.age = 0
+        if self.tracker_type == 'flow':
+            track._points = self._good_points(gray, track.location)
+            return
+        top, right, bottom, left = track.location
+        track._cv_tracker = _make_opencv_tracker(self.tracker_type)
+        track._cv_tracker.init(frame, (left, top, right - left, bottom - top))
+
+    def _propagate(self, frame, gray) -> bool:
+        if not self.tracks or self._prev_gray is None:
+            return False
+        h, w = gray.shape[:2]
+        alive = []
+        for track in self.tracks:
+            box = self._step_flow(track, gray) if self.tracker_type == 'flow' else self._step_cv(track, frame)
+            if box is not None:
+                top, right, bottom, left = box
+                top, left = max(0, top), max(0, left)
+                bottom, right = min(h, bottom), min(w, right)
+                if bottom - top > 2 and right - left > 2:
+                    track.location = (top, right, bottom, left)
+                    track.age += 1
+                    alive.append(track)
+                    continue
+            self.stats['tracks_lost'] += 1
+        lost = len(alive) < len(self.tracks)
+        self.tracks = alive
+        return lost
+
+    def _step_cv(self, track: Track, frame):
+        ok, (x, y, bw, bh) = track._cv_tracker.update(frame)
+        if not ok:
+            return None
+        x, y, bw, bh = int(x), int(y), int(bw), int(bh)
+        return (y, x + bw, y + bh, x)
+
+    def _step_flow(self, track: Track, gray):
+        pts = track._points
+        if pts is None or len(pts) < 3:
+            return None
+        nxt, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, pts, None,
+                                                  winSize=(9, 9), maxLevel=2)
+        if nxt is None:
+            return None
+        good = status.reshape(-1) == 1
+        if good.sum() < 3:
+            return None
+        shift = np.median(nxt[good] - pts[good], axis=0).reshape(-1)
+        dx, dy = int(round(float(shift[0]))), int(round(float(shift[1])))
+        track._points = nxt[good].reshape(-1, 1, 2)
+        top, right, bottom, left = track.location
+        return (top + dy, right + dx, bottom + dy, left + dx)
+
+    @staticmethod
+    def _good_points(gray, location):
+        top, right, bottom, left = location
+        mask = np.zeros_like(gray)
+        mask[max(0, top):bottom, max(0, left):right] = 255
+        pts = cv2.goodFeaturesToTrack(gray, maxCorners=25, qualityLevel=0.01, minDistance=2, mask=mask)
+        if pts is None or len(pts) < 3:
+            # Low-texture or tiny faces: fall back to a coarse grid inside the box
+            xs = np.linspace(left, right, 4)[1:-1]
+            ys = np.linspace(top, bottom, 4)[1:-1]
+            pts = np.array([[[x, y]] for y in ys for x in xs], dtype=np.float32)
+        return pts.astype(np.float32)
@@ -0,0 +1,157 @@
+"""
+Threaded latest-frame camera source shared by the vision loops.
+
+A background thread keeps calling `cv2.VideoCapture.read()` and stores frames in
+a small ring buffer, so the (slow) recognition step always works on the newest
+frame instead of one that sat stale in the driver buffer. Stale frames are
+dropped and counted. Camera errors trigger a reconnect instead of killing the loop.
+
+A video file path works as the source too, which makes the pipeline testable
+without a camera. Use `drop_frames=False` to deliver every frame of a file.
+
+Usage:
+    cap = LatestFrameCapture(0).start()
+    ok, img = cap.read()                  # drop-in for VideoCapture.read()
+    img, ts = cap.read_latest()           # frame plus its capture timestamp
+    cap.release()
+"""
+import os
+import threading
+import time
+from collections import deque
+
+import cv2
+
+# Camera index or video file path; OMNIS_CAMERA overrides the default index 0
+DEFAULT_SOURCE = os.environ.get('OMNIS_CAMERA', '0')
+
+
+def _parse_source(source):
+    if isinstance(source, str) and source.isdigit():
+        return int(source)
+    return source
+
+
+class LatestFrameCapture(threading.Thread):
+    def __init__(self, source=DEFAULT_SOURCE, buffer_size: int = 1, drop_frames: bool = True,
+                 reconnect_delay: float = 1.0, loop: bool = False, open_timeout: float = 5.0):
+        super().__init__(daemon=True)
+        self.source = _parse_source(source)
+        self.is_file = isinstance(self.source, str)
+        self.drop_frames = drop_frames
+        self.reconnect_delay = reconnect_delay
+        self.loop = loop
+        self.open_timeout = open_timeout
+        self._opened = False  # result of the last VideoCapture open
+        self._open_done = threading.Event()
+        self._buffer = deque(maxlen=max(1, buffer_size))
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._finished = False
+        self._seq = 0
+        self._cap = None
+        self.stats = {'grabbed': 0, 'dropped': 0, 'delivered': 0, 'errors': 0, 'reconnects': 0}
+
+    # -- producer ---------------------------------------------------------
+
+    def _open(self) -> bool:
+        if self._cap is not None:
+            self._cap.release()
+        self._cap = cv2.VideoCapture(self.source)
+        if not self.is_file:
+            # Keep the driver-side queue short; we do our own buffering
+            self._cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self._opened = self._cap.isOpened()
+        self._open_done.set()
+        return self._opened
+
+    def run(self):
+        if not self._open():
+            print(f"[Capture] Could not open source {self.source!r}")
+        while not self._stop_event.is_set():
+            ok, frame = self._cap.read() if self._cap is not None else (False, None)
+            ts = time.time()
+            if not ok or frame is None:
+                if self.is_file:
+                    if self.loop and self._cap.isOpened():
+                        self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        continue
+                    break
+                self.stats['errors'] += 1
+                print(f"[Capture] Camera error - reconnecting in {self.reconnect_delay}s...")
+                self._stop_event.wait(self.reconnect_delay)
+                self._open()
+                self.stats['reconnects'] += 1
+                continue
+
+            with self._cond:
+                if not self.drop_frames:
+                    # Lossless mode: wait for the consumer to take the buffered frames
+                    while len(self._buffer) == self._buffer.maxlen and not self._stop_event.is_set():
+                        self._cond.wait(0.1)
+                elif len(self._buffer) == self._buffer.maxlen:
+                    self.stats['dropped'] += 1
+                self._seq += 1
+                self._buffer.append((self._seq, frame, ts))
+                self.stats['grabbed'] += 1
+                self._cond.notify_all()
+
+        with self._cond:
+            self._finished = True
+            self._cond.notify_all()
+        if self._cap is not None:
+            self._cap.release()
+
+    # -- consumer ---------------------------------------------------------
+
+    def start(self):
+        """Start the reader thread and wait (up to `open_timeout`) until the source has been opened."""
+        super().start()
+        self._open_done.wait(self.open_timeout)
+        return self
+
+    def read_latest(self, timeout: float = 1.0):
+        """Return (frame, capture_timestamp) for the newest unseen frame, or (None, None)."""
+        deadline = time.time() + timeout
+        with self._cond:
+            while not self._buffer:
+                remaining = deadline - time.time()
+                if self._finished or remaining <= 0:
+                    return None, None
+                self._cond.wait(remaining)
+            if self.drop_frames:
+                _, frame, ts = self._buffer.pop()
+                self.stats['dropped'] += len(self._buffer)
+                self._buffer.clear()
+            else:
+                _, frame, ts = self._buffer.popleft()
+            self.stats['delivered'] += 1
+            self._cond.notify_all()
+        return frame, ts
+
+    def read(self, timeout: float = 1.0):
+        """VideoCapture-compatible read(): returns (ok, frame)."""
+        frame, _ = self.read_latest(timeout)
+        return frame is not None, frame
+
+    def isOpened(self) -> bool:
+        """True while the source is open; False if opening it failed (or has not finished yet)."""
+        return self._opened and not self._finished and not self._stop_event.is_set()
+
+    @property
+    def finished(self) -> bool:
+        """True once a non-looping file source has been read to the end."""
+        with self._cond:
+            return self._finished and not self._buffer
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"grabbed={s['grabbed']} delivered={s['delivered']} dropped={s['dropped']} "
+                f"errors={s['errors']} reconnects={s['reconnects']}")
+
+    def release(self):
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self.is_alive():
+            self.join(timeout=2.0)
@@ -0,0 +1,129 @@
+"""
+Adaptive frame-rate governor for the recognition loop.
+
+main.py used to process frames as fast as it could with a fixed MAX_FACES cap:
+under load the preview lagged, and when idle it burned CPU for nothing.
+`FrameGovernor` watches smoothed per-stage latencies and turns three knobs
+to hold a target frame time:
+
+- detection interval (tracking mode): frames between full HOG detections
+- downscale factor: resolution of the detection frame
+- face budget: how many faces are encoded per frame
+
+It backs off (longer interval, smaller scale) while no faces are around and
+ramps up as soon as someone appears. Every change is logged, and `metrics()`
+returns the current state for dashboards and the timing dump.
+"""
+import os
+import time
+
+# Target wall time for one display frame, and the ceiling for the recognition stage
+TARGET_FRAME_MS = float(os.environ.get('FACE_TARGET_FRAME_MS', '100'))
+MAX_RECOGNITION_MS = float(os.environ.get('FACE_MAX_RECOGNITION_MS', '300'))
+# Detection scales the governor may choose from, smallest first
+GOVERNOR_SCALES = tuple(float(s) for s in os.environ.get('FACE_GOVERNOR_SCALES', '0.2,0.25,0.33').split(','))
+# Frames without faces before backing off
+IDLE_FRAMES = int(os.environ.get('FACE_GOVERNOR_IDLE_FRAMES', '30'))
+
+
+class FrameGovernor:
+    def __init__(self, scale: float = 0.25, detect_interval: int = 5, face_budget: int = 4,
+                 target_frame_ms: float = TARGET_FRAME_MS, max_recognition_ms: float = MAX_RECOGNITION_MS,
+                 scales=GOVERNOR_SCALES, min_interval: int = 1, max_interval: int = 15,
+                 idle_frames: int = IDLE_FRAMES, window: int = 10, smoothing: float = 0.2):
+        self.scales = tuple(sorted(set(scales) | {scale}))
+        self.scale = scale
+        self.base_scale = scale
+        self.detect_interval = detect_interval
+        self.base_interval = detect_interval
+        self.face_budget = face_budget
+        self.max_face_budget = face_budget
+        self.target_frame_ms = target_frame_ms
+        self.max_recognition_ms = max_recognition_ms
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.idle_frames = idle_frames
+        self.window = window
+        self.smoothing = smoothing
+        self.latency_ms = {}  # stage -> exponentially smoothed latency
+        self._frames = 0
+        self._frames_without_faces = 0
+        self._idle = False
+        self.decisions = 0
+
+    def record(self, stage: str, ms: float):
+        prev = self.latency_ms.get(stage)
+        self.latency_ms[stage] = ms if prev is None else prev + self.smoothing * (ms - prev)
+
+    def update(self, faces_present: bool) -> bool:
+        """Call once per frame after recording latencies. Returns True if a knob changed."""
+        self._frames += 1
+        if faces_present:
+            self._frames_without_faces = 0
+            if self._idle:
+                # Someone approached: go straight back to the responsive settings
+                self._idle = False
+                return self._set('someone approached', scale=max(self.scale, self.base_scale),
+                                 detect_interval=min(self.detect_interval, self.base_interval))
+        else:
+            self._frames_without_faces += 1
+            if not self._idle and self._frames_without_faces >= self.idle_frames:
+                self._idle = True
+                return self._set('idle', scale=self.scales[0],
+                                 detect_interval=min(self.max_interval, self.detect_interval * 2))
+
+        if self._frames % self.window:
+            return False
+        frame_ms = self.latency_ms.get('frame', 0.0)
+        recog_ms = self.latency_ms.get('recognition', 0.0)
+        over = frame_ms > self.target_frame_ms or recog_ms > self.max_recognition_ms
+        under = frame_ms < 0.6 * self.target_frame_ms and recog_ms < 0.6 * self.max_recognition_ms
+        if over:
+            # Cheapest degradation first: detect less often, then encode fewer faces, then shrink
+            if self.detect_interval < self.max_interval:
+                return self._set('over budget', detect_interval=self.detect_interval + 1)
+            if self.face_budget > 1:
+                return self._set('over budget', face_budget=self.face_budget - 1)
+            if self.scale > self.scales[0]:
+                return self._set('over budget', scale=self._step_scale(-1))
+        elif under and not self._idle:
+            # Headroom: restore in reverse order
+            if self.scale < self.base_scale:
+                return self._set('headroom', scale=self._step_scale(+1))
+            if self.face_budget < self.max_face_budget:
+                return self._set('headroom', face_budget=self.face_budget + 1)
+            if self.detect_interval > self.min_interval:
+                return self._set('headroom', detect_interval=self.detect_interval - 1)
+        return False
+
+    def _step_scale(self, direction: int) -> float:
+        i = self.scales.index(self.scale) + direction
+        return self.scales[max(0, min(len(self.scales) - 1, i))]
+
+    def _set(self, reason: str, **changes) -> bool:
+        changed = {k: v for k, v in changes.items() if getattr(self, k) != v}
+        if not changed:
+            return False
+        before = {k: getattr(self, k) for k in changed}
+        for k, v in changed.items():
+            setattr(self, k, v)
+        self.decisions += 1
+        latencies = ' '.join(f"{k}={v:.0f}ms" for k, v in sorted(self.latency_ms.items()))
+        print(f"[Governor] {reason}: " + ', '.join(f"{k} {before[k]}->{v}" for k, v in changed.items())
+              + f" ({latencies})")
+        return True
+
+    def metrics(self) -> dict:
+        return {
+            'time': time.time(),
+            'scale': self.scale,
+            'detect_interval': self.detect_interval,
+            'face_budget': self.face_budget,
+            'idle': self._idle,
+            'decisions': self.decisions,
+            'latency_ms': dict(self.latency_ms),
+        }
+
+    def summary(self) -> str:
+        return (f"scale={self.scale} detect_interval={self.detect_interval} face_budget={self.face_budget} "
+                f"idle={self._idle} decisions={self.decisions}")
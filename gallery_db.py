@@ -0,0 +1,293 @@
+"""
+SQLite gallery store with several templates per person.
+
+The file gallery (gallery_file.py) holds one row per enrolled photo, and a
+person is only a name taken from a file stem. For a whole school that is not
+enough. Here a gallery is a SQLite database in WAL mode, so the kiosk can
+read while a registration writes. It has three tables:
+
+- persons    one row per person: display name, a unique key (the
+             register_face._safe_name form, so "Ann Lee" and "ANN_LEE" are
+             the same person), class, block, role
+- templates  several encodings per person (float32 blobs) with a quality
+             score, capture time and source ('enrolment', 'registration', ...)
+- metadata   key/value pairs; 'generation' is bumped by every write
+
+`load_db` reads all templates in a single query into one contiguous
+N x 128 float32 matrix. It returns a regular `Gallery`, with names per row
+and a row -> person id map, so FaceMatcher and the rest of the pipeline do
+not change. Matching aggregates per person: the minimum distance over that
+person's templates, or the distance to their centroid
+(FACE_MATCH_AGGREGATE, see face_matcher.py).
+
+FACE_GALLERY_DB=images/gallery.db makes load_gallery, register_face and
+EncodeGenerator use the database instead of the .npy files:
+
+    python gallery_db.py import          # copy the current file gallery in
+    python gallery_db.py info
+    python gallery_db.py set-person AAHIL --class 7B --block A --role student
+    python gallery_db.py bench --templates 10000
+"""
+import os
+import time
+import sqlite3
+import argparse
+from typing import Optional
+
+import numpy as np
+
+from gallery_file import Gallery, GalleryError, DIM, GALLERY_DB
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS persons (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    class TEXT,
+    block TEXT,
+    role TEXT,
+    created TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS templates (
+    id INTEGER PRIMARY KEY,
+    person_id INTEGER NOT NULL REFERENCES persons(id) ON DELETE CASCADE,
+    encoding BLOB NOT NULL,
+    quality REAL,
+    captured TEXT NOT NULL,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS templates_person ON templates(person_id);
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+PERSON_FIELDS = ('class', 'block', 'role')
+
+
+def person_key(name: str) -> str:
+    """Same normalisation as register_face._safe_name."""
+    return '_'.join(name.replace('\n', ' ').replace('\r', ' ').split()).upper()
+
+
+def _now() -> str:
+    return time.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+class GalleryDB:
+    def __init__(self, path: str = GALLERY_DB):
+        if not path:
+            raise GalleryError("no gallery database configured (set FACE_GALLERY_DB)")
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        # isolation_level=None: transactions are explicit (see _write)
+        self.conn = sqlite3.connect(path, timeout=10.0, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA foreign_keys=ON')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write(self, fn):
+        """Run fn(conn) in one transaction and bump the generation with it."""
+        conn = self.conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = fn(conn)
+            conn.execute("INSERT INTO metadata(key, value) VALUES ('generation', '1') "
+                         "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return result
+
+    def generation(self) -> int:
+        row = self.conn.execute("SELECT value FROM metadata WHERE key = 'generation'").fetchone()
+        return int(row[0]) if row else 0
+
+    @staticmethod
+    def _person_id(conn, name: str) -> int:
+        """Id of the person with this key, created on first use."""
+        key = person_key(name)
+        row = conn.execute('SELECT id FROM persons WHERE key = ?', (key,)).fetchone()
+        if row is not None:
+            return row[0]
+        cur = conn.execute('INSERT INTO persons(key, name, created) VALUES (?, ?, ?)', (key, name, _now()))
+        return cur.lastrowid
+
+    def set_person(self, name: str, **fields) -> int:
+        """Create the person if needed and update class/block/role (None leaves a field unchanged)."""
+        def write(conn):
+            pid = self._person_id(conn, name)
+            for field in PERSON_FIELDS:
+                if fields.get(field) is not None:
+                    conn.execute(f'UPDATE persons SET {field} = ? WHERE id = ?', (fields[field], pid))
+            return pid
+        return self._write(write)
+
+    def add_template(self, name: str, encoding, quality: Optional[float] = None, source: str = 'registration',
+                     captured: Optional[str] = None) -> tuple:
+        """Add one encoding for `name`, creating the person if needed. Returns (person id, templates of that person)."""
+        blob = np.asarray(encoding, dtype=np.float32).reshape(DIM).tobytes()
+
+        def write(conn):
+            pid = self._person_id(conn, name)
+            conn.execute('INSERT INTO templates(person_id, encoding, quality, captured, source) VALUES (?, ?, ?, ?, ?)',
+                         (pid, blob, quality, captured or _now(), source))
+            count, = conn.execute('SELECT COUNT(*) FROM templates WHERE person_id = ?', (pid,)).fetchone()
+            return pid, count
+        return self._write(write)
+
+    def replace_source(self, gallery: Gallery, source: str = 'enrolment') -> int:
+        """Replace every template from `source` with the rows of `gallery` (e.g. a fresh EncodeGenerator run).
+
+        Rows of a file gallery that came from the registration journal stay 'registration' templates;
+        one already stored (the same encoding) is not added again, so a repeated import is harmless.
+        """
+        def write(conn):
+            conn.execute('DELETE FROM templates WHERE source = ?', (source,))
+            registered = {r[0] for r in conn.execute("SELECT encoding FROM templates WHERE source = 'registration'")}
+            matrix = np.asarray(gallery.encodings, dtype=np.float32).reshape(-1, DIM)
+            rows = []
+            for i, name in enumerate(gallery.names):
+                meta = gallery.meta[i] if gallery.meta else {}
+                # Enrolment rows carry their photo path as 'source'; only the registration tag is kept
+                row_source = 'registration' if meta.get('source') == 'registration' else source
+                encoding = matrix[i].tobytes()
+                if row_source == 'registration' and encoding in registered:
+                    continue
+                rows.append((self._person_id(conn, name), encoding, meta.get('quality'),
+                             meta.get('added') or _now(), row_source))
+            conn.executemany('INSERT INTO templates(person_id, encoding, quality, captured, source) '
+                             'VALUES (?, ?, ?, ?, ?)', rows)
+            return len(rows)
+        return self._write(write)
+
+    def persons(self) -> dict:
+        """person id -> {'key', 'name', 'class', 'block', 'role', 'templates'}."""
+        rows = self.conn.execute('SELECT p.id, p.key, p.name, p.class, p.block, p.role, COUNT(t.id) '
+                                 'FROM persons p LEFT JOIN templates t ON t.person_id = p.id GROUP BY p.id')
+        return {r[0]: {'key': r[1], 'name': r[2], 'class': r[3], 'block': r[4], 'role': r[5], 'templates': r[6]}
+                for r in rows}
+
+    def load(self) -> Gallery:
+        """Bulk-load every template into one contiguous matrix, ordered by person."""
+        persons = self.persons()
+        rows = self.conn.execute('SELECT person_id, encoding, quality, captured, source FROM templates '
+                                 'ORDER BY person_id, id').fetchall()
+        if rows:
+            matrix = np.frombuffer(b''.join(r[1] for r in rows), dtype=np.float32).reshape(-1, DIM)
+        else:
+            matrix = np.zeros((0, DIM), dtype=np.float32)
+        row_person = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        names = [persons[r[0]]['name'] for r in rows]
+        meta = [{'name': persons[r[0]]['name'], 'person_id': r[0], 'quality': r[2], 'added': r[3], 'source': r[4]}
+                for r in rows]
+        gallery = Gallery(matrix, names, meta, generation=self.generation(), path=self.path, source=self.path)
+        gallery.row_person = row_person
+        gallery.persons = persons
+        return gallery
+
+
+def load_db(path: str = GALLERY_DB) -> Gallery:
+    with GalleryDB(path) as db:
+        return db.load()
+
+
+def _bench(n_templates: int, per_person: int, repeats: int):
+    """Load time of `n_templates` from SQLite versus the .npy gallery, and per-person match latency."""
+    import tempfile
+    from bench_gallery_index import synthetic_gallery, synthetic_queries
+    from gallery_file import save_gallery, load_gallery
+    from face_matcher import FaceMatcher
+
+    n_people = max(1, -(-n_templates // per_person))
+    people = synthetic_gallery(n_people)
+    rng = np.random.default_rng(7)
+    owner = np.repeat(np.arange(n_people), per_person)[:n_templates]
+    templates = people[owner] + rng.normal(0.0, 0.2 / np.sqrt(DIM), (len(owner), DIM)).astype(np.float32)
+    names = [f"P{i:05d}" for i in owner]
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        start = time.perf_counter()
+        with GalleryDB(db_path) as db:
+            db.replace_source(Gallery(templates, names))
+        print(f"templates={len(owner)} people={n_people} import={(time.perf_counter() - start) * 1000:.0f} ms "
+              f"db={os.path.getsize(db_path) / 1e6:.1f} MB")
+        npy_path = os.path.join(tmp, 'bench')
+        save_gallery(templates, names, npy_path)
+
+        def best_ms(fn):
+            times = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                result = fn()
+                times.append((time.perf_counter() - start) * 1000.0)
+            return min(times), result
+
+        ms, gallery = best_ms(lambda: load_db(db_path))
+        print(f"  sqlite load: {ms:8.1f} ms  ({gallery.describe()})")
+        ms, _ = best_ms(lambda: np.array(load_gallery(npy_path, verify=False).encodings))
+        print(f"  .npy load:   {ms:8.1f} ms  (read into memory)")
+
+        queries, truth = synthetic_queries(people, 200)
+        for aggregate in ('min', 'centroid'):
+            matcher = FaceMatcher(gallery.encodings, gallery.names, aggregate=aggregate)
+            start = time.perf_counter()
+            for i in range(0, len(queries), 4):
+                matcher.identify(queries[i:i + 4])
+            per_frame = (time.perf_counter() - start) * 1000.0 / (len(queries) / 4)
+            found = [name for name, _ in matcher.identify(queries)]
+            correct = np.mean([(f == (f"P{t:05d}" if t >= 0 else None)) for f, t in zip(found, truth)])
+            print(f"  match {aggregate:>8}: {per_frame:6.2f} ms per 4-face frame, "
+                  f"{len(matcher)} rows, correct={correct:.3f}")
+
+
+def _main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('import', help='copy the .npy (or legacy pickle) gallery and its registrations in')
+    sub.add_parser('info')
+    person = sub.add_parser('set-person')
+    person.add_argument('name')
+    for field in PERSON_FIELDS:
+        person.add_argument('--' + field)
+    bench = sub.add_parser('bench')
+    bench.add_argument('--templates', type=int, nargs='+', default=[10000])
+    bench.add_argument('--per-person', type=int, default=3)
+    bench.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--db', default=GALLERY_DB or 'images/gallery.db')
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        for n in args.templates:
+            _bench(n, args.per_person, args.repeats)
+        return
+    with GalleryDB(args.db) as db:
+        if args.command == 'import':
+            from gallery_file import load_file_gallery
+            gallery = load_file_gallery()
+            count = db.replace_source(gallery)
+            print(f"Imported {count} templates from {gallery.source}: {db.load().describe()}")
+        elif args.command == 'info':
+            gallery = db.load()
+            print(gallery.describe())
+            for p in sorted(gallery.persons.values(), key=lambda p: p['key']):
+                extra = ' '.join(f"{f}={p[f]}" for f in PERSON_FIELDS if p[f])
+                print(f"  {p['key']}: {p['templates']} templates {extra}".rstrip())
+        else:
+            db.set_person(args.name, **{f: getattr(args, f) for f in PERSON_FIELDS})
+            print(f"Updated {person_key(args.name)}")
+
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,483 @@
+"""
+Versioned binary gallery file.
+
+The gallery used to be a pickled (encodings, names) pair kept in two copies:
+encoded_file.p, written by register_face.py, and images/encoded_file.p,
+read by main.py. Registrations therefore never reached the kiosk. Every
+entry point now goes through this module, and the gallery is stored as two
+files next to each other:
+
+- <path>.g<generation>.npy   float32 N x 128 matrix in standard .npy
+               layout, loaded with np.load(mmap_mode='r'), so startup does
+               not copy it (galleries saved before generations: <path>.npy)
+- <path>.json  index: format version, count, dtype, sha256 of the matrix
+               bytes, the matrix file name, a generation number bumped on
+               every save, and one metadata entry (name, source, added) per row
+
+A save writes and fsyncs a new matrix file, then replaces the index that
+names it. That replace is the single commit point: after a crash the index
+names either the old matrix or the new one, never a mix of the two. The
+previous generation is kept for readers still opening it; older ones are
+deleted.
+
+Live registrations do not rewrite the matrix. They go to an append-only
+journal, <path>.journal: a 32-byte header, then fixed-size records (name,
+timestamp, 128 float32, crc32), each fsync'd before register_name returns.
+`load_gallery` merges the journal in memory, and a torn last record is
+ignored. Once FACE_JOURNAL_COMPACT records have accumulated, the journal is
+compacted into the matrix in the background. The index remembers how many
+records of which journal it already holds, so a crash in the middle of a
+compaction cannot apply a registration twice.
+
+FACE_GALLERY sets <path> (default images/gallery). FACE_GALLERY_DB switches
+every entry point to the SQLite store instead (see gallery_db.py). When the new files do not
+exist yet, `load_gallery` falls back to the legacy pickles and merges both
+copies. Convert them once with:
+
+    python gallery_file.py migrate
+    python gallery_file.py info
+    python gallery_file.py verify
+    python gallery_file.py compact
+"""
+import os
+import json
+import time
+import uuid
+import zlib
+import struct
+import pickle
+import hashlib
+import glob
+import argparse
+import threading
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; the journal is then unlocked
+    fcntl = None
+
+GALLERY_PATH = os.environ.get('FACE_GALLERY', 'images/gallery')
+# Set to 0 to skip the checksum pass at startup (it reads the whole matrix once)
+GALLERY_VERIFY = os.environ.get('FACE_GALLERY_VERIFY', '1') == '1'
+LEGACY_PICKLES = ('images/encoded_file.p', 'encoded_file.p')
+# SQLite gallery with several templates per person (gallery_db.py); empty = use the .npy files
+GALLERY_DB = os.environ.get('FACE_GALLERY_DB', '')
+FORMAT_NAME = 'omnis-gallery'
+FORMAT_VERSION = 1
+DIM = 128
+# Journal records merged into the matrix once this many are pending
+JOURNAL_COMPACT_RECORDS = int(os.environ.get('FACE_JOURNAL_COMPACT', '64'))
+JOURNAL_MAGIC = b'OMNISJNL'
+JOURNAL_HEADER = struct.Struct('<8sI4x16s')  # magic, version, journal id
+JOURNAL_RECORD = struct.Struct(f'<4sd96s{DIM}f')  # magic, unix time, utf-8 name, encoding; crc32 follows
+JOURNAL_RECORD_MAGIC = b'REC1'
+JOURNAL_RECORD_SIZE = JOURNAL_RECORD.size + 4
+
+
+class GalleryError(Exception):
+    pass
+
+
+class Gallery:
+    """Gallery contents: `encodings` (N x 128 float32, possibly memory-mapped) and one name per row."""
+
+    def __init__(self, encodings, names: Sequence[str], meta: Optional[List[dict]] = None,
+                 generation: int = 0, path: Optional[str] = None, source: str = 'memory'):
+        self.encodings = encodings
+        self.names = list(names)
+        self.meta = meta if meta is not None else [{'name': n} for n in self.names]
+        self.generation = generation
+        self.path = path
+        self.source = source
+        self.journal_records = 0  # rows merged from the registration journal
+        self.journal_id = None
+        self.journal_total = 0  # records in that journal, including ones the matrix already held
+        self.merged_journal = None  # index marker: {'id', 'records'} already compacted into the matrix
+        self.row_person = None  # row -> person id (SQLite gallery only)
+        self.persons = None  # person id -> attributes (SQLite gallery only)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def describe(self) -> str:
+        journal = f", {self.journal_records} from the journal" if self.journal_records else ""
+        return (f"{len(self)} encodings, {len(set(self.names))} people, generation {self.generation}"
+                f"{journal} ({self.source})")
+
+
+def _paths(path: str):
+    """(matrix path of galleries saved before generations, index path)."""
+    return path + '.npy', path + '.json'
+
+
+def matrix_path(path: str, index: dict) -> str:
+    """The matrix file the index at `path` names."""
+    name = index.get('matrix')
+    return os.path.join(os.path.dirname(path), name) if name else _paths(path)[0]
+
+
+def gallery_files(path: str = GALLERY_PATH) -> List[str]:
+    """Every file of the gallery at `path` (index and all matrix generations), not the journal."""
+    return [p for p in _paths(path) if os.path.exists(p)] + sorted(glob.glob(glob.escape(path) + '.g*.npy'))
+
+
+def _fsync_dir(directory: str):
+    try:
+        fd = os.open(directory or '.', os.O_RDONLY)
+    except OSError:  # directories cannot be opened on Windows; os.replace is durable there
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def journal_path(path: str = GALLERY_PATH) -> str:
+    return path + '.journal'
+
+
+def checksum(matrix) -> str:
+    return hashlib.sha256(np.ascontiguousarray(matrix, dtype=np.float32).tobytes()).hexdigest()
+
+
+def exists(path: str = GALLERY_PATH) -> bool:
+    return os.path.exists(_paths(path)[1])
+
+
+def read_index(path: str = GALLERY_PATH) -> dict:
+    with open(_paths(path)[1]) as f:
+        index = json.load(f)
+    if index.get('format') != FORMAT_NAME:
+        raise GalleryError(f"{_paths(path)[1]} is not a gallery index")
+    if index.get('version', 0) > FORMAT_VERSION:
+        raise GalleryError(f"gallery version {index['version']} is newer than supported ({FORMAT_VERSION})")
+    return index
+
+
+def load_gallery(path: str = GALLERY_PATH, verify: bool = GALLERY_VERIFY, mmap: bool = True) -> Gallery:
+    """Load the gallery: the SQLite store if FACE_GALLERY_DB is set, else the files at `path`."""
+    if GALLERY_DB:
+        from gallery_db import load_db
+        return load_db(GALLERY_DB)
+    return load_file_gallery(path, verify, mmap)
+
+
+def load_file_gallery(path: str = GALLERY_PATH, verify: bool = GALLERY_VERIFY, mmap: bool = True) -> Gallery:
+    """Load the .npy gallery and merge the registration journal.
+
+    Falls back to (and merges) the legacy pickles if it has not been migrated yet.
+    The matrix stays memory-mapped unless journal rows have to be appended to it.
+    """
+    return _merge_journal(_load_base(path, verify, mmap), path)
+
+
+def _load_base(path: str, verify: bool, mmap: bool) -> Gallery:
+    if not exists(path):
+        legacy = [p for p in LEGACY_PICKLES if os.path.exists(p)]
+        if not legacy:
+            if os.path.exists(journal_path(path)):
+                # Nothing enrolled yet, only live registrations
+                return Gallery(np.zeros((0, DIM), dtype=np.float32), [], path=path, source=journal_path(path))
+            raise GalleryError(f"no gallery at {path}.json and no legacy encoded_file.p")
+        print(f"[Gallery] {path}.json not found, reading legacy {', '.join(legacy)} "
+              f"(run 'python gallery_file.py migrate')")
+        gallery = load_legacy(legacy)
+        gallery.path = path
+        return gallery
+
+    index = read_index(path)
+    npy_path = matrix_path(path, index)
+    matrix = np.load(npy_path, mmap_mode='r' if mmap else None, allow_pickle=False)
+    if matrix.dtype != np.float32 or matrix.ndim != 2 or matrix.shape[1] != DIM:
+        raise GalleryError(f"{npy_path}: expected float32 N x {DIM}, got {matrix.dtype} {matrix.shape}")
+    entries = index.get('entries', [])
+    if matrix.shape[0] != index.get('count') or len(entries) != matrix.shape[0]:
+        raise GalleryError(f"{npy_path}: {matrix.shape[0]} rows but the index lists {len(entries)}")
+    if verify and checksum(matrix) != index.get('checksum'):
+        raise GalleryError(f"{npy_path}: checksum mismatch (file changed or corrupted)")
+    gallery = Gallery(matrix, [e['name'] for e in entries], entries,
+                      generation=index.get('generation', 0), path=path, source=npy_path)
+    gallery.merged_journal = index.get('journal')
+    return gallery
+
+
+def read_journal(path: str = GALLERY_PATH):
+    """(journal id, [(name, time, encoding), ...]) up to the first torn or corrupt record."""
+    try:
+        with open(journal_path(path), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None, []
+    if len(data) < JOURNAL_HEADER.size:
+        return None, []
+    magic, version, jid = JOURNAL_HEADER.unpack_from(data)
+    if magic != JOURNAL_MAGIC:
+        raise GalleryError(f"{journal_path(path)} is not a registration journal")
+    if version > FORMAT_VERSION:
+        raise GalleryError(f"journal version {version} is newer than supported ({FORMAT_VERSION})")
+    records = []
+    for offset in range(JOURNAL_HEADER.size, len(data) - JOURNAL_RECORD_SIZE + 1, JOURNAL_RECORD_SIZE):
+        body = data[offset:offset + JOURNAL_RECORD.size]
+        crc, = struct.unpack_from('<I', data, offset + JOURNAL_RECORD.size)
+        if zlib.crc32(body) != crc or body[:4] != JOURNAL_RECORD_MAGIC:
+            print(f"[Gallery] {journal_path(path)}: corrupt record {len(records)}, ignoring the rest")
+            break
+        fields = JOURNAL_RECORD.unpack(body)
+        name = fields[2].rstrip(b'\0').decode('utf-8', 'replace')
+        records.append((name, fields[1], np.asarray(fields[3:], dtype=np.float32)))
+    return jid.hex(), records
+
+
+def _merge_journal(gallery: Gallery, path: str) -> Gallery:
+    jid, records = read_journal(path)
+    marker = gallery.merged_journal or {}
+    # Records the matrix already holds (a compaction that crashed before truncating the journal)
+    skip = marker.get('records', 0) if marker.get('id') == jid else 0
+    records = records[skip:]
+    if not records:
+        return gallery
+    rows = np.vstack([encoding for _, _, encoding in records])
+    matrix = np.vstack([np.asarray(gallery.encodings, dtype=np.float32).reshape(-1, DIM), rows])
+    names = gallery.names + [name for name, _, _ in records]
+    meta = gallery.meta + [{'name': name, 'source': 'registration',
+                            'added': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(t))}
+                           for name, t, _ in records]
+    merged = Gallery(matrix, names, meta, gallery.generation, path, gallery.source)
+    merged.journal_records = len(records)
+    merged.journal_id = jid
+    merged.journal_total = skip + len(records)
+    return merged
+
+
+def load_legacy(pickle_paths: Sequence[str] = LEGACY_PICKLES) -> Gallery:
+    """Read and merge legacy (encodings, names) pickles, dropping exact duplicate rows."""
+    rows, names, meta, seen = [], [], [], set()
+    for p in pickle_paths:
+        if not os.path.exists(p):
+            continue
+        with open(p, 'rb') as f:
+            encodings, ids = pickle.load(f)
+        for encoding, name in zip(encodings, ids):
+            row = np.asarray(encoding, dtype=np.float32).reshape(DIM)
+            key = (name, row.tobytes())
+            if key in seen:
+                continue
+            seen.add(key)
+            rows.append(row)
+            names.append(name)
+            meta.append({'name': name, 'source': p})
+    matrix = np.vstack(rows) if rows else np.zeros((0, DIM), dtype=np.float32)
+    return Gallery(matrix, names, meta, source=', '.join(pickle_paths))
+
+
+def save_gallery(encodings, names: Sequence[str], path: str = GALLERY_PATH,
+                 meta: Optional[List[dict]] = None, journal: Optional[dict] = None) -> Gallery:
+    """Write a new matrix generation, then commit it by replacing the index (see the module docstring).
+
+    `journal` ({'id', 'records'}) records which journal rows the matrix already contains.
+    """
+    matrix = np.ascontiguousarray(np.asarray(encodings, dtype=np.float32).reshape(-1, DIM))
+    names = list(names)
+    if len(names) != len(matrix):
+        raise GalleryError(f"{len(matrix)} encodings but {len(names)} names")
+    entries = []
+    for i, name in enumerate(names):
+        entry = dict(meta[i]) if meta is not None else {}
+        entry['name'] = name
+        entries.append(entry)
+    generation, previous = 0, None
+    if exists(path):
+        try:
+            old = read_index(path)
+            generation, previous = old.get('generation', 0) + 1, matrix_path(path, old)
+        except (OSError, ValueError, GalleryError):
+            pass
+
+    _, json_path = _paths(path)
+    directory = os.path.dirname(json_path)
+    os.makedirs(directory or '.', exist_ok=True)
+    npy_path = f"{path}.g{generation}.npy"
+    tmp_npy = f"{path}.g{generation}.tmp"
+    with open(tmp_npy, 'wb') as f:
+        np.save(f, matrix, allow_pickle=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_npy, npy_path)
+    index = {
+        'format': FORMAT_NAME,
+        'version': FORMAT_VERSION,
+        'dim': DIM,
+        'dtype': 'float32',
+        'count': len(matrix),
+        'checksum': checksum(matrix),
+        'generation': generation,
+        'matrix': os.path.basename(npy_path),
+        'saved': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'entries': entries,
+    }
+    if journal is not None:
+        index['journal'] = journal
+    tmp_json = json_path + '.tmp'
+    with open(tmp_json, 'w') as f:
+        json.dump(index, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    # The commit point: the new matrix is durable before any index names it
+    os.replace(tmp_json, json_path)
+    _fsync_dir(directory)
+    for old_path in gallery_files(path):
+        if old_path.endswith('.npy') and old_path not in (npy_path, previous):
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+    return Gallery(matrix, names, entries, generation=generation, path=path, source=npy_path)
+
+
+def append_to_gallery(encoding, name: str, path: str = GALLERY_PATH, meta: Optional[dict] = None) -> Gallery:
+    """Add one encoding by rewriting the gallery (live registration uses `journal_append`)."""
+    current = load_file_gallery(path, verify=False, mmap=False)
+    matrix = np.vstack([np.asarray(current.encodings, dtype=np.float32).reshape(-1, DIM),
+                        np.asarray(encoding, dtype=np.float32).reshape(1, DIM)])
+    entry = dict(meta or {}, name=name, added=time.strftime('%Y-%m-%dT%H:%M:%S'))
+    return save_gallery(matrix, current.names + [name], path, current.meta + [entry])
+
+
+def _lock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def save_enrolment(encodings, names: Sequence[str], path: str = GALLERY_PATH,
+                   meta: Optional[List[dict]] = None) -> Gallery:
+    """Replace the enrolled rows, keeping registrations a compaction already moved into the matrix.
+
+    Holds the journal lock like `compact_journal`, so the two cannot overwrite each other. Rows still
+    in the journal are left there; the saved index keeps the marker of the ones already compacted.
+    """
+    matrix = np.asarray(encodings, dtype=np.float32).reshape(-1, DIM)
+    names, meta = list(names), list(meta) if meta is not None else [{} for _ in names]
+    jpath = journal_path(path)
+    os.makedirs(os.path.dirname(jpath) or '.', exist_ok=True)
+    with open(jpath, 'ab') as f:
+        _lock(f)
+        marker = None
+        if exists(path):
+            base = _load_base(path, verify=False, mmap=False)
+            marker = base.merged_journal
+            kept = [i for i, m in enumerate(base.meta) if m.get('source') == 'registration']
+            if kept:
+                matrix = np.vstack([matrix, np.asarray(base.encodings, dtype=np.float32)[kept]])
+                names += [base.names[i] for i in kept]
+                meta += [base.meta[i] for i in kept]
+        return save_gallery(matrix, names, path, meta, journal=marker)
+
+
+def journal_append(encoding, name: str, path: str = GALLERY_PATH) -> int:
+    """Append one registration and fsync it; O(1) in the gallery size. Returns the records in the journal."""
+    row = np.asarray(encoding, dtype=np.float32).reshape(DIM)
+    raw = name.encode('utf-8')[:96].decode('utf-8', 'ignore').encode('utf-8')
+    body = JOURNAL_RECORD.pack(JOURNAL_RECORD_MAGIC, time.time(), raw, *row.tolist())
+    jpath = journal_path(path)
+    os.makedirs(os.path.dirname(jpath) or '.', exist_ok=True)
+    with open(jpath, 'ab') as f:
+        _lock(f)
+        size = f.seek(0, os.SEEK_END)
+        if size < JOURNAL_HEADER.size:
+            f.truncate(0)
+            f.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, FORMAT_VERSION, uuid.uuid4().bytes))
+            size = JOURNAL_HEADER.size
+        torn = (size - JOURNAL_HEADER.size) % JOURNAL_RECORD_SIZE
+        if torn:
+            # A write cut short by a crash; drop it so the records stay aligned
+            f.truncate(size - torn)
+            size -= torn
+        f.write(body + struct.pack('<I', zlib.crc32(body)))
+        f.flush()
+        os.fsync(f.fileno())
+    return (size - JOURNAL_HEADER.size) // JOURNAL_RECORD_SIZE + 1
+
+
+def _reset_journal(f):
+    f.truncate(0)
+    f.seek(0)
+    f.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, FORMAT_VERSION, uuid.uuid4().bytes))
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def compact_journal(path: str = GALLERY_PATH) -> Optional[Gallery]:
+    """Merge the journal into the matrix and start a new, empty journal. Returns None if there was nothing to do."""
+    jpath = journal_path(path)
+    if not os.path.exists(jpath):
+        return None
+    with open(jpath, 'r+b') as f:
+        # Registrations wait for the lock, so none can land between the merge and the truncate
+        _lock(f)
+        gallery = load_file_gallery(path, verify=False, mmap=False)
+        if not gallery.journal_records:
+            if os.fstat(f.fileno()).st_size > JOURNAL_HEADER.size:
+                # Every record is already in the matrix (a compaction stopped before the truncate)
+                _reset_journal(f)
+            return None
+        # save_gallery returns once the matrix, the index and their directory are on disk, so the journal is
+        # only emptied after that. If we crash before the truncate, the loader skips the rows this save holds
+        saved = save_gallery(gallery.encodings, gallery.names, path, gallery.meta,
+                             journal={'id': gallery.journal_id, 'records': gallery.journal_total})
+        _reset_journal(f)
+    print(f"[Gallery] Compacted {gallery.journal_records} journal records: {saved.describe()}")
+    return saved
+
+
+_compacting = threading.Lock()
+
+
+def compact_in_background(path: str = GALLERY_PATH):
+    """Run `compact_journal` on a daemon thread, unless one is already running."""
+    if not _compacting.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            compact_journal(path)
+        except Exception as e:
+            print(f"[Gallery] Journal compaction failed: {e}")
+        finally:
+            _compacting.release()
+
+    threading.Thread(target=run, name='gallery-compact', daemon=True).start()
+
+
+def _main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['migrate', 'info', 'verify', 'compact'])
+    parser.add_argument('--path', default=GALLERY_PATH, help='gallery path without extension')
+    parser.add_argument('--legacy', nargs='+', default=list(LEGACY_PICKLES), help='pickles to migrate (merged)')
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        if exists(args.path):
+            raise SystemExit(f"{args.path}.json already exists; delete it first to migrate again")
+        legacy = load_legacy(args.legacy)
+        gallery = save_gallery(legacy.encodings, legacy.names, args.path, legacy.meta)
+        print(f"Migrated {legacy.source} -> {gallery.source}, {args.path}.json: {gallery.describe()}")
+        print("The old pickles are no longer read once the new files exist; they can be deleted.")
+    elif args.command == 'info':
+        gallery = load_gallery(args.path, verify=False)
+        print(gallery.describe())
+        for name, count in sorted({n: gallery.names.count(n) for n in gallery.names}.items()):
+            print(f"  {name}: {count}")
+    elif args.command == 'compact':
+        if compact_journal(args.path) is None:
+            print("Journal is empty, nothing to compact.")
+    else:
+        start = time.perf_counter()
+        gallery = load_gallery(args.path, verify=True)
+        print(f"OK: {gallery.describe()} verified in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,275 @@
+"""
+Pluggable nearest-neighbour indexes for the face gallery.
+
+`FaceMatcher` asks an index for the nearest gallery row of each query encoding.
+Two implementations:
+
+- `BruteForceIndex`: one (queries x gallery) distance matrix. Fine up to a few
+  thousand templates.
+- `ClusterIndex`: an IVF-style index built with k-means in NumPy. A query first
+  scans the `nprobe` clusters with the nearest centroids. In exact mode it then
+  verifies against every template using distances in a low-dimensional PCA
+  projection. Projecting onto orthonormal axes never increases a distance, so
+  `|P(q - x)| <= |q - x|` is a lower bound. Only templates whose bound is below
+  the best distance so far (and the match tolerance) get a full 128-d
+  distance. No template within tolerance is ever skipped, so the identity
+  always matches brute force. Without exact mode only the probed clusters are
+  scanned, which is faster but approximate (see bench_gallery_index.py).
+
+Built indexes can be cached on disk, keyed by a hash of the gallery matrix.
+
+FACE_INDEX_DTYPE=float16 or int8 stores the brute-force gallery quantized:
+half or a quarter of the float32 bytes, which is what a full scan is bound
+by on the Pi. int8 uses a per-dimension scale and offset. The scan converts
+one cache-sized block of rows at a time, so only the quantized matrix is
+read from memory (see bench_quantized.py for the accuracy and speed report).
+"""
+import os
+import hashlib
+
+import numpy as np
+
+# 'brute' or 'cluster'
+FACE_INDEX = os.environ.get('FACE_INDEX', 'brute').lower()
+# Clusters scanned first for each query
+FACE_INDEX_NPROBE = int(os.environ.get('FACE_INDEX_NPROBE', '4'))
+# 1 = verify with a bound-pruned pass so identities match brute force; 0 = probe only
+FACE_INDEX_EXACT = os.environ.get('FACE_INDEX_EXACT', '1') == '1'
+# Storage of the brute-force gallery: 'float32', 'float16' or 'int8'
+FACE_INDEX_DTYPE = os.environ.get('FACE_INDEX_DTYPE', 'float32').lower()
+# Rows converted back to float32 per step of a quantized scan (~1 MB of float32)
+QUANT_BLOCK_ROWS = 2048
+# PCA dimensions used for the exact-mode lower bound
+PROJECTION_DIMS = 32
+# Guards the lower bound against float32 rounding
+_BOUND_SLACK = 1e-4
+
+
+def gallery_digest(gallery: np.ndarray) -> str:
+    return hashlib.sha1(np.ascontiguousarray(gallery, dtype=np.float32).tobytes()).hexdigest()
+
+
+def _sq_dist(q: np.ndarray, rows: np.ndarray, row_sq: np.ndarray) -> np.ndarray:
+    d2 = np.einsum('ij,ij->i', q, q)[:, None] + row_sq[None, :] - 2.0 * (q @ rows.T)
+    np.maximum(d2, 0.0, out=d2)
+    return d2
+
+
+class BruteForceIndex:
+    kind = 'brute'
+
+    def __init__(self, gallery: np.ndarray):
+        self.gallery = np.ascontiguousarray(gallery, dtype=np.float32)
+        self._sq_norms = np.einsum('ij,ij->i', self.gallery, self.gallery)
+
+    def __len__(self) -> int:
+        return len(self.gallery)
+
+    def distances(self, queries: np.ndarray) -> np.ndarray:
+        return np.sqrt(_sq_dist(queries, self.gallery, self._sq_norms))
+
+    def search(self, queries: np.ndarray, tolerance: float):
+        """Return (best_index, best_distance) per query row."""
+        dist = self.distances(queries)
+        best = np.argmin(dist, axis=1)
+        return best, dist[np.arange(len(queries)), best]
+
+
+def quantize(gallery: np.ndarray, dtype: str):
+    """(codes, scale, offset) with gallery ~= codes * scale + offset; scale/offset are None for float16."""
+    gallery = np.asarray(gallery, dtype=np.float32)
+    if dtype == 'float16':
+        return gallery.astype(np.float16), None, None
+    if dtype != 'int8':
+        raise ValueError(f"unknown gallery dtype '{dtype}'")
+    if len(gallery) == 0:
+        return np.zeros((0, gallery.shape[1]), np.int8), np.ones(gallery.shape[1], np.float32), \
+            np.zeros(gallery.shape[1], np.float32)
+    # Per dimension: centre on the midrange and spread [min, max] over [-127, 127]
+    lo, hi = gallery.min(axis=0), gallery.max(axis=0)
+    offset = (hi + lo) / 2.0
+    scale = np.maximum((hi - lo) / 254.0, 1e-12)
+    codes = np.clip(np.rint((gallery - offset) / scale), -127, 127).astype(np.int8)
+    return codes, scale.astype(np.float32), offset.astype(np.float32)
+
+
+def dequantize(codes: np.ndarray, scale=None, offset=None) -> np.ndarray:
+    rows = codes.astype(np.float32)
+    if scale is not None:
+        rows *= scale
+        rows += offset
+    return rows
+
+
+class QuantizedIndex:
+    """Brute force over a float16 or int8 copy of the gallery."""
+    kind = 'brute'
+
+    def __init__(self, gallery: np.ndarray, dtype: str = 'int8', block_rows: int = QUANT_BLOCK_ROWS):
+        self.dtype = dtype
+        self.block_rows = block_rows
+        self.codes, self.scale, self.offset = quantize(gallery, dtype)
+        # Norms of the rows as stored, so distances are exact for the quantized gallery
+        self._sq_norms = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), block_rows):
+            rows = dequantize(self.codes[start:start + block_rows], self.scale, self.offset)
+            self._sq_norms[start:start + block_rows] = np.einsum('ij,ij->i', rows, rows)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        extra = 0 if self.scale is None else self.scale.nbytes + self.offset.nbytes
+        return self.codes.nbytes + self._sq_norms.nbytes + extra
+
+    def distances(self, queries: np.ndarray) -> np.ndarray:
+        q = np.asarray(queries, dtype=np.float32)
+        if self.scale is not None:
+            # q . (c * s + m) = (q * s) . c + q . m, so the int8 codes are used without dequantizing
+            q_codes, q_const = q * self.scale, q @ self.offset
+        else:
+            q_codes, q_const = q, np.zeros(len(q), dtype=np.float32)
+        dot = np.empty((len(q), len(self.codes)), dtype=np.float32)
+        for start in range(0, len(self.codes), self.block_rows):
+            block = self.codes[start:start + self.block_rows].astype(np.float32)
+            np.matmul(q_codes, block.T, out=dot[:, start:start + len(block)])
+        d2 = np.einsum('ij,ij->i', q, q)[:, None] + self._sq_norms[None, :] - 2.0 * (dot + q_const[:, None])
+        np.maximum(d2, 0.0, out=d2)
+        return np.sqrt(d2)
+
+    def search(self, queries: np.ndarray, tolerance: float):
+        dist = self.distances(queries)
+        best = np.argmin(dist, axis=1)
+        return best, dist[np.arange(len(queries)), best]
+
+
+class ClusterIndex:
+    kind = 'cluster'
+
+    def __init__(self, gallery: np.ndarray, nlist: int = 0, nprobe: int = FACE_INDEX_NPROBE,
+                 exact: bool = FACE_INDEX_EXACT, iterations: int = 8, seed: int = 0, _state=None):
+        self.nprobe = nprobe
+        self.exact = exact
+        gallery = np.ascontiguousarray(gallery, dtype=np.float32)
+        if _state is not None:
+            self.centroids, self.order, self.offsets, self.mean, self.components = _state
+        else:
+            nlist = nlist or max(1, int(np.sqrt(len(gallery))))
+            self._build(gallery, min(nlist, max(1, len(gallery))), iterations, seed)
+        # Members stored contiguously, cluster by cluster
+        self.rows = np.ascontiguousarray(gallery[self.order])
+        self._row_sq = np.einsum('ij,ij->i', self.rows, self.rows)
+        self._cent_sq = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        self.row_proj = np.ascontiguousarray((self.rows - self.mean) @ self.components)
+        self._row_proj_sq = np.einsum('ij,ij->i', self.row_proj, self.row_proj)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _build(self, gallery, nlist, iterations, seed):
+        rng = np.random.default_rng(seed)
+        # Train on a sample; assigning everything afterwards is a single pass
+        sample = gallery[rng.choice(len(gallery), size=min(len(gallery), nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        sample_sq = np.einsum('ij,ij->i', sample, sample)
+        for _ in range(iterations):
+            assign = np.argmin(_sq_dist(centroids, sample, sample_sq), axis=0)
+            for c in range(nlist):
+                members = sample[assign == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+
+        gallery_sq = np.einsum('ij,ij->i', gallery, gallery)
+        # Assign in chunks to bound memory on large galleries
+        assign = np.empty(len(gallery), dtype=np.int64)
+        for start in range(0, len(gallery), 8192):
+            stop = start + 8192
+            assign[start:stop] = np.argmin(_sq_dist(centroids, gallery[start:stop], gallery_sq[start:stop]), axis=0)
+
+        self.order = np.argsort(assign, kind='stable')
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+        self.centroids = centroids
+
+        # Principal axes of the sample for the exact-mode lower bound
+        self.mean = sample.mean(axis=0)
+        _, _, vt = np.linalg.svd(sample - self.mean, full_matrices=False)
+        self.components = np.ascontiguousarray(vt[:PROJECTION_DIMS].T, dtype=np.float32)
+
+    def _scan(self, q, rows, best_i, best_d):
+        if len(rows) == 0:
+            return best_i, best_d
+        d = np.sqrt(_sq_dist(q, self.rows[rows], self._row_sq[rows])[0])
+        j = int(np.argmin(d))
+        if d[j] < best_d:
+            return int(rows[j]), float(d[j])
+        return best_i, best_d
+
+    def search(self, queries: np.ndarray, tolerance: float):
+        n = len(queries)
+        best_idx = np.full(n, -1, dtype=np.int64)
+        best_dist = np.full(n, np.inf, dtype=np.float32)
+        cent_dist = np.sqrt(_sq_dist(queries, self.centroids, self._cent_sq))
+        if self.exact:
+            proj = (queries - self.mean) @ self.components
+            proj_dist = np.sqrt(_sq_dist(proj, self.row_proj, self._row_proj_sq))
+        nprobe = max(1, min(self.nprobe, len(self.centroids)))
+        for qi in range(n):
+            q = queries[qi:qi + 1]
+            dc = cent_dist[qi]
+            # Stage 1: the few clusters whose centroids are closest
+            probe = np.argpartition(dc, nprobe - 1)[:nprobe]
+            probed = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in probe])
+            bi, bd = self._scan(q, probed, -1, np.inf)
+            if self.exact:
+                # Stage 2: any row that could beat min(best, tolerance) passes the projected bound
+                candidates = proj_dist[qi] < min(bd, tolerance) + _BOUND_SLACK
+                candidates[probed] = False
+                bi, bd = self._scan(q, np.nonzero(candidates)[0], bi, bd)
+            if bi < 0:
+                # Only empty clusters probed (and no exact pass): unmatched, like an empty gallery
+                continue
+            best_idx[qi] = self.order[bi]
+            best_dist[qi] = bd
+        return best_idx, best_dist
+
+    def state(self):
+        return self.centroids, self.order, self.offsets, self.mean, self.components
+
+
+def build_index(gallery: np.ndarray, kind: str = FACE_INDEX, cache_path: str = None,
+                dtype: str = FACE_INDEX_DTYPE, **kwargs):
+    """Create an index of `kind` over `gallery`, reusing `cache_path` when it matches this gallery."""
+    gallery = np.ascontiguousarray(gallery, dtype=np.float32).reshape(-1, 128)
+    if kind not in ('brute', 'cluster'):
+        print(f"[GalleryIndex] Unknown index '{kind}', using brute force")
+        kind = 'brute'
+    if dtype not in ('float32', 'float16', 'int8'):
+        print(f"[GalleryIndex] Unknown FACE_INDEX_DTYPE '{dtype}', using float32")
+        dtype = 'float32'
+    if kind == 'brute' or len(gallery) == 0:
+        return QuantizedIndex(gallery, dtype) if dtype != 'float32' else BruteForceIndex(gallery)
+    if dtype != 'float32':
+        print(f"[GalleryIndex] FACE_INDEX_DTYPE={dtype} only applies to the brute-force index; cluster keeps float32")
+
+    digest = gallery_digest(gallery)
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with np.load(cache_path) as data:
+                if str(data['digest']) == digest:
+                    state = tuple(data[k] for k in ('centroids', 'order', 'offsets', 'mean', 'components'))
+                    return ClusterIndex(gallery, _state=state, **kwargs)
+        except Exception as e:
+            print(f"[GalleryIndex] Ignoring unreadable index cache {cache_path}: {e}")
+
+    index = ClusterIndex(gallery, **kwargs)
+    if cache_path:
+        try:
+            centroids, order, offsets, mean, components = index.state()
+            tmp = cache_path + '.tmp.npz'
+            np.savez(tmp, digest=digest, centroids=centroids, order=order, offsets=offsets,
+                     mean=mean, components=components)
+            os.replace(tmp, cache_path)
+        except Exception as e:
+            print(f"[GalleryIndex] Could not write index cache {cache_path}: {e}")
+    return index
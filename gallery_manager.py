@@ -0,0 +1,129 @@
+"""
+Hot-reload of the gallery in a running process.
+
+main.py used to load the gallery once at startup, so a registration or a
+re-run of EncodeGenerator.py only reached the kiosk after a restart.
+`GalleryManager` polls the gallery files (the .json index, which names the
+current matrix, the registration journal, the legacy pickles and, with FACE_GALLERY_DB,
+the SQLite database and its WAL) by mtime and size every
+FACE_GALLERY_POLL seconds. Once a change has settled (the files look the
+same on two consecutive polls, so a save in progress is not read), it
+loads the new gallery and builds the matcher on a background thread. It
+then swaps the (gallery, matcher) pair in with a single assignment, so the
+frame loop never waits and never sees a half-built matcher. A load that
+fails (for example a reader that caught the matrix replaced but not yet the
+index) is retried on the next poll, and the previous version stays active
+until then.
+
+Every version that becomes active is logged as
+"[Gallery] Active version g<generation>+<journal records>: ...".
+"""
+import os
+import time
+import threading
+from typing import Callable, Optional
+
+from gallery_file import load_gallery, journal_path, GALLERY_PATH, GALLERY_DB, LEGACY_PICKLES, Gallery
+
+# Seconds between checks of the gallery files; 0 disables hot reload
+GALLERY_POLL_SECONDS = float(os.environ.get('FACE_GALLERY_POLL', '2'))
+
+
+def gallery_version(gallery: Gallery) -> str:
+    return f"g{gallery.generation}+{gallery.journal_records}"
+
+
+class GalleryManager:
+    def __init__(self, path: str = GALLERY_PATH, build: Optional[Callable[[Gallery], object]] = None,
+                 interval: float = GALLERY_POLL_SECONDS):
+        self.path = path
+        self.build = build if build is not None else (lambda gallery: None)
+        self.interval = interval
+        self.stats = {'reloads': 0, 'failures': 0, 'last_reload_ms': 0.0}
+        self._thread = None
+        self._stop = threading.Event()
+        # The first load is synchronous: without a gallery there is nothing to match against
+        self._signature = self._stat()
+        self._seen = self._signature
+        gallery = load_gallery(path)
+        self._active = (gallery, self.build(gallery))
+        self._log(gallery)
+
+    @property
+    def gallery(self) -> Gallery:
+        return self._active[0]
+
+    @property
+    def matcher(self):
+        return self._active[1]
+
+    @property
+    def version(self) -> str:
+        return gallery_version(self._active[0])
+
+    def active(self):
+        """(gallery, matcher) of the same version; read once per frame rather than the two properties."""
+        return self._active
+
+    def _stat(self):
+        signature = []
+        paths = (self.path + '.json', journal_path(self.path)) + LEGACY_PICKLES
+        if GALLERY_DB:
+            paths += (GALLERY_DB, GALLERY_DB + '-wal')
+        for p in paths:
+            try:
+                st = os.stat(p)
+                signature.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _log(self, gallery: Gallery):
+        print(f"[Gallery] Active version {gallery_version(gallery)}: {gallery.describe()}")
+
+    def check(self) -> bool:
+        """Reload if the files changed since the active version was loaded; returns True on a swap."""
+        signature = self._stat()
+        if signature == self._signature:
+            return False
+        if signature != self._seen:
+            # Still being written; wait for it to settle
+            self._seen = signature
+            return False
+        start = time.perf_counter()
+        try:
+            gallery = load_gallery(self.path)
+            built = self.build(gallery)
+        except Exception as e:
+            # Keep the current version; the changed signature makes the next poll retry
+            self.stats['failures'] += 1
+            print(f"[Gallery] Reload failed, keeping {self.version}: {e}")
+            return False
+        self._active = (gallery, built)
+        # Files changed again while loading: the next poll sees a new signature and reloads
+        self._signature = signature
+        self.stats['reloads'] += 1
+        self.stats['last_reload_ms'] = (time.perf_counter() - start) * 1000.0
+        self._log(gallery)
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='gallery-reload', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1.0)
+            self._thread = None
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"version={self.version} reloads={s['reloads']} failures={s['failures']} "
+                f"last_reload_ms={s['last_reload_ms']:.1f}")
@@ -0,0 +1,117 @@
+"""
+Schedule-aware gallery partitions.
+
+A kiosk at a block entrance mostly sees that block's classes and the staff,
+so it does not need to scan the whole school first. Every person in the
+gallery falls into partitions keyed by their attributes: "class:7B",
+"block:A", "role:student". Set these with `gallery_db.py set-person`, or
+give file-gallery rows 'class'/'block'/'role' metadata. FACE_KIOSK names
+this kiosk in school_data.KIOSKS. That entry lists the partitions to search
+first in each school_data.TIMETABLE period (or "default"). `PartitionMatcher`
+searches only those people first, and a face that is not clearly matched
+there falls back to the full gallery (see face_matcher.CandidateMatcher).
+
+    FACE_KIOSK=block_a python gallery_partitions.py     # partitions and the plan per period
+"""
+import os
+import argparse
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+
+from face_matcher import CandidateMatcher
+from school_data import TIMETABLE, KIOSKS
+
+FACE_KIOSK = os.environ.get('FACE_KIOSK', '')
+# A partition match is accepted only this far below the tolerance
+PARTITION_MARGIN = float(os.environ.get('FACE_PARTITION_MARGIN', '0.1'))
+PARTITION_FIELDS = ('class', 'block', 'role')
+
+
+def _minutes(hhmm: str) -> int:
+    hours, minutes = hhmm.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def person_partitions(gallery) -> dict:
+    """partition key -> set of person names, from SQLite person attributes or row metadata."""
+    partitions = {}
+    for i, name in enumerate(gallery.names):
+        if gallery.persons is not None:
+            attrs = gallery.persons.get(int(gallery.row_person[i]), {})
+        else:
+            attrs = gallery.meta[i]
+        for field in PARTITION_FIELDS:
+            value = attrs.get(field)
+            if value:
+                partitions.setdefault(f"{field}:{value}".lower(), set()).add(name)
+    return partitions
+
+
+class KioskSchedule:
+    def __init__(self, kiosk: str = FACE_KIOSK, kiosks: dict = KIOSKS, timetable=TIMETABLE):
+        self.kiosk = kiosk
+        self.plan = kiosks.get(kiosk, {})
+        if kiosk and not self.plan:
+            print(f"[Partitions] Kiosk '{kiosk}' is not in school_data.KIOSKS; searching the full gallery")
+        self.periods = [(_minutes(p['start']), _minutes(p['end']), p['period']) for p in timetable]
+
+    def period_at(self, now: Optional[datetime] = None) -> Optional[str]:
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        for start, end, period in self.periods:
+            if start <= minute < end:
+                return period
+        return None
+
+    def partitions_at(self, now: Optional[datetime] = None) -> list:
+        period = self.period_at(now)
+        keys = self.plan.get(period) if period in self.plan else self.plan.get('default', [])
+        return [k.lower() for k in keys]
+
+
+class PartitionMatcher(CandidateMatcher):
+    """Candidates: the people in the partitions this kiosk's schedule selects right now."""
+
+    def __init__(self, matcher, gallery, schedule: KioskSchedule = None, margin: float = PARTITION_MARGIN):
+        super().__init__(matcher, margin)
+        self.schedule = schedule if schedule is not None else KioskSchedule()
+        lookup = {name: i for i, name in enumerate(matcher.people)}
+        # Person indices of the matcher, so this also works on a centroid (one row per person) matcher
+        self.partitions = {key: sorted(lookup[name] for name in names if name in lookup)
+                           for key, names in person_partitions(gallery).items()}
+
+    def candidate_key(self):
+        keys = tuple(sorted(k for k in self.schedule.partitions_at() if self.partitions.get(k)))
+        return keys or None
+
+    def candidate_rows(self, key) -> np.ndarray:
+        people = sorted(set().union(*(self.partitions[k] for k in key)))
+        return np.concatenate([self._person_rows[p] for p in people])
+
+    def summary(self) -> str:
+        key = self._cached_key or ()
+        return f"kiosk={self.schedule.kiosk} partitions={','.join(key) or '-'} " + super().summary()
+
+
+if __name__ == '__main__':
+    from face_matcher import FaceMatcher
+    from gallery_file import load_gallery
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--kiosk', default=FACE_KIOSK)
+    args = parser.parse_args()
+
+    gallery = load_gallery()
+    matcher = PartitionMatcher(FaceMatcher(gallery.encodings, gallery.names), gallery, KioskSchedule(args.kiosk))
+    print(f"{gallery.describe()}, {len(matcher.partitions)} partitions")
+    for key, people in sorted(matcher.partitions.items()):
+        rows = sum(len(matcher._person_rows[p]) for p in people)
+        print(f"  {key}: {len(people)} people, {rows} templates")
+    print(f"kiosk '{args.kiosk}', templates searched first (of {len(matcher)}):")
+    for period in [p['period'] for p in TIMETABLE] + ['default']:
+        keys = matcher.schedule.plan.get(period, matcher.schedule.plan.get('default', []))
+        key = tuple(sorted(k.lower() for k in keys if matcher.partitions.get(k.lower())))
+        rows = len(matcher.candidate_rows(key)) if key else 0
+        print(f"  {period:>13}: {', '.join(keys) or '-'} -> {rows}")
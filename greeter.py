@@ -0,0 +1,96 @@
+"""
+Greeting policy for the kiosk.
+
+Decides who gets greeted on a frame: people who just arrived, people still in
+view whose cooldown has expired, the frontmost person when they change, and
+unrecognised visitors (at most once per cooldown). main.py speaks the
+greetings. The pipeline benchmark runs the same policy headless
+(`speak=None`) and only counts what would have been said.
+"""
+import os
+import time
+from typing import Callable, Iterable, List, Optional
+
+GREETING_COOLDOWN = 5  # seconds between greetings for the same person
+UNKNOWN_KEY = 'UNKNOWN_FACE'
+
+
+def greeting_text(person: str) -> str:
+    return f"Hello {person}! Welcome to MGM Model School robot."
+
+
+class Greeter:
+    def __init__(self, speak: Optional[Callable[[str], None]] = None, cooldown: float = GREETING_COOLDOWN):
+        self.speak = speak
+        self.cooldown = cooldown
+        self.last_seen = {}  # person_id -> last greeted timestamp
+        self.prev_known = set()
+        self.last_primary = None
+        self.greetings = 0
+
+    def _say(self, key: str, text: str, now: float) -> str:
+        if self.speak is not None:
+            # Always queue the greeting so it plays even if TTS is busy
+            self.speak(text)
+        self.last_seen[key] = now
+        self.greetings += 1
+        return text
+
+    def greet_known(self, known_people: Iterable[str], primary_person: Optional[str] = None,
+                    now: Optional[float] = None) -> List[str]:
+        """Greetings for a frame with recognised people; returns what was said."""
+        now = time.time() if now is None else now
+        debug = os.environ.get('OMNIS_DEBUG') == '1'
+        known_people = set(known_people)
+        said = []
+
+        # Greet newly-arrived people immediately
+        new_people = known_people - self.prev_known
+        for person in new_people:
+            if debug:
+                print(f"[DEBUG] greeting new person: {person}")
+            said.append(self._say(person, greeting_text(person), now))
+
+        # For people who were already present, greet only if cooldown expired
+        for person in known_people & self.prev_known:
+            last = self.last_seen.get(person, 0)
+            if (now - last) > self.cooldown:
+                if debug:
+                    print(f"[DEBUG] greeting existing person after cooldown: {person} last_seen={last} now={now}")
+                said.append(self._say(person, greeting_text(person), now))
+
+        if debug:
+            print(f"[DEBUG] known_people_in_frame={known_people}")
+            print(f"[DEBUG] prev_known_people={self.prev_known}")
+            print(f"[DEBUG] new_people={new_people}")
+            print(f"[DEBUG] last_seen_snapshot={dict(self.last_seen)}")
+
+        # Greet primary person (frontmost) if they changed since last frame
+        if primary_person:
+            if debug:
+                print(f"[DEBUG] primary_person={primary_person} last_primary={self.last_primary}")
+            if primary_person != self.last_primary:
+                if debug:
+                    print(f"[DEBUG] greeting primary person: {primary_person}")
+                said.append(self._say(primary_person, greeting_text(primary_person), now))
+                self.last_primary = primary_person
+        else:
+            self.last_primary = None
+
+        self.prev_known = known_people
+        return said
+
+    def observe(self, known_people: Iterable[str], now: Optional[float] = None):
+        """Note who is in view without greeting them (crowd mode), so they are not greeted as new later."""
+        now = time.time() if now is None else now
+        self.prev_known = set(known_people)
+        for person in self.prev_known:
+            self.last_seen[person] = now
+
+    def greet_unknown(self, now: Optional[float] = None) -> List[str]:
+        """Friendly prompt for an unrecognised frontmost person, once per cooldown window."""
+        now = time.time() if now is None else now
+        if (now - self.last_seen.get(UNKNOWN_KEY, 0)) > self.cooldown:
+            self.last_primary = UNKNOWN_KEY
+            return [self._say(UNKNOWN_KEY, "Hello there!", now)]
+        return []
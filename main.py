@@ -1,14 +1,19 @@
 import os
-import pickle
 import cv2
 import numpy as np
 import cvzone
-import face_recognition
 import time
 from speaker import speak, is_speaking
 from sr_class import SpeechRecognitionThread
 import shared_state
 from register_face import register_name
+from frame_capture import LatestFrameCapture
+from render_assets import RenderAssetCache
+from pipeline_timing import PipelineTimer
+from greeter import Greeter
+from face_pipeline import FacePipeline, build_matcher, frame_people, scale_box
+from gallery_file import compact_in_background, JOURNAL_COMPACT_RECORDS
+from gallery_manager import GalleryManager
 
 # Adapter to provide a .speak() method for the SpeechRecognitionThread
 class SpeakerAdapter:
@@ -21,11 +26,6 @@ speaker_adapter = SpeakerAdapter()
 imgBackground = cv2.imread('Resources/background.png')
 speech_thread = None
 conversation_active = False  # Track if voice conversation is happening
-last_seen = {}  # person_id -> last seen timestamp
-GREETING_COOLDOWN = 5  # seconds between greetings for the same person
-FACE_MATCH_TOLERANCE = float(os.environ.get('FACE_MATCH_TOLERANCE', '0.55'))
-# Maximum faces to process per frame to bound CPU usage (helps low-power devices)
-MAX_FACES = int(os.environ.get('FACE_MAX_FACES', '4'))
 
 # Ensure shared_state starts cleared to avoid accidental registration from previous runs
 try:
@@ -35,118 +35,69 @@ try:
 except Exception:
     pass
 
-# Load mode images
-folderModePath = 'Resources/Modes'
-modePathList = os.listdir(folderModePath)
-imgModeList = []
-for path in modePathList:
-    imgModeList.append(cv2.imread(os.path.join(folderModePath, path)))
+# Load mode images once; student photos are cached (resized) by person
+assets = RenderAssetCache()
+imgModeList = assets.modes
 
 # Load face encodings
 print("Loading Encoded File")
-with open(r'images/encoded_file.p', 'rb') as f:
-    encode_list_known_with_ids = pickle.load(f)
-encode_list_known, studentIds = encode_list_known_with_ids
-print(f"Loaded {len(studentIds)} people: {studentIds}")
-
-cap = cv2.VideoCapture(0)
+# Registrations and re-runs of EncodeGenerator.py are picked up while running (FACE_GALLERY_POLL);
+# the reload and compaction threads start after the pipeline below has forked its encoder pool.
+# build_matcher adds the partition (FACE_KIOSK) and recency (FACE_RECENT_CACHE) matchers.
+gallery_manager = GalleryManager(build=build_matcher)
+
+# Optional per-stage timing (OMNIS_TIMING=1): rolling p50/p95/p99 per stage, optional JSONL dump
+timer = PipelineTimer()
+if timer.enabled:
+    print(f"[Main] Stage timing enabled (interval={timer.interval:.0f}s, jsonl={timer.jsonl_path})")
+
+# Detection, tracking, encoding and matching, with the optional components picked by their
+# FACE_* flags (see face_pipeline.py). The optional encoder processes are forked here, before
+# any other thread (gallery reload, compaction, capture), from a single-threaded process.
+pipeline = FacePipeline(lambda: gallery_manager.matcher, timer=timer)
+
+if gallery_manager.gallery.journal_records >= JOURNAL_COMPACT_RECORDS:
+    compact_in_background(gallery_manager.path)
+gallery_manager.start()
+
+# Frames are grabbed on a background thread so we always process the newest one
+cap = LatestFrameCapture().start()
 mode_type = 0
-prev_known_people = set()
-last_primary_person = None
+# Who to greet and when (newcomers, cooldowns, frontmost person, unknown visitors)
+greeter = Greeter(speak)
 
 try:
     while True:
         try:
+            frame_start = time.perf_counter()
+            timer.begin_frame()
             ret, img = cap.read()
             if not ret or img is None:
-                print("Camera error -retrying...")
-                time.sleep(1)
+                if cap.finished:
+                    print("[Main] Video source ended")
+                    break
+                # The capture thread reconnects on its own; just wait for the next frame
+                print("Camera error -waiting for frames...")
                 continue
+            timer.lap('capture')
 
-            # Prepare image for face detection
-            imgS = cv2.resize(img, (0, 0), None, 0.25, 0.25)
-            imgS = cv2.cvtColor(imgS, cv2.COLOR_BGR2RGB)
-            
-            # Detect faces and encodings (protect against expensive failures)
-            try:
-                face_current_frame = face_recognition.face_locations(imgS)
-                # Limit number of faces we encode to bound CPU usage
-                if face_current_frame and len(face_current_frame) > MAX_FACES:
-                    if os.environ.get('OMNIS_DEBUG') == '1':
-                        print(f"[DEBUG] Too many faces detected ({len(face_current_frame)}), limiting to {MAX_FACES}")
-                    face_current_frame = face_current_frame[:MAX_FACES]
-                encode_current_frame = face_recognition.face_encodings(imgS, face_current_frame)
-            except Exception as e:
-                # Log and continue to next frame
-                if os.environ.get('OMNIS_DEBUG') == '1':
-                    print(f"[DEBUG] Face processing error: {e}")
-                face_current_frame = []
-                encode_current_frame = []
+            faces = pipeline.process(img)
 
             # Update background with current frame
             imgBackground[162:162+480, 55:55+640] = img
             imgBackground[44:44+633, 808:808+414] = imgModeList[mode_type]
+            timer.lap('composite')
 
-            detected_person = None
-            detected_location = None
-
-            # Check each face detected. Collect known people in the frame so we can greet each one once.
-            known_people_in_frame = set()
-            first_match = None
-            matched_people_info = []
-            if face_current_frame:
-                for encodeFace, faceLoc in zip(encode_current_frame, face_current_frame):
-                    matches = face_recognition.compare_faces(encode_list_known, encodeFace, tolerance=FACE_MATCH_TOLERANCE)
-                    face_distance = face_recognition.face_distance(encode_list_known, encodeFace)
-                    match_index = np.argmin(face_distance)
-
-                    # Debug: log which person was chosen for this face and the numeric distance
-                    if os.environ.get('OMNIS_DEBUG') == '1':
-                        try:
-                            chosen = studentIds[match_index] if matches[match_index] else 'UNKNOWN'
-                            print(f"[DEBUG] face match candidate: chosen={chosen} index={match_index} dist={face_distance[match_index]:.3f} matches={matches[match_index]}")
-                        except Exception:
-                            pass
-
-                    if matches[match_index]:
-                        person = studentIds[match_index]
-                        known_people_in_frame.add(person)
-                        # Compute area (in small-frame coords) to pick the frontmost person
-                        y1f, x2f, y2f, x1f = faceLoc
-                        area = max(0, (y2f - y1f)) * max(0, (x2f - x1f))
-                        matched_people_info.append((person, faceLoc, area))
-                        # Keep the first matched face for display
-                        if first_match is None:
-                            first_match = (person, faceLoc)
-                    else:
-                        # Keep unknown face for display if nobody known yet
-                        if first_match is None:
-                            first_match = ("Unknown", faceLoc)
-
-                    # Debug: print face_distance values when requested
-                    import os as _os
-                    if _os.environ.get('OMNIS_DEBUG') == '1':
-                        # Show numeric distances (smaller is better) and chosen index
-                        try:
-                            distances_str = ','.join([f"{d:.3f}" for d in face_distance])
-                        except Exception:
-                            distances_str = str(face_distance)
-                        print(f"[DEBUG] face_distances=[{distances_str}] chosen_index={match_index} chosen_match={matches[match_index]}")
-
-                if first_match:
-                    detected_person, detected_location = first_match
-                # Determine primary (frontmost) known person by largest detected face area
-                primary_person = None
-                if matched_people_info:
-                    primary_person = max(matched_people_info, key=lambda t: t[2])[0]
+            # The first face is shown; every known person in the frame is greeted once
+            detected_person, detected_location = None, None
+            shown, known_people_in_frame, primary_person = frame_people(faces)
+            if shown:
+                detected_person, detected_location = shown
 
             # Handle face display and greeting
             if detected_person:
-                current_time = time.time()
-                
                 # Draw face box
-                y1, x2, y2, x1 = detected_location
-                y1, x2, y2, x1 = y1*4, x2*4, y2*4, x1*4
+                y1, x2, y2, x1 = scale_box(detected_location, 1.0 / pipeline.scale)
                 
                 if detected_person != "Unknown":
                     # KNOWN PERSON: Green box
@@ -159,52 +110,7 @@ try:
                         conversation_active = True
                     else:
                         conversation_active = False
-                        # Greet newly-arrived people immediately; for those already present, respect cooldown
-                        new_people = known_people_in_frame - prev_known_people
-                        # Greet newcomers first (always queue the greeting so it plays even if TTS is busy)
-                        for person in new_people:
-                            # Debug: why we will greet this person
-                            if os.environ.get('OMNIS_DEBUG') == '1':
-                                print(f"[DEBUG] greeting new person: {person}")
-                            payload = f"Hello {person}! Welcome to MGM Model School robot."
-                            speak(payload)
-                            last_seen[person] = current_time
-
-                        # For people who were already present, greet only if cooldown expired
-                        existing_people = known_people_in_frame & prev_known_people
-                        for person in existing_people:
-                            last = last_seen.get(person, 0)
-                            if (current_time - last) > GREETING_COOLDOWN:
-                                if os.environ.get('OMNIS_DEBUG') == '1':
-                                    print(f"[DEBUG] greeting existing person after cooldown: {person} last_seen={last} now={current_time}")
-                                payload = f"Hello {person}! Welcome to MGM Model School robot."
-                                speak(payload)
-                                last_seen[person] = current_time
-
-                        # Optional debug logging controlled by OMNIS_DEBUG environment variable
-                        import os
-                        if os.environ.get('OMNIS_DEBUG') == '1':
-                            print(f"[DEBUG] known_people_in_frame={known_people_in_frame}")
-                            print(f"[DEBUG] prev_known_people={prev_known_people}")
-                            print(f"[DEBUG] new_people={new_people}")
-                            print(f"[DEBUG] last_seen_snapshot={dict(last_seen)}")
-
-                        # Greet primary person (frontmost) if they changed since last frame
-                        if 'primary_person' in locals() and primary_person:
-                            if os.environ.get('OMNIS_DEBUG') == '1':
-                                print(f"[DEBUG] primary_person={primary_person} last_primary={last_primary_person}")
-                            if primary_person != last_primary_person:
-                                if os.environ.get('OMNIS_DEBUG') == '1':
-                                    print(f"[DEBUG] greeting primary person: {primary_person}")
-                                payload = f"Hello {primary_person}! Welcome to MGM Model School robot."
-                                speak(payload)
-                                last_seen[primary_person] = current_time
-                                last_primary_person = primary_person
-                        else:
-                            last_primary_person = None
-
-                        # Update prev_known_people for next frame
-                        prev_known_people = set(known_people_in_frame)
+                        pipeline.greet(greeter, speak, detected_person, known_people_in_frame, primary_person)
 
                         # Start voice recognition thread only if mic is available and not running
                         if not (speech_thread and speech_thread.is_alive()):
@@ -234,25 +140,13 @@ try:
                                cv2.FONT_HERSHEY_COMPLEX, 1, (50, 50, 50), 1)
                     
                     # Display student image
-                    img_path = f'images/faces/{detected_person}.jpg'
-                    if os.path.exists(img_path):
-                        img_student = cv2.imread(img_path)
-                        if img_student is not None:
-                            img_student = cv2.resize(img_student, (216, 216))
-                            imgBackground[175:175 + 216, 909:909 + 216] = img_student
+                    img_student = assets.photo(detected_person)
+                    if img_student is not None:
+                        imgBackground[175:175 + 216, 909:909 + 216] = img_student
                 else:
                     # UNKNOWN PERSON: Red box
-                    current_time = time.time()
                     # Fallback greeting for an unrecognized primary person (friendly prompt)
-                    unknown_key = "UNKNOWN_FACE"
-                    last_unknown = last_seen.get(unknown_key, 0)
-                    if (current_time - last_unknown) > GREETING_COOLDOWN:
-                        # Greet unknown/frontmost person once per cooldown window
-                        payload = "Hello there!"
-                        speak(payload)
-                        last_seen[unknown_key] = current_time
-                        last_primary_person = unknown_key
-                        last_primary_person = unknown_key
+                    pipeline.greet(greeter, speak, detected_person, known_people_in_frame)
 
                     cv2.rectangle(imgBackground, (55+x1, 162+y1), (55+x2, 162+y2), (0, 0, 255), 2, cv2.LINE_AA)
                     cv2.putText(imgBackground, "Unknown", (55+x1, max(162+y1-10, 180)), 
@@ -261,6 +155,7 @@ try:
             else:
                 # NO FACE DETECTED
                 mode_type = 0
+            timer.lap('greeting')
 
             # Display window
             cv2.imshow("Face Attendance", imgBackground)
@@ -268,6 +163,10 @@ try:
             # Exit on 'q'
             if cv2.waitKey(1) == ord('q'):
                 break
+            timer.lap('display')
+
+            pipeline.end_frame((time.perf_counter() - frame_start) * 1000.0)
+            timer.end_frame()
         except KeyboardInterrupt:
             print('\n[Main] Interrupted by user, shutting down gracefully...')
             break
@@ -277,8 +176,15 @@ try:
             time.sleep(0.5)
             continue
 finally:
+    if timer.enabled and timer.frames:
+        timer.report()
+    for component, summary in pipeline.summaries():
+        print(f"[Main] {component}: {summary}")
+    print(f"[Main] Gallery: {gallery_manager.summary()}")
+    pipeline.close()
     try:
         cap.release()
+        print(f"[Main] Capture stats: {cap.summary()}")
     except Exception:
         pass
     try:
@@ -0,0 +1,72 @@
+"""
+Cheap motion/change gate for the recognition loop.
+
+Most of the day the kiosk camera looks at an empty corridor. `MotionGate`
+compares a tiny grayscale thumbnail of each frame with a slowly updated
+background. Face detection only needs to run when enough of the thumbnail
+changed, when faces were present on the previous frame, or for a few
+frames after the last motion.
+"""
+import os
+
+import cv2
+import numpy as np
+
+# Per-pixel intensity change (0-255) that counts as "changed"
+MOTION_PIXEL_THRESHOLD = int(os.environ.get('FACE_MOTION_PIXEL_THRESHOLD', '18'))
+# Fraction of thumbnail pixels that must change to count as motion
+MOTION_AREA = float(os.environ.get('FACE_MOTION_AREA', '0.01'))
+# Keep detecting this many frames after motion stops (people pause in front of the kiosk)
+MOTION_HOLD_FRAMES = int(os.environ.get('FACE_MOTION_HOLD', '15'))
+# Background adaptation rate; higher forgets still scenes (and lighting drift) faster
+MOTION_LEARNING_RATE = float(os.environ.get('FACE_MOTION_LEARNING_RATE', '0.05'))
+THUMBNAIL_SIZE = (64, 48)
+
+
+class MotionGate:
+    def __init__(self, pixel_threshold: int = MOTION_PIXEL_THRESHOLD, area: float = MOTION_AREA,
+                 hold_frames: int = MOTION_HOLD_FRAMES, learning_rate: float = MOTION_LEARNING_RATE):
+        self.pixel_threshold = pixel_threshold
+        self.area = area
+        self.hold_frames = hold_frames
+        self.learning_rate = learning_rate
+        self._background = None
+        self._hold = 0
+        self.last_change = 0.0
+        self.stats = {'frames': 0, 'gated': 0, 'motion': 0}
+
+    def changed(self, frame) -> bool:
+        """True if `frame` (BGR, any size) differs enough from the background."""
+        thumb = cv2.resize(frame, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+        if thumb.ndim == 3:
+            thumb = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY)
+        thumb = cv2.GaussianBlur(thumb, (5, 5), 0).astype(np.float32)
+        if self._background is None:
+            self._background = thumb
+            self.last_change = 1.0
+            return True
+        diff = cv2.absdiff(thumb, self._background)
+        self.last_change = float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+        cv2.accumulateWeighted(thumb, self._background, self.learning_rate)
+        return self.last_change >= self.area
+
+    def should_detect(self, frame, faces_present: bool = False) -> bool:
+        """Decide whether this frame needs face detection."""
+        self.stats['frames'] += 1
+        if self.changed(frame):
+            self.stats['motion'] += 1
+            self._hold = self.hold_frames
+        elif self._hold > 0:
+            self._hold -= 1
+        elif not faces_present:
+            self.stats['gated'] += 1
+            return False
+        return True
+
+    @property
+    def gated_fraction(self) -> float:
+        return self.stats['gated'] / self.stats['frames'] if self.stats['frames'] else 0.0
+
+    def summary(self) -> str:
+        s = self.stats
+        return f"frames={s['frames']} motion={s['motion']} gated={s['gated']} gated_fraction={self.gated_fraction:.2%}"
@@ -0,0 +1,134 @@
+"""
+Per-stage timing for the vision loop.
+
+Enable with OMNIS_TIMING=1. The loop calls `timer.begin_frame()` at the top
+and `timer.lap('<stage>')` after each stage. Each lap records the time since
+the previous lap into a rolling window per stage. Every OMNIS_TIMING_INTERVAL
+seconds a summary line with p50/p95/p99 per stage is printed. If
+OMNIS_TIMING_JSONL is set, the same summary is appended to that file as one
+JSON object per line.
+
+When disabled, `begin_frame`/`lap`/`end_frame` are no-ops, so the cost is a
+method call. When enabled, a lap is one perf_counter() call and a list store.
+Percentiles are only computed when a summary is due.
+"""
+import os
+import json
+import time
+from typing import Callable, Dict, List, Optional
+
+TIMING_ENABLED = os.environ.get('OMNIS_TIMING') == '1'
+TIMING_JSONL = os.environ.get('OMNIS_TIMING_JSONL')
+TIMING_INTERVAL = float(os.environ.get('OMNIS_TIMING_INTERVAL', '10'))
+# Samples kept per stage for the rolling percentiles
+TIMING_WINDOW = int(os.environ.get('OMNIS_TIMING_WINDOW', '1024'))
+
+
+def _percentile(sorted_samples: List[float], q: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    i = min(len(sorted_samples) - 1, int(round(q * (len(sorted_samples) - 1))))
+    return sorted_samples[i]
+
+
+class RollingWindow:
+    """Fixed-size ring of the most recent samples (milliseconds)."""
+
+    __slots__ = ('samples', 'size', 'index', 'count')
+
+    def __init__(self, size: int):
+        self.samples = [0.0] * size
+        self.size = size
+        self.index = 0
+        self.count = 0
+
+    def add(self, value: float):
+        self.samples[self.index] = value
+        self.index = (self.index + 1) % self.size
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        data = sorted(self.samples[:min(self.count, self.size)])
+        return {
+            'count': self.count,
+            'mean': sum(data) / len(data) if data else 0.0,
+            'p50': _percentile(data, 0.50),
+            'p95': _percentile(data, 0.95),
+            'p99': _percentile(data, 0.99),
+        }
+
+
+class PipelineTimer:
+    def __init__(self, enabled: bool = TIMING_ENABLED, jsonl_path: Optional[str] = TIMING_JSONL,
+                 interval: float = TIMING_INTERVAL, window: int = TIMING_WINDOW, name: str = 'Timing'):
+        self.enabled = enabled
+        self.jsonl_path = jsonl_path
+        self.interval = interval
+        self.window = window
+        self.name = name
+        self.stages: Dict[str, RollingWindow] = {}
+        self.frames = 0
+        self._extra: List[Callable[[], dict]] = []
+        self._last = 0.0
+        self._frame_start = 0.0
+        self._last_report = time.perf_counter()
+        if not enabled:
+            # Bind the hot-path methods to no-ops so a disabled timer costs one call
+            self.begin_frame = self._noop
+            self.lap = self._noop
+            self.end_frame = self._noop
+
+    @staticmethod
+    def _noop(*args, **kwargs):
+        pass
+
+    def add_metrics(self, fn: Callable[[], dict]):
+        """Attach extra metrics (e.g. governor state) to every summary."""
+        self._extra.append(fn)
+
+    def begin_frame(self):
+        self._frame_start = self._last = time.perf_counter()
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        window = self.stages.get(stage)
+        if window is None:
+            window = self.stages[stage] = RollingWindow(self.window)
+        window.add((now - self._last) * 1000.0)
+        self._last = now
+
+    def end_frame(self):
+        now = time.perf_counter()
+        window = self.stages.get('frame')
+        if window is None:
+            window = self.stages['frame'] = RollingWindow(self.window)
+        window.add((now - self._frame_start) * 1000.0)
+        self.frames += 1
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            self.report()
+
+    def snapshot(self) -> dict:
+        record = {
+            'time': time.time(),
+            'frames': self.frames,
+            'stages': {name: w.snapshot() for name, w in self.stages.items()},
+        }
+        for fn in self._extra:
+            try:
+                record.update(fn())
+            except Exception as e:
+                record.setdefault('errors', []).append(str(e))
+        return record
+
+    def report(self):
+        record = self.snapshot()
+        parts = [f"{name}={s['p50']:.1f}/{s['p95']:.1f}/{s['p99']:.1f}"
+                 for name, s in record['stages'].items()]
+        print(f"[{self.name}] frames={self.frames} p50/p95/p99 ms: " + ' '.join(parts))
+        if self.jsonl_path:
+            try:
+                with open(self.jsonl_path, 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+            except OSError as e:
+                print(f"[{self.name}] Could not write {self.jsonl_path}: {e}")
@@ -1,9 +1,9 @@
 import os
-import pickle
 import cv2
 import numpy as np
 
-ENCODE_FILE = 'encoded_file.p'
+from gallery_file import journal_append, compact_in_background, JOURNAL_COMPACT_RECORDS, GALLERY_DB
+
 FACES_DIR = 'images/faces'
 
 def _safe_name(name: str) -> str:
@@ -16,7 +16,10 @@ def _safe_name(name: str) -> str:
 def register_name(name: str, encoding, face_image=None):
     """Register `name` for the provided face encoding and optional image.
 
-    - Appends the encoding and name to `encoded_file.p`.
+    - Appends the encoding and name to the gallery's registration journal
+      (see gallery_file.py); the journal is compacted in the background.
+      With FACE_GALLERY_DB the encoding becomes one more template of that
+      person in the SQLite gallery instead (see gallery_db.py).
     - Saves `face_image` to `images/faces/<NAME>.jpg` if provided.
     Returns True on success.
     """
@@ -35,26 +38,27 @@ def register_name(name: str, encoding, face_image=None):
         except Exception as e:
             print(f"[register_face] Failed to write face image: {e}")
 
-    # Load existing encodings (if any), append and write back atomically
-    try:
-        if os.path.exists(ENCODE_FILE):
-            with open(ENCODE_FILE, 'rb') as f:
-                data = pickle.load(f)
-            encode_list_known, studentIds = data
+    if GALLERY_DB:
+        from gallery_db import GalleryDB
+        try:
+            with GalleryDB(GALLERY_DB) as db:
+                _, templates = db.add_template(person, encoding, source='registration')
+        except Exception as e:
+            print(f"[register_face] Error saving encoding: {e}")
+            return False
+        if templates > 1:
+            print(f"[register_face] {person} already registered; added template {templates}")
         else:
-            encode_list_known, studentIds = [], []
-
-        # Append
-        encode_list_known.append(encoding)
-        studentIds.append(person)
-
-        # Write to temp file and replace
-        tmp = ENCODE_FILE + '.tmp'
-        with open(tmp, 'wb') as f:
-            pickle.dump((encode_list_known, studentIds), f)
-        os.replace(tmp, ENCODE_FILE)
-        print(f"[register_face] Registered {person} (encodings={len(studentIds)})")
+            print(f"[register_face] Registered {person}")
         return True
+
+    # One fsync'd fixed-size record; the gallery matrix is not rewritten here
+    try:
+        pending = journal_append(encoding, person)
+        print(f"[register_face] Registered {person} (journal records={pending})")
     except Exception as e:
         print(f"[register_face] Error saving encoding: {e}")
         return False
+    if pending >= JOURNAL_COMPACT_RECORDS:
+        compact_in_background()
+    return True
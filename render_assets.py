@@ -0,0 +1,287 @@
+"""
+Render-asset cache for the kiosk UI.
+
+The render loops used to hit the disk every frame: `update_mode` re-read every
+image in Resources/Modes for each recognised face, and the student photo was
+decoded and resized again on every frame a person stayed in view.
+`RenderAssetCache` loads the mode images once. It keeps student photos,
+already resized for display, in a bounded LRU keyed by person id. A photo is
+reloaded only when its file's mtime changes. The mtime is re-checked at most
+every `recheck_interval` seconds, so the steady-state loop does no disk I/O.
+
+At school scale even a cache miss is costly: it means a JPEG decode and a
+resize. Enrolment (EncodeGenerator.py) therefore also writes a thumbnail
+atlas: <atlas>.bgr holds every photo as a raw 216x216 BGR slot, and
+<atlas>.json maps each person to a slot. The renderer memory-maps it, so a
+photo is a slice of the mapping that main.py copies into the background
+with no decode. Rebuilds are incremental: only new or changed photos are
+decoded and written into their slot in place, and the index is replaced
+atomically afterwards. People missing from the atlas (for example just
+registered), or whose photo changed since the atlas was built, still go
+through the JPEG cache. The atlas is only used by a cache that resizes
+photos to the atlas size and reads the directory the atlas was built from.
+
+    python render_assets.py             # update the atlas
+    python render_assets.py --full      # rebuild it from scratch
+"""
+import os
+import json
+import time
+import argparse
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+MODES_DIR = 'Resources/Modes'
+PHOTO_SIZE = (216, 216)
+# Maximum number of resized student photos kept in memory
+PHOTO_CACHE_SIZE = int(os.environ.get('FACE_PHOTO_CACHE', '64'))
+# Thumbnail atlas written by enrolment; an empty value disables it
+ATLAS_PATH = os.environ.get('FACE_PHOTO_ATLAS', 'images/faces.atlas')
+ATLAS_FORMAT = 'omnis-atlas'
+PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def _atlas_paths(path: str):
+    return path + '.bgr', path + '.json'
+
+
+def read_atlas_index(path: str = ATLAS_PATH):
+    try:
+        with open(_atlas_paths(path)[1]) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return index if index.get('format') == ATLAS_FORMAT else None
+
+
+def build_atlas(photo_dir: str = 'images/faces', path: str = ATLAS_PATH, photo_size=PHOTO_SIZE,
+                full: bool = False) -> dict:
+    """Bring the atlas up to date with `photo_dir`; returns counts of what changed."""
+    width, height = photo_size
+    slot_bytes = width * height * 3
+    raw_path, json_path = _atlas_paths(path)
+    index = None if full else read_atlas_index(path)
+    source = os.path.abspath(photo_dir)
+    if index is not None and ((index['width'], index['height']) != (width, height)
+                              or index.get('photo_dir') != source):
+        index = None
+    if index is None or not os.path.exists(raw_path):
+        index = {'format': ATLAS_FORMAT, 'width': width, 'height': height, 'photo_dir': source, 'slots': 0,
+                 'generation': 0, 'entries': {}}
+    entries = index['entries']
+
+    photos = {}
+    for name in sorted(os.listdir(photo_dir)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() in PHOTO_EXTENSIONS and stem not in photos:
+            st = os.stat(os.path.join(photo_dir, name))
+            photos[stem] = (name, st.st_mtime, st.st_size)
+    removed = [person for person in entries if person not in photos]
+    for person in removed:
+        del entries[person]
+    # Slots of deleted photos are reused before the file grows
+    free = sorted(set(range(index['slots'])) - {e['slot'] for e in entries.values()})
+    counts = {'photos': len(photos), 'written': 0, 'unchanged': 0, 'removed': len(removed), 'unreadable': 0}
+
+    os.makedirs(os.path.dirname(raw_path) or '.', exist_ok=True)
+    # A running kiosk may have the slots memory-mapped: a file it maps is only ever grown in place,
+    # and a rebuild goes to a new file that replaces it, never truncating the mapped one (SIGBUS)
+    rebuild = not index['slots']
+    target = raw_path + '.tmp' if rebuild else raw_path
+    with open(target, 'w+b' if rebuild else 'r+b') as f:
+        for person, (name, mtime, size) in photos.items():
+            entry = entries.get(person)
+            if entry is not None and entry['mtime'] == mtime and entry['size'] == size:
+                counts['unchanged'] += 1
+                continue
+            image = cv2.imread(os.path.join(photo_dir, name))
+            if image is None:
+                counts['unreadable'] += 1
+                if entry is not None:
+                    free.append(entries.pop(person)['slot'])
+                continue
+            thumb = np.ascontiguousarray(cv2.resize(image, (width, height)), dtype=np.uint8)
+            if entry is not None:
+                slot = entry['slot']
+            elif free:
+                slot = free.pop(0)
+            else:
+                slot = index['slots']
+                index['slots'] += 1
+            f.seek(slot * slot_bytes)
+            f.write(thumb.tobytes())
+            entries[person] = {'slot': slot, 'file': name, 'mtime': mtime, 'size': size}
+            counts['written'] += 1
+        f.flush()
+        os.fsync(f.fileno())
+    if rebuild:
+        os.replace(target, raw_path)
+
+    # Slots first, index last: until the new index is in place readers see the old mapping
+    index['generation'] += 1
+    index['saved'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    tmp = json_path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp, json_path)
+    print(f"[Atlas] {path}: {counts['written']} written, {counts['unchanged']} unchanged, "
+          f"{counts['removed']} removed, {counts['unreadable']} unreadable ({index['slots']} slots)")
+    return counts
+
+
+class ThumbnailAtlas:
+    """Read side of the atlas: person -> memory-mapped BGR slot."""
+
+    def __init__(self, path: str = ATLAS_PATH):
+        self.path = path
+        self.index = read_atlas_index(path)
+        self.images = None
+        if self.index is not None and self.index['slots']:
+            shape = (self.index['slots'], self.index['height'], self.index['width'], 3)
+            try:
+                self.images = np.memmap(_atlas_paths(path)[0], dtype=np.uint8, mode='r', shape=shape)
+            except (OSError, ValueError):
+                # Caught between a rebuild's new slots file and its index; the next check retries
+                self.index = None
+
+    def __len__(self) -> int:
+        return len(self.index['entries']) if self.index is not None else 0
+
+    def entry(self, person: str):
+        return self.index['entries'].get(person) if self.images is not None else None
+
+    def get(self, person: str):
+        entry = self.entry(person)
+        return self.images[entry['slot']] if entry is not None else None
+
+
+class RenderAssetCache:
+    def __init__(self, photo_dir: str = 'images/faces', photo_size=PHOTO_SIZE, modes_dir: str = MODES_DIR,
+                 max_photos: int = PHOTO_CACHE_SIZE, recheck_interval: float = 2.0, atlas_path: str = ATLAS_PATH):
+        self.photo_dir = photo_dir
+        self.photo_size = photo_size
+        self.modes_dir = modes_dir
+        self.max_photos = max_photos
+        self.recheck_interval = recheck_interval
+        self._modes = None
+        self._photos = OrderedDict()  # person -> (image or None, mtime, last_checked)
+        # The atlas holds resized thumbnails; a cache that shows photos at their own size cannot use it
+        self.atlas_path = atlas_path if photo_size is not None else ''
+        self._atlas = None
+        self._atlas_mtime = None
+        self._atlas_checked = 0.0
+        self._atlas_fresh = {}  # person -> (photo matches the atlas, last_checked)
+        self.stats = {'hits': 0, 'misses': 0, 'reloads': 0, 'evictions': 0, 'atlas_hits': 0}
+
+    @property
+    def modes(self) -> list:
+        """Mode images (Resources/Modes, sorted by file name), loaded on first use."""
+        if self._modes is None:
+            self._modes = [cv2.imread(os.path.join(self.modes_dir, path))
+                           for path in sorted(os.listdir(self.modes_dir))]
+        return self._modes
+
+    def mode(self, mode_type: int):
+        return self.modes[mode_type]
+
+    def photo_path(self, person: str) -> str:
+        return os.path.join(self.photo_dir, f'{person}.jpg')
+
+    def photo(self, person: str):
+        """Display-sized photo for `person`, or None if there is no readable photo."""
+        now = time.time()
+        thumb = self._atlas_photo(person, now)
+        if thumb is not None:
+            self.stats['atlas_hits'] += 1
+            return thumb
+        entry = self._photos.get(person)
+        if entry is not None:
+            image, mtime, checked = entry
+            if now - checked < self.recheck_interval:
+                self._photos.move_to_end(person)
+                self.stats['hits'] += 1
+                return image
+            if self._mtime(person) == mtime:
+                self._photos[person] = (image, mtime, now)
+                self._photos.move_to_end(person)
+                self.stats['hits'] += 1
+                return image
+            self.stats['reloads'] += 1
+        else:
+            self.stats['misses'] += 1
+        return self._load(person, now)
+
+    def _atlas_photo(self, person: str, now: float):
+        if not self.atlas_path:
+            return None
+        if now - self._atlas_checked >= self.recheck_interval:
+            self._atlas_checked = now
+            try:
+                mtime = os.stat(_atlas_paths(self.atlas_path)[1]).st_mtime
+            except OSError:
+                mtime = None
+            if mtime != self._atlas_mtime:
+                self._atlas_mtime = mtime
+                atlas = ThumbnailAtlas(self.atlas_path) if mtime is not None else None
+                if atlas is not None and (atlas.index is None or
+                                          (atlas.index['width'], atlas.index['height']) != tuple(self.photo_size)
+                                          or atlas.index.get('photo_dir') != os.path.abspath(self.photo_dir)):
+                    atlas = None
+                self._atlas = atlas
+                self._atlas_fresh.clear()
+        if self._atlas is None:
+            return None
+        entry = self._atlas.entry(person)
+        if entry is None:
+            return None
+        # A photo replaced after the atlas was built (e.g. a re-registration) goes through the JPEG cache
+        fresh, checked = self._atlas_fresh.get(person, (False, None))
+        if checked is None or now - checked >= self.recheck_interval:
+            try:
+                fresh = os.stat(os.path.join(self.photo_dir, entry['file'])).st_mtime == entry['mtime']
+            except OSError:
+                fresh = False
+            self._atlas_fresh[person] = (fresh, now)
+        return self._atlas.get(person) if fresh else None
+
+    def invalidate(self, person: str = None):
+        if person is None:
+            self._photos.clear()
+        else:
+            self._photos.pop(person, None)
+
+    def _mtime(self, person: str):
+        try:
+            return os.stat(self.photo_path(person)).st_mtime
+        except OSError:
+            return None
+
+    def _load(self, person: str, now: float):
+        mtime = self._mtime(person)
+        image = cv2.imread(self.photo_path(person)) if mtime is not None else None
+        if image is not None and self.photo_size is not None:
+            image = cv2.resize(image, self.photo_size)
+        # Missing photos are cached too, so an unknown file is not probed every frame
+        self._photos[person] = (image, mtime, now)
+        self._photos.move_to_end(person)
+        while len(self._photos) > self.max_photos:
+            self._photos.popitem(last=False)
+            self.stats['evictions'] += 1
+        return image
+
+    def summary(self) -> str:
+        s = self.stats
+        atlas = len(self._atlas) if self._atlas is not None else 0
+        return (f"photos={len(self._photos)} hits={s['hits']} misses={s['misses']} reloads={s['reloads']} "
+                f"evictions={s['evictions']} atlas={atlas} atlas_hits={s['atlas_hits']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--full', action='store_true', help='rebuild every slot')
+    parser.add_argument('--photos', default='images/faces')
+    parser.add_argument('--atlas', default=ATLAS_PATH or 'images/faces.atlas')
+    args = parser.parse_args()
+    build_atlas(args.photos, args.atlas, full=args.full)
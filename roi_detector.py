@@ -0,0 +1,97 @@
+"""
+Two-tier face detector: low-resolution full-frame scan plus full-resolution
+re-detection around recently seen faces.
+
+main.py detects on a 0.25x frame, so students a few metres away are missed,
+and raising the scale makes every frame expensive. `RoiDetector` keeps the
+cheap low-resolution scan for the whole frame. Around boxes seen in the last
+few frames that the scan did not find again, it runs detection on small
+padded crops at higher resolution (a short scale pyramid). Distant faces cost
+a crop instead of a full-frame upscale.
+
+Boxes are returned in full-resolution (top, right, bottom, left) coordinates,
+so encodings can be computed on the full-resolution frame as well.
+"""
+import os
+from typing import List
+
+import cv2
+import face_recognition
+
+# Scale of the full-frame scan
+ROI_BASE_SCALE = float(os.environ.get('FACE_ROI_BASE_SCALE', '0.25'))
+# Padding around a remembered box, as a fraction of its size on each side
+ROI_PADDING = float(os.environ.get('FACE_ROI_PADDING', '0.6'))
+# Crop scales tried in order until a face is found (1.0 = full resolution)
+ROI_PYRAMID = tuple(float(s) for s in os.environ.get('FACE_ROI_PYRAMID', '0.5,1.0').split(','))
+# How many frames a box is remembered after it was last seen
+ROI_MEMORY_FRAMES = int(os.environ.get('FACE_ROI_MEMORY', '10'))
+
+
+def _overlaps(a, b) -> bool:
+    return not (a[1] <= b[3] or b[1] <= a[3] or a[2] <= b[0] or b[2] <= a[0])
+
+
+class RoiDetector:
+    def __init__(self, base_scale: float = ROI_BASE_SCALE, padding: float = ROI_PADDING,
+                 pyramid=ROI_PYRAMID, memory_frames: int = ROI_MEMORY_FRAMES, model: str = 'hog',
+                 detector=None):
+        self.base_scale = base_scale
+        self.padding = padding
+        self.pyramid = tuple(pyramid)
+        self.memory_frames = memory_frames
+        self.model = model
+        # Detector for the full-frame scan (see face_detector.py); crops always use HOG
+        self.detector = detector if detector is not None else (
+            lambda image: face_recognition.face_locations(image, model=self.model))
+        self._recent = []  # [(box, frames_since_seen)]
+        self.stats = {'frames': 0, 'base_faces': 0, 'roi_scans': 0, 'roi_faces': 0}
+
+    def detect(self, frame_rgb) -> List[tuple]:
+        """Detect faces in a full-resolution RGB frame; returns full-resolution boxes."""
+        self.stats['frames'] += 1
+        h, w = frame_rgb.shape[:2]
+        small = cv2.resize(frame_rgb, (0, 0), None, self.base_scale, self.base_scale)
+        inv = 1.0 / self.base_scale
+        boxes = [tuple(int(round(v * inv)) for v in loc)
+                 for loc in self.detector(small)]
+        self.stats['base_faces'] += len(boxes)
+
+        for prev, _ in self._recent:
+            if any(_overlaps(prev, b) for b in boxes):
+                continue
+            found = self._detect_roi(frame_rgb, prev, h, w)
+            if found is not None:
+                boxes.append(found)
+
+        # Remember what we saw; age out boxes not seen recently
+        recent = [(b, 0) for b in boxes]
+        for prev, age in self._recent:
+            if age + 1 < self.memory_frames and not any(_overlaps(prev, b) for b in boxes):
+                recent.append((prev, age + 1))
+        self._recent = recent
+        return boxes
+
+    def _detect_roi(self, frame_rgb, box, h, w):
+        top, right, bottom, left = box
+        pad_y = int((bottom - top) * self.padding)
+        pad_x = int((right - left) * self.padding)
+        y0, y1 = max(0, top - pad_y), min(h, bottom + pad_y)
+        x0, x1 = max(0, left - pad_x), min(w, right + pad_x)
+        if y1 - y0 < 8 or x1 - x0 < 8:
+            return None
+        crop = frame_rgb[y0:y1, x0:x1]
+        for scale in self.pyramid:
+            self.stats['roi_scans'] += 1
+            scaled = crop if scale == 1.0 else cv2.resize(crop, (0, 0), None, scale, scale)
+            locs = face_recognition.face_locations(scaled, model=self.model)
+            if locs:
+                # Keep the largest face in the crop
+                t, r, b, l = max(locs, key=lambda f: (f[2] - f[0]) * (f[1] - f[3]))
+                self.stats['roi_faces'] += 1
+                return (y0 + int(t / scale), x0 + int(r / scale), y0 + int(b / scale), x0 + int(l / scale))
+        return None
+
+    def summary(self) -> str:
+        s = self.stats
+        return f"frames={s['frames']} base_faces={s['base_faces']} roi_scans={s['roi_scans']} roi_faces={s['roi_faces']}"
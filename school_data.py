@@ -42,6 +42,35 @@ SCHOOL_RULES = {
     },
 }
 
+# Daily timetable (24h clock, matches the attendance rules above)
+# Kiosks use it to decide which part of the face gallery to search first
+TIMETABLE = [
+    {"period": "arrival", "start": "07:30", "end": "08:15"},
+    {"period": "assembly", "start": "08:15", "end": "08:30"},
+    {"period": "late_arrival", "start": "08:30", "end": "09:30"},
+    {"period": "classes", "start": "09:30", "end": "15:30"},
+    {"period": "dismissal", "start": "15:30", "end": "16:30"},
+]
+
+# Kiosk locations (FACE_KIOSK) -> gallery partitions searched first, per timetable period
+# Partitions are "class:<class>", "block:<block>" or "role:<role>" (set with gallery_db.py set-person)
+# "default" applies outside the listed periods; the full gallery is always the fallback
+KIOSKS = {
+    "main_entrance": {
+        "default": ["role:staff", "role:visitor"],
+        "late_arrival": ["role:student"],
+    },
+    "block_a": {
+        "default": ["block:A", "role:staff"],
+    },
+    "block_b": {
+        "default": ["block:B", "role:staff"],
+    },
+    "library": {
+        "default": ["role:staff", "role:librarian"],
+    },
+}
+
 # Custom Q&A for Specific Rules - Easy to Ask!
 CUSTOM_QA = {
     # ATTENDANCE & TIME RULES
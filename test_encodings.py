@@ -1,6 +1,5 @@
-import pickle
+from gallery_file import load_gallery
 print("Testing encoding file...")
-with open('images/encoded_file.p', 'rb') as f:
-    encode_list_known_with_ids = pickle.load(f)
-encode_list_known, studentIds = encode_list_known_with_ids
+gallery = load_gallery()
+encode_list_known, studentIds = gallery.encodings, gallery.names
 print(f"Loaded {len(studentIds)} people: {studentIds}")
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from face_matcher import FaceMatcher
+
+
+def _gallery():
+    rng = np.random.default_rng(0)
+    centres = rng.normal(0.0, 1.0, (2, 128)).astype(np.float32)
+    # ANN has two templates and BOB three, so with centroids BOB is person 1 but row 1 is ANN's
+    rows = [centres[0], centres[0] + 0.01, centres[1], centres[1] + 0.01, centres[1] - 0.01]
+    return np.vstack(rows), ['ANN', 'ANN', 'BOB', 'BOB', 'BOB'], centres
+
+
+@pytest.mark.parametrize('aggregate', ['min', 'centroid'])
+def test_identify_with_duplicate_names(aggregate):
+    encodings, names, centres = _gallery()
+    matcher = FaceMatcher(encodings, names, tolerance=0.5, index='brute', aggregate=aggregate)
+    far = np.full(128, 10.0, dtype=np.float32)
+    results = matcher.identify(np.vstack([centres[1], centres[0], far]))
+    assert [name for name, _ in results] == ['BOB', 'ANN', None]
+
+
+def test_centroid_match_indexes_people():
+    encodings, names, centres = _gallery()
+    matcher = FaceMatcher(encodings, names, tolerance=0.5, index='brute', aggregate='centroid')
+    best, _, matched = matcher.match(centres[1:2])
+    assert matched[0]
+    # One row per person: the index names a person, not a row of the original gallery
+    assert matcher.name_of(int(best[0])) == 'BOB'
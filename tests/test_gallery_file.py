@@ -0,0 +1,97 @@
+import os
+
+import numpy as np
+import pytest
+
+import gallery_file
+from gallery_file import save_gallery, load_file_gallery, gallery_files
+
+
+def _rows(n, seed=0):
+    return np.random.default_rng(seed).random((n, 128)).astype(np.float32)
+
+
+def test_save_keeps_current_and_previous_generation(tmp_path):
+    path = str(tmp_path / 'g')
+    for n in (3, 4, 5):
+        save_gallery(_rows(n), [f'P{i}' for i in range(n)], path)
+    assert sorted(os.path.basename(p) for p in gallery_files(path)) == ['g.g1.npy', 'g.g2.npy', 'g.json']
+    gallery = load_file_gallery(path)
+    assert len(gallery) == 5 and gallery.generation == 2
+
+
+def test_crash_before_the_index_is_replaced_keeps_the_old_gallery(tmp_path, monkeypatch):
+    path = str(tmp_path / 'g')
+    save_gallery(_rows(5), [f'P{i}' for i in range(5)], path)
+    real_replace = os.replace
+
+    def crash_on_index(src, dst):
+        if dst.endswith('.json'):
+            raise OSError('power lost')
+        real_replace(src, dst)
+
+    monkeypatch.setattr(gallery_file.os, 'replace', crash_on_index)
+    with pytest.raises(OSError):
+        save_gallery(_rows(6), [f'P{i}' for i in range(6)], path)
+    monkeypatch.setattr(gallery_file.os, 'replace', real_replace)
+    gallery = load_file_gallery(path, verify=True)
+    assert len(gallery) == 5 and gallery.generation == 0
+
+
+def test_index_without_matrix_name_reads_the_old_layout(tmp_path):
+    path = str(tmp_path / 'g')
+    save_gallery(_rows(2), ['A', 'B'], path)
+    # A gallery saved before generations: <path>.npy and an index that does not name it
+    index = gallery_file.read_index(path)
+    os.replace(os.path.join(str(tmp_path), index.pop('matrix')), path + '.npy')
+    with open(path + '.json', 'w') as f:
+        gallery_file.json.dump(index, f)
+    assert load_file_gallery(path).names == ['A', 'B']
+    save_gallery(_rows(3), ['A', 'B', 'C'], path)
+    assert len(load_file_gallery(path)) == 3
+
+
+def _journal_gallery(path, registrations=3):
+    save_gallery(_rows(2), ['A', 'B'], path)
+    for i, row in enumerate(_rows(registrations, seed=1)):
+        gallery_file.journal_append(row, f'R{i}', path)
+
+
+def test_crash_between_save_and_truncate_loses_and_repeats_nothing(tmp_path, monkeypatch):
+    path = str(tmp_path / 'g')
+    _journal_gallery(path)
+    real_save = gallery_file.save_gallery
+
+    def save_then_crash(*args, **kwargs):
+        real_save(*args, **kwargs)
+        raise OSError('power lost')
+
+    monkeypatch.setattr(gallery_file, 'save_gallery', save_then_crash)
+    with pytest.raises(OSError):
+        gallery_file.compact_journal(path)
+    monkeypatch.setattr(gallery_file, 'save_gallery', real_save)
+    # The journal still holds the records; the marker keeps them from being applied twice
+    assert len(gallery_file.read_journal(path)[1]) == 3
+    expected = ['A', 'B', 'R0', 'R1', 'R2']
+    assert load_file_gallery(path).names == expected
+    # Nothing left to merge: the next compaction only empties the journal
+    assert gallery_file.compact_journal(path) is None
+    assert gallery_file.read_journal(path)[1] == []
+    assert load_file_gallery(path).names == expected
+
+
+def test_failed_save_leaves_the_journal(tmp_path, monkeypatch):
+    path = str(tmp_path / 'g')
+    _journal_gallery(path)
+
+    def crash(*args, **kwargs):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(gallery_file, 'save_gallery', crash)
+    with pytest.raises(OSError):
+        gallery_file.compact_journal(path)
+    monkeypatch.undo()
+    assert len(gallery_file.read_journal(path)[1]) == 3
+    compacted = gallery_file.compact_journal(path)
+    assert compacted.names == ['A', 'B', 'R0', 'R1', 'R2']
+    assert gallery_file.read_journal(path)[1] == []
@@ -0,0 +1,16 @@
+import numpy as np
+
+from gallery_index import ClusterIndex, PROJECTION_DIMS
+
+
+def test_cluster_search_with_only_empty_clusters_probed_is_unmatched():
+    rng = np.random.default_rng(0)
+    near, far = np.zeros(128, dtype=np.float32), np.full(128, 5.0, dtype=np.float32)
+    gallery = (near + rng.normal(0.0, 0.01, (4, 128))).astype(np.float32)
+    # Two clusters; every row belongs to the first, the second is empty
+    state = (np.vstack([near, far]), np.arange(4), np.array([0, 4, 4]), np.zeros(128, dtype=np.float32),
+             np.eye(128, PROJECTION_DIMS, dtype=np.float32))
+    index = ClusterIndex(gallery, nprobe=1, exact=False, _state=state)
+    best, dist = index.search(np.vstack([far, near]), tolerance=0.6)
+    assert best[0] == -1 and np.isinf(dist[0])
+    assert 0 <= best[1] < 4 and dist[1] < 0.6